@@ -6,6 +6,7 @@ const morgan = require('morgan');
 require('dotenv').config();
 
 const { getStorageService } = require('../lib/storage');
+const { FRAMES_CONTENT_TYPE, decodeMeasurements } = require('../lib/frame-codec');
 
 const app = express();
 const PORT = process.env.PORT || 3000;
@@ -16,7 +17,10 @@ app.use(cors({
   origin: process.env.FRONTEND_URL || '*',
   credentials: true
 }));
-app.use(express.json());
+// Limite relevée pour les lots de mesures (corps gzip décompressé par body-parser)
+app.use(express.json({ limit: '2mb' }));
+// Format binaire compact du Raspberry Pi (voir lib/frame-codec.js)
+app.use(express.raw({ type: FRAMES_CONTENT_TYPE, limit: '2mb' }));
 
 // Logging uniquement en développement
 if (process.env.NODE_ENV !== 'production') {
@@ -42,48 +46,112 @@ function getStorage() {
 
 // ==================== MEASUREMENTS ====================
 
-// POST /api/measurements - Ajouter une mesure
+// Champs acceptés pour une mesure
+function extractMeasurement(body) {
+  const {
+    timestamp,
+    ph,
+    redox,
+    temperature,
+    salt,
+    alarm,
+    warning,
+    alarm_redox,
+    regulator_type,
+    pump_plus_active,
+    pump_minus_active,
+    pump_chlore_active,
+    filter_relay_active,
+    chlorine_amp,
+    pump_plus_enabled,
+    pump_minus_enabled,
+    pump_chlore_enabled,
+    pumps_forced,
+    temperature_sensor,
+    salt_sensor,
+    flow_switch,
+    regulator_id,
+    summary,
+    device_alerts,
+    idempotency_key
+  } = body;
+
+  return {
+    timestamp,
+    ph,
+    redox,
+    temperature,
+    salt,
+    alarm,
+    warning,
+    alarm_redox,
+    regulator_type,
+    pump_plus_active,
+    pump_minus_active,
+    pump_chlore_active,
+    filter_relay_active,
+    chlorine_amp,
+    pump_plus_enabled,
+    pump_minus_enabled,
+    pump_chlore_enabled,
+    pumps_forced,
+    temperature_sensor,
+    salt_sensor,
+    flow_switch,
+    regulator_id,
+    summary,
+    device_alerts,
+    idempotency_key
+  };
+}
+
+/**
+ * Mesures d'un corps au format binaire (null si la requête est en JSON)
+ * @throws {Error} corps binaire invalide
+ */
+function binaryMeasurements(req) {
+  if (!req.is(FRAMES_CONTENT_TYPE)) {
+    return null;
+  }
+  return decodeMeasurements(req.body);
+}
+
+function badBinaryBody(res, err) {
+  return res.status(400).json({
+    success: false,
+    error: 'Format binaire invalide',
+    message: err.message
+  });
+}
+
+// POST /api/measurements - Ajouter une mesure (JSON ou format binaire d'une seule mesure)
 app.post('/api/measurements', async (req, res) => {
   try {
-    const {
-      timestamp,
-      ph,
-      redox,
-      temperature,
-      salt,
-      alarm,
-      warning,
-      alarm_redox,
-      regulator_type,
-      pump_plus_active,
-      pump_minus_active,
-      pump_chlore_active,
-      filter_relay_active
-    } = req.body;
-
-    const measurement = {
-      timestamp,
-      ph,
-      redox,
-      temperature,
-      salt,
-      alarm,
-      warning,
-      alarm_redox,
-      regulator_type,
-      pump_plus_active,
-      pump_minus_active,
-      pump_chlore_active,
-      filter_relay_active
-    };
+    let body = req.body;
+    try {
+      const decoded = binaryMeasurements(req);
+      if (decoded) {
+        if (decoded.length !== 1) throw new Error('Une seule mesure attendue (lots : /api/measurements/batch)');
+        body = decoded[0];
+      }
+    } catch (err) {
+      return badBinaryBody(res, err);
+    }
+
+    const measurement = extractMeasurement(body);
+    measurement.idempotency_key = measurement.idempotency_key || req.get('Idempotency-Key');
 
     const result = await getStorage().insertMeasurement(measurement);
 
-    console.log(`Mesure ajoutée: ${result.timestamp}`);
+    if (result.duplicate) {
+      console.log(`Mesure déjà enregistrée: ${result.idempotency_key}`);
+    } else {
+      console.log(`Mesure ajoutée: ${result.timestamp}`);
+    }
     res.status(200).json({
       success: true,
       data: result,
-      message: 'Mesure ajoutée avec succès'
+      message: result.duplicate ? 'Mesure déjà enregistrée' : 'Mesure ajoutée avec succès'
     });
 
   } catch (err) {
@@ -96,6 +164,43 @@ app.post('/api/measurements', async (req, res) => {
   }
 });
 
+// POST /api/measurements/batch - Ajouter un lot de mesures (une seule écriture Drive), JSON ou binaire
+app.post('/api/measurements/batch', async (req, res) => {
+  try {
+    let measurements;
+    try {
+      measurements = binaryMeasurements(req) || req.body.measurements;
+    } catch (err) {
+      return badBinaryBody(res, err);
+    }
+
+    if (!Array.isArray(measurements) || measurements.length === 0) {
+      return res.status(400).json({
+        success: false,
+        error: 'Données manquantes (tableau measurements requis)'
+      });
+    }
+
+    const result = await getStorage().insertMeasurements(measurements.map(extractMeasurement));
+
+    console.log(`Lot de mesures: ${result.inserted} ajoutées, ${result.duplicates} déjà enregistrées`);
+    res.status(200).json({
+      success: true,
+      inserted: result.inserted,
+      duplicates: result.duplicates,
+      message: 'Lot de mesures traité avec succès'
+    });
+
+  } catch (err) {
+    console.error('Erreur insertion lot:', err);
+    res.status(500).json({
+      success: false,
+      error: 'Erreur lors de l\'insertion du lot de mesures',
+      message: err.message
+    });
+  }
+});
+
 // GET /api/measurements - Récupérer les mesures
 app.get('/api/measurements', async (req, res) => {
   try {
@@ -154,7 +259,7 @@ app.get('/api/measurements/stats', async (req, res) => {
   try {
     const hours = req.query.hours ? parseInt(req.query.hours) : 24;
 
-    const stats = await getStorage().getStats(hours);
+    const stats = await getStorage().getStats(hours, req.query.regulator || null);
 
     res.json({
       success: true,
@@ -255,12 +360,45 @@ app.get('/api/measurements/history', async (req, res) => {
   }
 });
 
+// POST /api/daily-averages - Agrégats horaires et journaliers calculés par le Raspberry Pi
+app.post('/api/daily-averages', async (req, res) => {
+  try {
+    const { rollups } = req.body;
+
+    if (!Array.isArray(rollups) || rollups.length === 0 ||
+        rollups.some(r => !r || !r.id || !['hour', 'day'].includes(r.period) || !r.timestamp || !r.stats)) {
+      return res.status(400).json({
+        success: false,
+        error: 'Données manquantes (tableau rollups avec id, period hour|day, timestamp, stats requis)'
+      });
+    }
+
+    const result = await getStorage().insertRollups(rollups);
+
+    console.log(`Agrégats: ${result.added} ajoutés, ${result.replaced} remplacés, ${result.ignored} ignorés`);
+    res.status(201).json({
+      success: true,
+      ...result,
+      message: 'Agrégats enregistrés'
+    });
+
+  } catch (err) {
+    console.error('Erreur enregistrement agrégats:', err);
+    res.status(500).json({
+      success: false,
+      error: 'Erreur lors de l\'enregistrement des agrégats',
+      message: err.message
+    });
+  }
+});
+
 // ==================== ERROR LOGS ====================
 
 // POST /api/error-logs - Ajouter un log d'erreur
 app.post('/api/error-logs', async (req, res) => {
   try {
-    const { timestamp, error_type, error_message, context, source } = req.body;
+    const { timestamp, error_type, error_message, context, source, count, first_seen, last_seen, samples,
+      idempotency_key } = req.body;
 
     if (!timestamp || !error_type || !error_message) {
       return res.status(400).json({
@@ -274,7 +412,12 @@ app.post('/api/error-logs', async (req, res) => {
       error_type,
       error_message,
       context,
-      source
+      source,
+      count,
+      first_seen,
+      last_seen,
+      samples,
+      idempotency_key
     };
 
     const result = await getStorage().logError(error);
@@ -296,6 +439,39 @@ app.post('/api/error-logs', async (req, res) => {
   }
 });
 
+// POST /api/error-logs/batch - Ajouter un lot de logs d'erreur (agrégés par type sur le Pi)
+app.post('/api/error-logs/batch', async (req, res) => {
+  try {
+    const { errors } = req.body;
+
+    if (!Array.isArray(errors) || errors.length === 0 ||
+        errors.some(e => !e || !e.timestamp || !e.error_type || !e.error_message)) {
+      return res.status(400).json({
+        success: false,
+        error: 'Données manquantes (tableau errors avec timestamp, error_type, error_message requis)'
+      });
+    }
+
+    const result = await getStorage().logErrors(errors);
+
+    console.log(`Lot de logs d'erreur: ${result.inserted} ajoutés, ${result.duplicates} déjà enregistrés`);
+    res.status(201).json({
+      success: true,
+      inserted: result.inserted,
+      duplicates: result.duplicates,
+      message: 'Logs d\'erreur enregistrés'
+    });
+
+  } catch (err) {
+    console.error('Erreur insertion lot de logs d\'erreur:', err);
+    res.status(500).json({
+      success: false,
+      error: 'Erreur lors de l\'enregistrement des logs',
+      message: err.message
+    });
+  }
+});
+
 // GET /api/error-logs - Récupérer les logs d'erreur
 app.get('/api/error-logs', async (req, res) => {
   try {
@@ -356,6 +532,36 @@ app.get('/api/alerts', async (req, res) => {
   }
 });
 
+// POST /api/alerts - Alerte évaluée par le Raspberry Pi
+app.post('/api/alerts', async (req, res) => {
+  try {
+    const { id, severity, issues, measurement } = req.body;
+
+    if (!id || !severity || !Array.isArray(issues) || !measurement) {
+      return res.status(400).json({
+        success: false,
+        error: 'Données manquantes (id, severity, issues, measurement requis)'
+      });
+    }
+
+    const result = await getStorage().insertAlert(req.body);
+
+    res.status(201).json({
+      success: true,
+      data: result,
+      message: result.duplicate ? 'Alerte déjà enregistrée' : 'Alerte enregistrée'
+    });
+
+  } catch (err) {
+    console.error('Erreur enregistrement alerte:', err);
+    res.status(500).json({
+      success: false,
+      error: 'Erreur lors de l\'enregistrement de l\'alerte',
+      message: err.message
+    });
+  }
+});
+
 // POST /api/alerts/:id/acknowledge - Acquitter une alerte
 app.post('/api/alerts/:id/acknowledge', async (req, res) => {
   try {
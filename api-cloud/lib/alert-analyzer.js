@@ -115,6 +115,47 @@ class AlertAnalyzer {
     }
   }
 
+  /**
+   * Enregistre une alerte déjà évaluée par le Raspberry Pi (seuils et cooldown appliqués sur place)
+   * Seule l'analyse Gemini est ajoutée ; l'id de l'alerte rend l'enregistrement idempotent.
+   * @param {Object} deviceAlert - Alerte émise par le Pi
+   * @returns {Promise<Object>} Alerte enregistrée (duplicate: true si déjà connue)
+   */
+  async recordDeviceAlert(deviceAlert) {
+    const { measurement, issues = [] } = deviceAlert;
+
+    const recentHistory = await this.driveService.getLatestEntries('measurements', 20);
+    let geminiAnalysis;
+    if (measurement.alarm || measurement.warning || measurement.alarm_redox) {
+      const alarmHistory = recentHistory.filter(m => m.alarm || m.warning);
+      geminiAnalysis = await this.geminiService.diagnoseSystemAlarms(measurement, alarmHistory);
+    } else {
+      geminiAnalysis = await this.geminiService.analyzeMeasurement(measurement, recentHistory);
+    }
+
+    const alert = {
+      id: deviceAlert.id || this._generateAlertId(),
+      timestamp: deviceAlert.timestamp || new Date().toISOString(),
+      severity: deviceAlert.severity || this._calculateSeverity(issues),
+      issues,
+      measurement,
+      regulator_id: deviceAlert.regulator_id,
+      source: deviceAlert.source || 'raspberry_pi',
+      geminiAnalysis,
+      notified: false,
+      acknowledged: false,
+    };
+
+    const saved = await this.driveService.appendEntry('alerts', alert, { dedupeKey: 'id' });
+    if (saved.duplicate) {
+      return saved;
+    }
+
+    this._updateCooldown(this._generateAlertKey(issues, measurement));
+    console.log(`🚨 Device alert recorded: ${alert.severity} - ${alert.id}`);
+    return alert;
+  }
+
   /**
    * Récupère les alertes actives (non acquittées)
    */
@@ -0,0 +1,149 @@
+/**
+ * Décodage du format binaire compact des mesures (Content-Type: application/vnd.pool-monitor.frames)
+ *
+ * Chaque mesure est transmise sous forme de trame de 17 octets du régulateur,
+ * décodée avec la même table de champs que raspberry-pi/pool_protocol/decoder.py
+ * (FRAME_FIELDS['M']). Description du corps : raspberry-pi/pool_protocol/wire.py.
+ */
+
+const FRAMES_CONTENT_TYPE = 'application/vnd.pool-monitor.frames';
+const MAGIC = Buffer.from('PMF\x01', 'latin1');
+const FRAME_LENGTH = 17;
+const CRC_INDEX = 15;
+
+const FLAG_REGULATOR = 0x01;
+const FLAG_SUMMARY = 0x02;
+const FLAG_DEVICE_ALERTS = 0x04;
+const FLAG_TEXT_KEY = 0x08;
+
+// Champs de la trame M : [nom, offset, largeur, échelle, décimales, masque, type]
+const M_FIELDS = [
+  ['ph', 2, 2, 100, 2, null, 'float'],
+  ['redox', 4, 2, null, null, null, 'int'],
+  ['chlorine_amp', 4, 2, 100, 2, null, 'float'],
+  ['temperature', 6, 2, 10, 1, null, 'float'],
+  ['salt', 8, 2, 10, 1, null, 'float'],
+  ['alarm', 10, 1, null, null, null, 'int'],
+  ['warning', 11, 1, null, null, 0x0F, 'bits'],
+  ['alarm_redox', 11, 1, null, null, 0xF0, 'bits'],
+  ['regulator_type', 12, 1, null, null, 0x0F, 'bits'],
+  ['pump_plus_active', 12, 1, null, null, 0x80, 'bool'],
+  ['pump_minus_active', 12, 1, null, null, 0x40, 'bool'],
+  ['pump_chlore_active', 12, 1, null, null, 0x20, 'bool'],
+  ['filter_relay_active', 12, 1, null, null, 0x10, 'bool'],
+  ['pump_minus_enabled', 13, 1, null, null, 0x01, 'bool'],
+  ['pump_plus_enabled', 13, 1, null, null, 0x02, 'bool'],
+  ['temperature_sensor', 13, 1, null, null, 0x04, 'bool'],
+  ['salt_sensor', 13, 1, null, null, 0x08, 'bool'],
+  ['flow_switch', 13, 1, null, null, 0x10, 'bool'],
+  ['pump_chlore_enabled', 13, 1, null, null, 0x20, 'bool'],
+  ['pumps_forced', 13, 1, null, null, 0x80, 'bool'],
+];
+
+function _crc(frame) {
+  let crc = 0;
+  for (let i = 0; i < CRC_INDEX; i++) crc ^= frame[i];
+  return crc;
+}
+
+/**
+ * Décode une trame M validée (mêmes clés et arrondis que decode_frame côté Pi)
+ * @param {Buffer} frame - 17 octets
+ * @returns {Object}
+ */
+function decodeMeasurementFrame(frame) {
+  const fields = {};
+  for (const [name, offset, width, scale, digits, mask, kind] of M_FIELDS) {
+    const raw = width === 2 ? frame.readUInt16BE(offset) : frame[offset];
+    if (kind === 'bool') {
+      fields[name] = (raw & mask) === mask;
+    } else if (kind === 'bits') {
+      const shift = Math.log2(mask & -mask);
+      fields[name] = (raw & mask) >> shift;
+    } else if (scale) {
+      fields[name] = Number((raw / scale).toFixed(digits));
+    } else {
+      fields[name] = raw;
+    }
+  }
+  return fields;
+}
+
+/**
+ * Décode un corps binaire en mesures (mêmes clés que les mesures JSON)
+ * @param {Buffer} body
+ * @returns {Array<Object>}
+ * @throws {Error} corps invalide ou tronqué
+ */
+function decodeMeasurements(body) {
+  if (!Buffer.isBuffer(body) || body.length < MAGIC.length || !body.subarray(0, MAGIC.length).equals(MAGIC)) {
+    throw new Error('En-tête du format binaire invalide');
+  }
+
+  const measurements = [];
+  let pos = MAGIC.length;
+  const need = (count) => {
+    if (pos + count > body.length) throw new Error('Format binaire tronqué');
+  };
+
+  while (pos < body.length) {
+    need(9);
+    const flags = body[pos];
+    const ms = Number(body.readBigUInt64LE(pos + 1));
+    pos += 9;
+
+    let key;
+    if (flags & FLAG_TEXT_KEY) {
+      need(1);
+      const length = body[pos];
+      need(1 + length);
+      key = body.toString('utf8', pos + 1, pos + 1 + length);
+      pos += 1 + length;
+    } else {
+      need(16);
+      key = body.toString('hex', pos, pos + 16);
+      pos += 16;
+    }
+
+    need(FRAME_LENGTH);
+    const frame = body.subarray(pos, pos + FRAME_LENGTH);
+    pos += FRAME_LENGTH;
+    if (frame[1] !== 0x4D || _crc(frame) !== frame[CRC_INDEX]) {
+      throw new Error('Trame invalide dans le format binaire');
+    }
+
+    const measurement = {
+      timestamp: new Date(ms).toISOString(),
+      ...decodeMeasurementFrame(frame),
+    };
+    if (flags & FLAG_REGULATOR) {
+      need(1);
+      const length = body[pos];
+      need(1 + length);
+      measurement.regulator_id = body.toString('utf8', pos + 1, pos + 1 + length);
+      pos += 1 + length;
+    }
+    if (flags & FLAG_SUMMARY) {
+      need(2);
+      const length = body.readUInt16LE(pos);
+      need(2 + length);
+      measurement.summary = JSON.parse(body.toString('utf8', pos + 2, pos + 2 + length));
+      pos += 2 + length;
+    }
+    if (flags & FLAG_DEVICE_ALERTS) {
+      measurement.device_alerts = true;
+    }
+    if (key) {
+      measurement.idempotency_key = key;
+    }
+    measurements.push(measurement);
+  }
+
+  return measurements;
+}
+
+module.exports = {
+  FRAMES_CONTENT_TYPE,
+  decodeMeasurements,
+  decodeMeasurementFrame,
+};
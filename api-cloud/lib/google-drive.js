@@ -7,6 +7,7 @@ const path = require('path');
  * Structure des fichiers sur Drive :
  * - measurements.json : Mesures récentes (derniers 7 jours)
  * - daily-averages.json : Moyennes journalières historiques
+ * - hourly-averages.json : Agrégats horaires calculés par le Raspberry Pi
  * - error-logs.json : Logs d'erreurs
  * - alerts.json : Historique des alertes et conseils Gemini
  */
@@ -18,6 +19,7 @@ class GoogleDriveService {
     this.fileIds = {
       measurements: process.env.DRIVE_FILE_MEASUREMENTS_ID || null,
       dailyAverages: process.env.DRIVE_FILE_DAILY_AVERAGES_ID || null,
+      hourlyAverages: process.env.DRIVE_FILE_HOURLY_AVERAGES_ID || null,
       errorLogs: process.env.DRIVE_FILE_ERROR_LOGS_ID || null,
       alerts: process.env.DRIVE_FILE_ALERTS_ID || null,
     };
@@ -145,9 +147,21 @@ class GoogleDriveService {
    * Ajoute une entrée à un fichier JSON (mesure, log, alerte)
    * @param {string} fileType
    * @param {Object} entry
+   * @param {Object} options - { dedupeKey } : champ d'idempotence, l'entrée
+   *   n'est pas réécrite si une entrée existante porte la même valeur
+   * @returns {Promise<Object>} L'entrée ajoutée, ou l'entrée existante (avec duplicate: true)
    */
-  async appendEntry(fileType, entry) {
+  async appendEntry(fileType, entry, options = {}) {
     const data = await this.readJSON(fileType);
+    const { dedupeKey } = options;
+
+    // Idempotence : une entrée rejouée n'est pas ajoutée une seconde fois
+    if (dedupeKey && entry[dedupeKey] && data.data) {
+      const existing = data.data.find(e => e[dedupeKey] === entry[dedupeKey]);
+      if (existing) {
+        return { ...existing, duplicate: true };
+      }
+    }
 
     // Ajouter le timestamp si non présent
     if (!entry.timestamp && !entry.created_at) {
@@ -172,6 +186,118 @@ class GoogleDriveService {
     return entry;
   }
 
+  /**
+   * Ajoute plusieurs entrées en une seule lecture/écriture du fichier
+   * @param {string} fileType
+   * @param {Array<Object>} entries - Entrées dans l'ordre chronologique
+   * @param {Object} options - { dedupeKey } (voir appendEntry)
+   * @returns {Promise<{added: Array<Object>, duplicates: number}>}
+   */
+  async appendEntries(fileType, entries, options = {}) {
+    const data = await this.readJSON(fileType);
+    const { dedupeKey } = options;
+    if (!data.data) data.data = [];
+
+    const seen = new Set();
+    if (dedupeKey) {
+      data.data.forEach(e => {
+        if (e[dedupeKey]) seen.add(e[dedupeKey]);
+      });
+    }
+
+    const added = [];
+    let duplicates = 0;
+    for (const entry of entries) {
+      if (dedupeKey && entry[dedupeKey]) {
+        if (seen.has(entry[dedupeKey])) {
+          duplicates++;
+          continue;
+        }
+        seen.add(entry[dedupeKey]);
+      }
+      if (!entry.timestamp && !entry.created_at) {
+        entry.timestamp = new Date().toISOString();
+      }
+      added.push(entry);
+    }
+
+    if (added.length === 0) {
+      return { added, duplicates };
+    }
+
+    // Les plus récentes en tête du tableau
+    data.data.unshift(...added.slice().reverse());
+
+    const maxEntries = this._getMaxEntries(fileType);
+    if (data.data.length > maxEntries) {
+      data.data = data.data.slice(0, maxEntries);
+    }
+
+    data.lastUpdated = new Date().toISOString();
+    data.count = data.data.length;
+
+    await this.writeJSON(fileType, data);
+    return { added, duplicates };
+  }
+
+  /**
+   * Ajoute ou remplace des entrées identifiées par `key` (agrégats provisoires
+   * remplacés au fil des envois), en une seule lecture/écriture du fichier.
+   * Une entrée finale (final: true) n'est jamais remplacée par une provisoire.
+   * @param {string} fileType
+   * @param {Array<Object>} entries - Entrées dans l'ordre chronologique
+   * @param {string} key - Champ identifiant
+   * @returns {Promise<{added: number, replaced: number, ignored: number}>}
+   */
+  async upsertEntries(fileType, entries, key) {
+    const data = await this.readJSON(fileType);
+    if (!data.data) data.data = [];
+
+    const index = new Map();
+    data.data.forEach((e, i) => {
+      if (e[key]) index.set(e[key], i);
+    });
+
+    const added = [];
+    let replaced = 0;
+    let ignored = 0;
+    for (const entry of entries) {
+      const position = index.get(entry[key]);
+      if (position === undefined) {
+        index.set(entry[key], -1 - added.length);
+        added.push(entry);
+        continue;
+      }
+      // position < 0 : même identifiant plus tôt dans le lot
+      const existing = position < 0 ? added[-1 - position] : data.data[position];
+      if (existing.final && !entry.final) {
+        ignored++;
+      } else if (position < 0) {
+        added[-1 - position] = entry;
+      } else {
+        data.data[position] = entry;
+        replaced++;
+      }
+    }
+
+    if (added.length === 0 && replaced === 0) {
+      return { added: 0, replaced, ignored };
+    }
+
+    data.data.unshift(...added.reverse());
+
+    const maxEntries = this._getMaxEntries(fileType);
+    if (data.data.length > maxEntries) {
+      data.data = data.data.slice(0, maxEntries);
+    }
+
+    data.lastUpdated = new Date().toISOString();
+    data.count = data.data.length;
+
+    await this.writeJSON(fileType, data);
+    return { added: added.length, replaced, ignored };
+  }
+
   /**
    * Récupère les dernières entrées
    * @param {string} fileType
@@ -218,6 +344,7 @@ class GoogleDriveService {
     const names = {
       measurements: 'pool-measurements.json',
       dailyAverages: 'pool-daily-averages.json',
+      hourlyAverages: 'pool-hourly-averages.json',
       errorLogs: 'pool-error-logs.json',
       alerts: 'pool-alerts.json',
     };
@@ -240,6 +367,7 @@ class GoogleDriveService {
     const limits = {
       measurements: 10080, // 7 jours * 24h * 60 mesures/heure = ~10k mesures
       dailyAverages: 730, // 2 ans de moyennes journalières
+      hourlyAverages: 2160, // 90 jours d'agrégats horaires
       errorLogs: 1000, // 1000 derniers logs
       alerts: 500, // 500 dernières alertes
     };
@@ -25,6 +25,8 @@ class StorageService {
 
   /**
    * Insère une nouvelle mesure
+   * Si la mesure porte une idempotency_key déjà connue (rejeu depuis l'outbox
+   * du Raspberry Pi), l'entrée existante est retournée sans nouvelle écriture.
    * @param {Object} measurement
    * @returns {Promise<Object>}
    */
@@ -34,16 +36,23 @@ class StorageService {
       timestamp: measurement.timestamp || new Date().toISOString(),
       created_at: new Date().toISOString(),
     };
+    if (!entry.idempotency_key) delete entry.idempotency_key;
 
     // Sauvegarder la mesure
-    await this.drive.appendEntry('measurements', entry);
+    const saved = await this.drive.appendEntry('measurements', entry, { dedupeKey: 'idempotency_key' });
+    if (saved.duplicate) {
+      return saved;
+    }
 
     // Invalider le cache
     this.cache.delete('latest');
     this.cache.delete('stats');
     this.cache.delete('charts');
 
-    // Analyser pour détecter les alertes
+    // Analyser pour détecter les alertes (sauf si le Pi les évalue lui-même : POST /api/alerts)
+    if (entry.device_alerts) {
+      return entry;
+    }
     try {
       const alert = await this.alertAnalyzer.analyzeMeasurement(entry);
 
@@ -59,6 +68,53 @@ class StorageService {
     return entry;
   }
 
+  /**
+   * Insère un lot de mesures avec une seule écriture sur Drive
+   * Seule la mesure la plus récente du lot est analysée pour les alertes
+   * (un rattrapage après coupure ne doit pas générer une alerte par mesure).
+   * @param {Array<Object>} measurements - Mesures dans l'ordre chronologique
+   * @returns {Promise<{inserted: number, duplicates: number, latest: Object|null}>}
+   */
+  async insertMeasurements(measurements) {
+    const now = new Date().toISOString();
+    const entries = measurements.map(measurement => {
+      const entry = {
+        ...measurement,
+        timestamp: measurement.timestamp || now,
+        created_at: now,
+      };
+      if (!entry.idempotency_key) delete entry.idempotency_key;
+      return entry;
+    });
+
+    const { added, duplicates } = await this.drive.appendEntries('measurements', entries, {
+      dedupeKey: 'idempotency_key',
+    });
+
+    if (added.length === 0) {
+      return { inserted: 0, duplicates, latest: null };
+    }
+
+    this.cache.delete('latest');
+    this.cache.delete('stats');
+    this.cache.delete('charts');
+
+    const latest = added[added.length - 1];
+    if (latest.device_alerts) {
+      return { inserted: added.length, duplicates, latest };
+    }
+    try {
+      const alert = await this.alertAnalyzer.analyzeMeasurement(latest);
+      if (alert && alert.severity !== 'ok') {
+        await this.emailService.sendAlert(alert);
+      }
+    } catch (error) {
+      console.error('Error analyzing measurement for alerts:', error);
+    }
+
+    return { inserted: added.length, duplicates, latest };
+  }
+
   /**
    * Récupère la dernière mesure
    */
@@ -99,16 +155,27 @@ class StorageService {
   /**
    * Calcule les statistiques sur une période
    * @param {number} hours - Nombre d'heures
+   * @param {string} [regulatorId] - Limite aux mesures d'un régulateur
    */
-  async getStats(hours = 24) {
-    const cacheKey = `stats-${hours}`;
+  async getStats(hours = 24, regulatorId = null) {
+    const cacheKey = `stats-${hours}-${regulatorId || ''}`;
     const cached = this._getCached(cacheKey);
     if (cached) return cached;
 
     const fromDate = new Date(Date.now() - hours * 60 * 60 * 1000);
     const toDate = new Date();
 
-    const measurements = await this.drive.getEntriesByDateRange('measurements', fromDate, toDate);
+    // Heures complètes couvertes par les agrégats du Pi, mesures brutes pour le reste seulement
+    const fromRollups = await this._getStatsFromRollups(hours, fromDate, toDate, regulatorId);
+    if (fromRollups) {
+      this._setCached(cacheKey, fromRollups, this.cacheTTL.stats);
+      return fromRollups;
+    }
+
+    let measurements = await this.drive.getEntriesByDateRange('measurements', fromDate, toDate);
+    if (regulatorId) {
+      measurements = measurements.filter(m => m.regulator_id === regulatorId);
+    }
 
     if (measurements.length === 0) {
       return {
@@ -174,8 +241,35 @@ class StorageService {
     return averages.sort((a, b) => new Date(b.date) - new Date(a.date));
   }
 
+  /**
+   * Enregistre les agrégats horaires et journaliers calculés par le Raspberry Pi
+   * Les agrégats provisoires (final: false) sont remplacés par les envois suivants.
+   * @param {Array<Object>} rollups - { id, period: 'hour'|'day', timestamp, final, avg_*, min_*, max_*, std_*, stats }
+   * @returns {Promise<{added: number, replaced: number, ignored: number}>}
+   */
+  async insertRollups(rollups) {
+    const now = new Date().toISOString();
+    const result = { added: 0, replaced: 0, ignored: 0 };
+    for (const [period, fileType] of [['hour', 'hourlyAverages'], ['day', 'dailyAverages']]) {
+      const entries = rollups
+        .filter(rollup => rollup.period === period)
+        .map(rollup => ({ ...rollup, created_at: now }));
+      if (entries.length === 0) continue;
+      const { added, replaced, ignored } = await this.drive.upsertEntries(fileType, entries, 'id');
+      result.added += added;
+      result.replaced += replaced;
+      result.ignored += ignored;
+    }
+
+    for (const key of this.cache.keys()) {
+      if (key.startsWith('stats')) this.cache.delete(key);
+    }
+    return result;
+  }
+
   /**
    * Crée une moyenne journalière à partir des mesures
+   * (sauf si le Pi a déjà transmis l'agrégat de ce jour)
    * @param {Date} date
    */
   async createDailyAverage(date) {
@@ -185,6 +279,14 @@ class StorageService {
     const endOfDay = new Date(date);
     endOfDay.setHours(23, 59, 59, 999);
 
+    const day = startOfDay.toISOString().split('T')[0];
+    const recent = await this.drive.getLatestEntries('dailyAverages', 30);
+    const fromDevice = recent.filter(entry => entry.date === day && entry.stats && entry.final);
+    if (fromDevice.length === 1) {
+      // Plusieurs régulateurs : moyenne commune calculée sur les mesures, comme avant
+      return fromDevice[0];
+    }
+
     const measurements = await this.drive.getEntriesByDateRange('measurements', startOfDay, endOfDay);
 
     if (measurements.length === 0) {
@@ -216,22 +318,48 @@ class StorageService {
   // ==================== ERROR LOGS ====================
 
   /**
-   * Enregistre une erreur
+   * Normalise un log d'erreur (les agrégats du Pi ajoutent count, first_seen, last_seen et samples)
    */
-  async logError(error) {
+  _errorEntry(error, now) {
     const entry = {
-      timestamp: error.timestamp || new Date().toISOString(),
+      timestamp: error.timestamp || now,
       error_type: error.error_type || 'unknown',
       error_message: error.error_message || error.message || '',
       context: error.context || {},
       source: error.source || 'api',
-      created_at: new Date().toISOString(),
+      created_at: now,
     };
+    for (const key of ['count', 'first_seen', 'last_seen', 'samples', 'idempotency_key']) {
+      if (error[key] !== undefined) entry[key] = error[key];
+    }
+    return entry;
+  }
+
+  /**
+   * Enregistre une erreur
+   */
+  async logError(error) {
+    const entry = this._errorEntry(error, new Date().toISOString());
 
-    await this.drive.appendEntry('errorLogs', entry);
+    await this.drive.appendEntry('errorLogs', entry, { dedupeKey: 'idempotency_key' });
     return entry;
   }
 
+  /**
+   * Enregistre un lot de logs d'erreur avec une seule écriture sur Drive
+   * @param {Array<Object>} errors
+   * @returns {Promise<{inserted: number, duplicates: number}>}
+   */
+  async logErrors(errors) {
+    const now = new Date().toISOString();
+    const entries = errors.map(error => this._errorEntry(error, now));
+
+    const { added, duplicates } = await this.drive.appendEntries('errorLogs', entries, {
+      dedupeKey: 'idempotency_key',
+    });
+    return { inserted: added.length, duplicates };
+  }
+
   /**
    * Récupère les logs d'erreur
    */
@@ -267,6 +395,23 @@ class StorageService {
     return await this.alertAnalyzer.getRecentAlerts(hours);
   }
 
+  /**
+   * Enregistre une alerte évaluée par le Raspberry Pi et envoie l'email
+   * Une alerte rejouée (même id) n'est ni réenregistrée ni renotifiée.
+   * @param {Object} deviceAlert - { id, timestamp, severity, issues, measurement, regulator_id }
+   */
+  async insertAlert(deviceAlert) {
+    const alert = await this.alertAnalyzer.recordDeviceAlert(deviceAlert);
+    if (!alert.duplicate) {
+      try {
+        await this.emailService.sendAlert(alert);
+      } catch (error) {
+        console.error('Error sending alert email:', error);
+      }
+    }
+    return alert;
+  }
+
   /**
    * Acquitte une alerte
    */
@@ -335,6 +480,126 @@ class StorageService {
 
   // ==================== HELPERS ====================
 
+  /**
+   * Statistiques sur la période à partir des agrégats horaires du Pi
+   * Seules les heures finies et entièrement comprises dans la période viennent
+   * des agrégats. Les mesures brutes ne sont lues que pour les intervalles
+   * qu'ils ne couvrent pas (début et fin de période entamés, heures sans
+   * agrégat), et pas du tout si les agrégats couvrent toute la période. Les
+   * deux sont fusionnés (moyennes et variances de Welford, formule de Chan).
+   * Les agrégats étant propres à un régulateur, ils ne servent pas pour une
+   * période mêlant plusieurs régulateurs.
+   *
+   * Bases d'échantillonnage : un agrégat compte chaque trame décodée par le Pi,
+   * alors que les mesures brutes ne sont envoyées qu'au changement (filtre
+   * DEADBANDS) ou au heartbeat. Chaque intervalle non couvert est donc pondéré
+   * par sa durée, au rythme moyen de trames des agrégats : une heure de mesures
+   * brutes pèse autant qu'une heure d'agrégat, quel que soit le nombre de
+   * mesures envoyées. `count` est exprimé en trames (estimé pour ces
+   * intervalles) ; `raw_count` donne le nombre de mesures brutes utilisées.
+   * @returns {Promise<Object|null>} null si aucun agrégat n'est utilisable
+   */
+  async _getStatsFromRollups(hours, fromDate, toDate, regulatorId) {
+    const hour = 60 * 60 * 1000;
+    const rollups = (await this.drive.getEntriesByDateRange('hourlyAverages', fromDate, toDate))
+      .filter(rollup => rollup.final && rollup.stats
+        && new Date(rollup.timestamp).getTime() + hour <= toDate.getTime()
+        && (!regulatorId || rollup.regulator_id === regulatorId));
+
+    if (rollups.length === 0) return null;
+    if (!regulatorId && new Set(rollups.map(rollup => rollup.regulator_id || null)).size > 1) return null;
+
+    // Intervalles de la période sans agrégat (contigus fusionnés)
+    const covered = new Set(rollups.map(rollup => new Date(rollup.timestamp).getTime()));
+    const gaps = [];
+    for (let start = Math.floor(fromDate.getTime() / hour) * hour; start < toDate.getTime(); start += hour) {
+      if (covered.has(start)) continue;
+      const from = Math.max(start, fromDate.getTime());
+      const to = Math.min(start + hour, toDate.getTime());
+      const last = gaps[gaps.length - 1];
+      if (last && last.to === from) last.to = to;
+      else gaps.push({ from, to });
+    }
+
+    let raw = [];
+    if (gaps.length > 0) {
+      raw = await this.drive.getEntriesByDateRange('measurements',
+        new Date(gaps[0].from), new Date(gaps[gaps.length - 1].to));
+      if (regulatorId) raw = raw.filter(m => m.regulator_id === regulatorId);
+      if (!regulatorId && raw.some(m => (m.regulator_id || null) !== (rollups[0].regulator_id || null))) return null;
+    }
+    for (const gap of gaps) {
+      gap.measurements = raw.filter(m => {
+        const time = new Date(m.timestamp).getTime();
+        return time >= gap.from && time < gap.to;
+      });
+    }
+
+    const frames = rollups.reduce((sum, rollup) => sum + rollup.stats.count, 0);
+    const framesPerMs = frames / (rollups.length * hour);
+    const gapWeights = gaps.map(gap => (gap.measurements.length ? framesPerMs * (gap.to - gap.from) : 0));
+
+    const stats = {
+      count: Math.round(frames + gapWeights.reduce((sum, weight) => sum + weight, 0)),
+      raw_count: gaps.reduce((sum, gap) => sum + gap.measurements.length, 0),
+      period_hours: hours,
+      source: 'rollups',
+      rollup_hours: rollups.length,
+    };
+    for (const metric of ['ph', 'redox', 'temperature', 'salt']) {
+      const merged = { count: 0, mean: 0, m2: 0, min: Infinity, max: -Infinity };
+      gaps.forEach((gap, i) => {
+        const part = this._runningStats(gap.measurements, metric);
+        if (!part.count) return;
+        // Même moyenne et même variance, ramenées au poids de l'intervalle
+        const weight = gapWeights[i];
+        this._mergeRunningStats(merged, { ...part, count: weight, m2: part.m2 * weight / part.count });
+      });
+      for (const rollup of rollups) {
+        if (rollup.stats[metric]) this._mergeRunningStats(merged, { count: rollup.stats.count, ...rollup.stats[metric] });
+      }
+      stats[metric] = merged.count === 0 ? null : {
+        avg: parseFloat(merged.mean.toFixed(2)),
+        min: parseFloat(merged.min.toFixed(2)),
+        max: parseFloat(merged.max.toFixed(2)),
+        std: merged.count > 1 ? parseFloat(Math.sqrt(merged.m2 / (merged.count - 1)).toFixed(3)) : 0,
+      };
+    }
+    return stats;
+  }
+
+  /**
+   * Nombre, moyenne, M2, min et max d'une mesure (algorithme de Welford)
+   */
+  _runningStats(measurements, metric) {
+    const stats = { count: 0, mean: 0, m2: 0, min: Infinity, max: -Infinity };
+    for (const m of measurements) {
+      const value = m[metric];
+      if (value === null || value === undefined || isNaN(value)) continue;
+      stats.count += 1;
+      const delta = value - stats.mean;
+      stats.mean += delta / stats.count;
+      stats.m2 += delta * (value - stats.mean);
+      stats.min = Math.min(stats.min, value);
+      stats.max = Math.max(stats.max, value);
+    }
+    return stats;
+  }
+
+  /**
+   * Fusionne `other` dans `stats` (formule de Chan)
+   */
+  _mergeRunningStats(stats, other) {
+    if (!other.count) return;
+    const total = stats.count + other.count;
+    const delta = other.mean - stats.mean;
+    stats.mean += delta * other.count / total;
+    stats.m2 += other.m2 + delta * delta * stats.count * other.count / total;
+    stats.count = total;
+    stats.min = Math.min(stats.min, other.min);
+    stats.max = Math.max(stats.max, other.max);
+  }
+
   _calculateMetricStats(measurements, metric) {
     const values = measurements
       .map(m => m[metric])
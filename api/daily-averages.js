@@ -0,0 +1,4 @@
+// Vercel serverless function for /api/daily-averages
+// Forwards to new Google Drive JSON-based API
+const handler = require('../api-cloud/api/index');
+module.exports = handler;
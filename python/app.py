@@ -1,14 +1,44 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
 import asyncio
+import os
+import sys
 from bleak import BleakClient, BleakError
 from datetime import datetime
 
+# Shared frame decoder (raspberry-pi/pool_protocol) and Firestore writer (raspberry-pi/sinks.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'raspberry-pi'))
+from pool_protocol import FRAME_LENGTH, decode_frame
+from sinks import FirestoreSink
+
+# Decoded field names -> Firestore field names
+FIRESTORE_FIELDS = {
+    'ph': 'pH',
+    'redox': 'RX',
+    'chlorine_amp': 'amp',
+    'temperature': 'C°',
+    'salt': 'sel',
+    'alarm': 'alarme',
+    'warning': 'warning',
+    'alarm_redox': 'alarmeRX',
+    'regulator_type': 'eRegulateur',
+    'pump_plus_active': 'pompePlusActive',
+    'pump_minus_active': 'pompeMoinsActive',
+}
+
 # Initialize Firestore DB
 cred = credentials.Certificate('piscine-pineau-morin-firebase-adminsdk-7jfph-8571cb3029.json')
 firebase_admin.initialize_app(cred)
 db = firestore.client()
 
+# Records are written in batches by a background thread, with an offline queue
+sink = FirestoreSink(
+    db,
+    document_id=lambda record: record['id'],
+    flush_interval=float(os.getenv('FIRESTORE_FLUSH_INTERVAL', 5)),  # seconds
+    max_queue=int(os.getenv('FIRESTORE_QUEUE_SIZE', 10000)),  # records kept while offline
+)
+
 async def indication_handler(sender, data):
     try:
         print("Indication handler called")  # Debug print
@@ -19,7 +49,7 @@ async def indication_handler(sender, data):
         print(f"Raw data: {data}")  # Debug print
         trame = list(data)
         
-        if len(trame) < 13:
+        if len(trame) < FRAME_LENGTH:
             print(f"Received trame is too short: {len(trame)} bytes")
             return
         
@@ -28,10 +58,9 @@ async def indication_handler(sender, data):
         if processed_data:
             print(f"Processed data: {processed_data}")  # Log the processed data
             if 6 < processed_data['pH'] < 9:
-                doc_ref = db.collection('pool_data').add(processed_data)
-                print(f"Data added to Firestore with ID: {doc_ref}")
-                await asyncio.sleep(1)  # Small delay before stopping
-                await asyncio.get_event_loop().stop()  # Stop the event loop
+                # Same document ID for the same second: a replayed record overwrites instead of duplicating
+                sink.submit(processed_data)
+                print(f"Data queued for Firestore with ID: {processed_data['id']} ({len(sink.queue)} queued)")
         else:
             print("Processed data is None or invalid.")
     
@@ -39,10 +68,12 @@ async def indication_handler(sender, data):
         print(f"Error in indication_handler: {e}")
 
 def process_trame(trame):
-    if len(trame) < 13:
+    if len(trame) < FRAME_LENGTH or trame[1] != ord('M'):
         print("Incomplete data received")  # Debug print
         return None
 
+    fields = decode_frame(bytes(trame))
+
     current_time = datetime.now()
     timestamp_id = current_time.strftime("%Y%m%d%H%M%S")  # Generate ID in the format YYYYMMDDHHmmss
 
@@ -51,23 +82,11 @@ def process_trame(trame):
     data['date'] = current_time  # Store as a Firestore Timestamp
     data['date_string'] = current_time.isoformat()  # Store as ISO formatted string (optional)
 
-    data['pH'] = byte_to_double(trame[2], trame[3]) / 100.0
-    data['RX'] = byte_to_double(trame[4], trame[5])
-    data['amp'] = byte_to_double(trame[4], trame[5]) / 100.0
-    data['C°'] = byte_to_double(trame[6], trame[7]) / 10.0
-    data['sel'] = byte_to_double(trame[8], trame[9]) / 10.0
-    data['alarme'] = trame[10]
-    data['warning'] = trame[11] & 15
-    data['alarmeRX'] = trame[11] >> 4
-    data['eRegulateur'] = trame[12] & 15
-    data['pompePlusActive'] = (trame[12] & 0x80) != 0
-    data['pompeMoinsActive'] = (trame[12] & 0x40) != 0
+    for field, name in FIRESTORE_FIELDS.items():
+        data[name] = fields[field]
     
     return data
 
-def byte_to_double(byte1, byte2):
-    return (byte1 << 8) + byte2
-
 async def disconnect(client, indicate_char=None):    
     if client.is_connected:
         if indicate_char is not None:
@@ -118,11 +137,16 @@ async def connect_and_indicate(device_address):
         await asyncio.sleep(2)  # Allow a brief grace period before reconnecting
 
 async def main():
-    device_address = "80:4B:50:D0:53:49"  # Your device's MAC address
+    device_address = os.getenv("REGULATOR_ADDRESS", "80:4B:50:D0:53:49")  # Your device's MAC address
 
-    while True:
-        await connect_and_indicate(device_address)
-        await asyncio.sleep(5)  # Wait before trying to reconnect
+    await sink.start()
+    try:
+        while True:
+            await connect_and_indicate(device_address)
+            print(f"Firestore: {sink.get_stats()}")
+            await asyncio.sleep(5)  # Wait before trying to reconnect
+    finally:
+        await sink.stop()
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -1,43 +1,52 @@
 import asyncio
+import os
+import sys
 from bleak import BleakClient
 import requests
 
+# Shared frame decoder (raspberry-pi/pool_protocol)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'raspberry-pi'))
+from pool_protocol import FrameDecoder, decode_measurement
+
+# Decoded field names -> field names expected by the server
+SERVER_FIELDS = {
+    'ph': 'valPh',
+    'redox': 'valRdx',
+    'chlorine_amp': 'valAmp',
+    'temperature': 'valTemp',
+    'salt': 'valSel',
+    'alarm': 'alarme',
+    'warning': 'warning',
+    'alarm_redox': 'alarmeRdx',
+    'regulator_type': 'eRegulateur',
+    'pump_plus_active': 'pompePlusActive',
+    'pump_minus_active': 'pompeMoinsActive',
+}
+
+frame_decoder = FrameDecoder()
+
 async def notification_handler(sender, data):
-    trame = list(data)
-    processed_data = process_trame(trame)
-    if processed_data:
-        print(f"Data: {processed_data}")  # Log the data array
-        status_code, response_text = send_data_to_server(processed_data, "http://yourserver.com/data_endpoint")
-        print(f"Server responded with status code {status_code}: {response_text}")
+    # Notifications may split or merge frames: reassemble them before decoding
+    for trame in frame_decoder.feed(data):
+        processed_data = process_trame(trame)
+        if processed_data:
+            print(f"Data: {processed_data}")  # Log the data array
+            status_code, response_text = send_data_to_server(processed_data, "http://yourserver.com/data_endpoint")
+            print(f"Server responded with status code {status_code}: {response_text}")
 
 def process_trame(trame):
-    if len(trame) < 13:
+    measurement = decode_measurement(trame)
+    if measurement is None:
         return None
 
-    data = {}
-    data['valPh'] = byte_to_double(trame[2], trame[3]) / 100.0
-    data['valRdx'] = byte_to_double(trame[4], trame[5])
-    data['valAmp'] = byte_to_double(trame[4], trame[5]) / 100.0
-    data['valTemp'] = byte_to_double(trame[6], trame[7]) / 10.0
-    data['valSel'] = byte_to_double(trame[8], trame[9]) / 10.0
-    data['alarme'] = trame[10]
-    data['warning'] = trame[11] & 15
-    data['alarmeRdx'] = trame[11] >> 4
-    data['eRegulateur'] = trame[12] & 15
-    data['pompePlusActive'] = (trame[12] & 0x80) != 0
-    data['pompeMoinsActive'] = (trame[12] & 0x40) != 0
-    
-    return data
-
-def byte_to_double(byte1, byte2):
-    return (byte1 << 8) + byte2
+    return {name: getattr(measurement, field) for field, name in SERVER_FIELDS.items()}
 
 def send_data_to_server(data, url):
     response = requests.post(url, json=data)
     return response.status_code, response.text
 
 async def main():
-    device_address = "80:4B:50:D0:53:49"  # Your device's MAC address
+    device_address = os.getenv("REGULATOR_ADDRESS", "80:4B:50:D0:53:49")  # Your device's MAC address
     char_uuid = "e7add780-b042-4876-aae1-112855353cc1"  # Characteristic UUID
 
     async with BleakClient(device_address) as client:
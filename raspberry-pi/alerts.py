@@ -0,0 +1,253 @@
+"""
+Évaluation des alertes sur le Raspberry Pi
+
+Reprend les règles de api-cloud/lib/alert-analyzer.js (THRESHOLDS,
+_detectIssues, ALERT_COOLDOWN) pour détecter les anomalies dès la trame M
+décodée, sans attendre l'envoi, et même sans connexion Internet. Les seuils
+par défaut sont remplacés par ceux du régulateur dès que ses trames S, D et E
+ont été lues. S'y ajoutent :
+
+- une durée minimale pour les dépassements de niveau « warning » (pas
+  d'alerte sur une mesure isolée), les niveaux critiques restant immédiats ;
+- une vitesse de variation maximale par heure, sur une fenêtre glissante.
+
+Chaque évaluation est en O(1) (amorti pour les fenêtres glissantes). Seules
+les alertes résultantes (après cooldown) sont transmises à l'API.
+"""
+
+import copy
+import logging
+import random
+import time
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Seuils de surveillance (identiques à THRESHOLDS de alert-analyzer.js)
+THRESHOLDS = {
+    'ph': {'min': 7.0, 'max': 7.6, 'critical_min': 6.8, 'critical_max': 7.8},
+    'redox': {'min': 650, 'max': 750, 'critical_min': 550, 'critical_max': 850},
+    'temperature': {'min': 15, 'max': 32, 'critical_min': 10, 'critical_max': 35},
+    'salt': {'min': 3.0, 'max': 5.0, 'critical_min': 2.0, 'critical_max': 6.0},
+}
+
+# Temps minimum entre deux alertes similaires (secondes), comme ALERT_COOLDOWN
+ALERT_COOLDOWN = 3 * 60 * 60
+
+# Variation maximale par heure sur la fenêtre glissante
+RATE_LIMITS = {'ph': 0.3, 'redox': 150, 'temperature': 3.0, 'salt': 0.5}
+
+# Écarts à la consigne du régulateur (mêmes écarts que les seuils par défaut autour de 7.3 / 700 mV)
+PH_SETPOINT_MARGIN = 0.3
+REDOX_SETPOINT_MARGINS = (50, 150)
+# Points conservés par fenêtre de variation, quel que soit le rythme des mesures (mémoire bornée)
+RATE_WINDOW_MAX_POINTS = 1024
+
+_LABELS = {'ph': 'pH', 'redox': 'Redox', 'temperature': 'Température', 'salt': 'Salinité'}
+_UNITS = {'ph': '', 'redox': ' mV', 'temperature': ' °C', 'salt': ' g/L'}
+
+
+class _RateWindow:
+    """Valeurs des `window` dernières secondes : variation par heure entre la plus ancienne et la dernière"""
+
+    __slots__ = ('window', 'points')
+
+    def __init__(self, window, max_points=RATE_WINDOW_MAX_POINTS):
+        self.window = window
+        self.points = deque(maxlen=max_points)
+
+    def add(self, ts, value):
+        points = self.points
+        points.append((ts, value))
+        while ts - points[0][0] > self.window:
+            points.popleft()
+
+    def rate(self):
+        """Variation par heure, None tant que la fenêtre ne couvre pas la moitié de sa durée"""
+        first_ts, first = self.points[0]
+        last_ts, last = self.points[-1]
+        span = last_ts - first_ts
+        if span < self.window / 2:
+            return None
+        return (last - first) * 3600 / span
+
+
+class AlertEngine:
+    """Règles d'alerte évaluées à chaque mesure"""
+
+    def __init__(self, thresholds=THRESHOLDS, cooldown=ALERT_COOLDOWN, sustain=600.0, rate_window=1800.0,
+                 rate_limits=RATE_LIMITS):
+        self.defaults = thresholds
+        self.thresholds = copy.deepcopy(thresholds)
+        self.cooldown = cooldown
+        self.sustain = sustain
+        self.rate_limits = rate_limits
+        self.settings = {}  # seuils lus sur le régulateur
+
+        self._windows = {metric: _RateWindow(rate_window) for metric in rate_limits}
+        self._since = {}         # (mesure, sévérité) -> début du dépassement
+        self._last_alerts = {}   # clé d'alerte -> instant du dernier envoi
+
+        self.evaluated = 0
+        self.alerts = {'warning': 0, 'critical': 0}
+        self.in_cooldown = 0
+
+    # ==================== SEUILS DU RÉGULATEUR ====================
+
+    def update_settings(self, mnemo, fields):
+        """Seuils et consignes des trames S (pH), D (température, sel) et E (redox)"""
+        if mnemo not in ('S', 'D', 'E') or self.settings.get(mnemo) == fields:
+            return
+        self.settings[mnemo] = dict(fields)
+        thresholds = copy.deepcopy(self.defaults)
+
+        ph, temperature, salt, redox = (thresholds[m] for m in ('ph', 'temperature', 'salt', 'redox'))
+        s = self.settings.get('S')
+        if s:
+            if s['ph_setpoint'] > 0:
+                ph['min'] = round(s['ph_setpoint'] - PH_SETPOINT_MARGIN, 2)
+                ph['max'] = round(s['ph_setpoint'] + PH_SETPOINT_MARGIN, 2)
+            if 0 < s['ph_error_min'] < s['ph_error_max']:
+                ph['critical_min'] = s['ph_error_min']
+                ph['critical_max'] = s['ph_error_max']
+        d = self.settings.get('D')
+        if d:
+            if 0 < d['temperature_warning_min'] < d['temperature_warning_max']:
+                temperature['min'] = d['temperature_warning_min']
+                temperature['max'] = d['temperature_warning_max']
+            if 0 < d['temperature_error_min'] < d['temperature_error_max']:
+                temperature['critical_min'] = d['temperature_error_min']
+                temperature['critical_max'] = d['temperature_error_max']
+            if d['salt_warning_min'] > 0:
+                salt['min'] = d['salt_warning_min']
+            if d['salt_error_min'] > 0:
+                salt['critical_min'] = d['salt_error_min']
+        e = self.settings.get('E')
+        if e and e['redox_setpoint'] > 0:
+            warning, critical = REDOX_SETPOINT_MARGINS
+            redox['min'] = e['redox_setpoint'] - warning
+            redox['max'] = e['redox_setpoint'] + warning
+            redox['critical_min'] = e['redox_setpoint'] - critical
+            redox['critical_max'] = e['redox_setpoint'] + critical
+
+        self.thresholds = thresholds
+        logger.info(f"Seuils d'alerte mis à jour depuis la trame {mnemo}: {thresholds}")
+
+    # ==================== RÈGLES ====================
+
+    def _detect_issues(self, m):
+        """Même détection que _detectIssues (alert-analyzer.js)"""
+        t = self.thresholds
+        issues = []
+
+        ph = m.get('ph')
+        if ph is not None:
+            if ph < t['ph']['critical_min'] or ph > t['ph']['critical_max']:
+                issues.append(('ph', ph, 'critical', f"pH critique : {ph}"))
+            elif ph < t['ph']['min'] or ph > t['ph']['max']:
+                issues.append(('ph', ph, 'warning', f"pH hors plage optimale : {ph}"))
+
+        redox = m.get('redox')
+        if redox is not None:
+            if redox < t['redox']['critical_min']:
+                issues.append(('redox', redox, 'critical', f"Redox très bas (désinfection insuffisante) : {redox} mV"))
+            elif redox < t['redox']['min']:
+                issues.append(('redox', redox, 'warning', f"Redox bas : {redox} mV"))
+            elif redox > t['redox']['critical_max']:
+                issues.append(('redox', redox, 'warning', f"Redox très élevé : {redox} mV"))
+
+        temperature = m.get('temperature')
+        if temperature is not None:
+            if temperature < t['temperature']['critical_min'] or temperature > t['temperature']['critical_max']:
+                issues.append(('temperature', temperature, 'warning', f"Température extrême : {temperature} °C"))
+
+        salt = m.get('salt')
+        if salt is not None:
+            if salt < t['salt']['critical_min'] or salt > t['salt']['critical_max']:
+                issues.append(('salt', salt, 'warning', f"Salinité anormale : {salt} g/L"))
+
+        if m.get('alarm'):
+            issues.append(('system', 'alarm', 'critical', "Alarme système active"))
+        if m.get('warning'):
+            issues.append(('system', 'warning', 'warning', "Avertissement système actif"))
+        if m.get('alarm_redox'):
+            issues.append(('redox', 'alarm', 'critical', "Alarme Redox active"))
+        return issues
+
+    def _sustained(self, issues, now):
+        """Dépassements « warning » retenus seulement s'ils durent depuis `sustain` secondes"""
+        active = set()
+        kept = []
+        for issue in issues:
+            metric, _, severity, _ = issue
+            key = (metric, severity)
+            active.add(key)
+            since = self._since.setdefault(key, now)
+            if severity == 'critical' or metric == 'system' or now - since >= self.sustain:
+                kept.append(issue)
+        for key in [key for key in self._since if key not in active]:
+            del self._since[key]
+        return kept
+
+    def _rate_issues(self, m, now):
+        issues = []
+        for metric, limit in self.rate_limits.items():
+            value = m.get(metric)
+            if value is None:
+                continue
+            window = self._windows[metric]
+            window.add(now, value)
+            rate = window.rate()
+            if rate is not None and abs(rate) > limit:
+                direction = 'hausse' if rate > 0 else 'baisse'
+                issues.append((metric, value, 'warning',
+                               f"{_LABELS[metric]} en {direction} rapide : {rate:+.2f}{_UNITS[metric]}/h"))
+        return issues
+
+    def evaluate(self, measurement, now=None):
+        """Alerte à transmettre pour cette mesure (forme des alertes de l'API), ou None"""
+        now = time.time() if now is None else now
+        self.evaluated += 1
+
+        issues = self._sustained(self._detect_issues(measurement), now)
+        issues += self._rate_issues(measurement, now)
+        if not issues:
+            return None
+
+        # Même clé que _generateAlertKey : mesures concernées | alarmes actives
+        alarms = '-'.join(name for name in ('alarm', 'warning', 'alarm_redox') if measurement.get(name))
+        alert_key = f"{'-'.join(sorted(issue[0] for issue in issues))}|{alarms}"
+        last = self._last_alerts.get(alert_key)
+        if last is not None and now - last < self.cooldown:
+            self.in_cooldown += 1
+            return None
+        self._last_alerts[alert_key] = now
+        # Nettoyage du cache de cooldown (comme cleanupCooldownCache)
+        for key in [key for key, ts in self._last_alerts.items() if now - ts > self.cooldown * 2]:
+            del self._last_alerts[key]
+
+        severity = 'critical' if any(issue[2] == 'critical' for issue in issues) else 'warning'
+        self.alerts[severity] += 1
+        return {
+            'id': f"alert-{int(now * 1000)}-{random.getrandbits(40):x}",
+            'timestamp': datetime.utcfromtimestamp(now).isoformat(),
+            'severity': severity,
+            'issues': [
+                {'metric': metric, 'value': value, 'severity': level, 'message': message}
+                for metric, value, level, message in issues
+            ],
+            'measurement': {
+                name: measurement.get(name)
+                for name in ('ph', 'redox', 'temperature', 'salt', 'alarm', 'warning', 'alarm_redox')
+            },
+            'source': 'raspberry_pi',
+        }
+
+    def get_stats(self):
+        return {
+            'evaluated': self.evaluated,
+            'alerts': dict(self.alerts),
+            'in_cooldown': self.in_cooldown,
+            'regulator_thresholds': sorted(self.settings),
+        }
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark du décodage des trames
+
+Compare l'ancien process_trame (dict construit champ par champ via
+bytes_to_double) au décodeur construit à partir des tables de
+pool_protocol.decoder, à l'enregistrement compact Measurement et au
+décodage par lots en colonnes (decode_batch).
+
+Usage: python3 benchmarks/bench_decoder.py [--frames 100000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pool_protocol import Measurement, calculate_crc, decode_batch, decode_frame  # noqa: E402
+
+
+def build_frames(count, mnemos, seed=42):
+    rng = random.Random(seed)
+    frames = []
+    for _ in range(count):
+        frame = bytearray([0x2A, ord(rng.choice(mnemos))])
+        frame.extend(rng.randrange(256) for _ in range(13))
+        frame.append(calculate_crc(frame))
+        frame.append(0x2A)
+        frames.append(bytes(frame))
+    return frames
+
+
+def bytes_to_double(high_byte, low_byte):
+    return (high_byte << 8) + low_byte
+
+
+def legacy_process_trame(trame):
+    """Ancien décodage (trame M uniquement), sans l'horodatage"""
+    if len(trame) < 17:
+        return None
+    mnemo = chr(trame[1])
+    if mnemo == 'M':
+        return {
+            'ph': round(bytes_to_double(trame[2], trame[3]) / 100.0, 2),
+            'redox': round(bytes_to_double(trame[4], trame[5]), 0),
+            'temperature': round(bytes_to_double(trame[6], trame[7]) / 10.0, 1),
+            'salt': round(bytes_to_double(trame[8], trame[9]) / 10.0, 1),
+            'alarm': trame[10],
+            'warning': trame[11] & 15,
+            'alarm_redox': trame[11] >> 4,
+            'regulator_type': trame[12] & 15,
+            'pump_plus_active': bool(trame[12] & 0x80),
+            'pump_minus_active': bool(trame[12] & 0x40),
+            'pump_chlore_active': bool(trame[12] & 0x20),
+            'filter_relay_active': bool(trame[12] & 0x10)
+        }
+    return None
+
+
+def bench(func, frames, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for frame in frames:
+            func(frame)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_batch(data, mnemo, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        decode_batch(data, mnemo)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--frames', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    m_frames = build_frames(args.frames, 'M')
+    mixed_frames = build_frames(args.frames, 'MSDEA')
+
+    results = (
+        ('process_trame (ancien), M', bench(legacy_process_trame, m_frames, args.repeat), '12 champs'),
+        ('decode_frame, M', bench(decode_frame, m_frames, args.repeat), '20 champs'),
+        ('decode_frame, M/S/D/E/A', bench(decode_frame, mixed_frames, args.repeat), 'toutes trames'),
+        ('Measurement.from_frame, M', bench(Measurement.from_frame, m_frames, args.repeat), 'tuple nommé'),
+        ('decode_batch, M', bench_batch(b''.join(m_frames), 'M', args.repeat), 'colonnes, CRC vérifié'),
+    )
+    for name, elapsed, note in results:
+        print(f"{name:28s} {elapsed * 1000:8.1f} ms  {elapsed / args.frames * 1e6:6.3f} µs/trame  ({note})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark du découpage des trames BLE
+
+Compare l'ancien parse_buffer (reparcours complet du buffer, une trame au
+plus par notification) au FrameDecoder incrémental, sur un flux bruité et
+fragmenté comme celui reçu en notifications BLE.
+
+Usage: python3 benchmarks/bench_framing.py [--frames 20000] [--noise 0.3]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pool_protocol import FrameDecoder, calculate_crc  # noqa: E402
+
+
+def build_frame(rng, mnemo='M'):
+    frame = bytearray([0x2A, ord(mnemo)])
+    frame.extend(rng.randrange(256) for _ in range(13))
+    frame.append(calculate_crc(frame))
+    frame.append(0x2A)
+    return bytes(frame)
+
+
+def build_notifications(frame_count, noise, max_chunk, seed=42):
+    """Flux de trames entrecoupé de bruit (et de trames à CRC faux), découpé en notifications"""
+    rng = random.Random(seed)
+    stream = bytearray()
+    for _ in range(frame_count):
+        if rng.random() < noise:
+            stream.extend(rng.randrange(256) for _ in range(rng.randrange(1, 12)))
+        if rng.random() < noise / 10:
+            corrupted = bytearray(build_frame(rng))
+            corrupted[15] ^= 0xFF
+            stream.extend(corrupted)
+        stream.extend(build_frame(rng))
+
+    notifications = []
+    i = 0
+    while i < len(stream):
+        size = rng.randrange(1, max_chunk + 1)
+        notifications.append(bytes(stream[i:i + size]))
+        i += size
+    return notifications
+
+
+class LegacyParser:
+    """Reproduction de l'ancien PoolRegulatorMonitor.parse_buffer"""
+
+    def __init__(self):
+        self.ble_buffer = bytearray()
+
+    def calculate_crc(self, data):
+        crc = 0
+        for byte in data:
+            crc ^= byte
+        return crc
+
+    def parse_buffer(self):
+        if len(self.ble_buffer) < 17:
+            return None
+        for i in range(len(self.ble_buffer) - 16):
+            if self.ble_buffer[i] == 0x2A and self.ble_buffer[i + 16] == 0x2A:
+                trame = self.ble_buffer[i:i + 17]
+                if self.calculate_crc(trame[:15]) == trame[15]:
+                    self.ble_buffer = self.ble_buffer[i + 17:]
+                    return trame
+        if len(self.ble_buffer) > 500:
+            self.ble_buffer = self.ble_buffer[-100:]
+        return None
+
+
+def run_legacy(notifications):
+    parser = LegacyParser()
+    frames = 0
+    for data in notifications:
+        parser.ble_buffer.extend(data)
+        if parser.parse_buffer():
+            frames += 1
+    return frames
+
+
+def run_decoder(notifications):
+    decoder = FrameDecoder()
+    frames = 0
+    for data in notifications:
+        for _ in decoder.feed(data):
+            frames += 1
+    return frames, decoder.get_stats()
+
+
+def bench(func, notifications, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(notifications)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--frames', type=int, default=20000)
+    parser.add_argument('--noise', type=float, default=0.3, help="probabilité de bruit avant chaque trame")
+    parser.add_argument('--max-chunk', type=int, default=40, help="taille max d'une notification (octets)")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    notifications = build_notifications(args.frames, args.noise, args.max_chunk)
+    total_bytes = sum(len(n) for n in notifications)
+    print(f"{args.frames} trames, {len(notifications)} notifications, {total_bytes} octets (bruit={args.noise})")
+
+    legacy_time, legacy_frames = bench(run_legacy, notifications, args.repeat)
+    decoder_time, (decoder_frames, stats) = bench(run_decoder, notifications, args.repeat)
+
+    for name, elapsed, frames in (
+        ('parse_buffer (ancien)', legacy_time, legacy_frames),
+        ('FrameDecoder', decoder_time, decoder_frames),
+    ):
+        print(f"{name:24s} {elapsed * 1000:8.1f} ms  {frames:6d} trames  "
+              f"{total_bytes / elapsed / 1e6:6.2f} Mo/s  {elapsed / max(frames, 1) * 1e6:6.2f} µs/trame")
+    print(f"Compteurs FrameDecoder: {stats}")
+
+
+if __name__ == '__main__':
+    main()
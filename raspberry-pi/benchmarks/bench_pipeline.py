@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Banc de performance de bout en bout du moniteur
+
+Mesure les chemins critiques de bluetooth_monitor_cloud sans matériel, avec
+le régulateur simulé (simulator.py) et une API factice locale à la place de
+API_URL :
+
+- framing : FrameDecoder.feed sur des notifications fragmentées et bruitées
+- process_trame : décodage d'une trame M en mesure
+- send_to_api : distribution aux destinations (sérialisation JSON + écriture dans l'outbox), et corps gzip d'un lot
+- pipeline : notification -> outbox -> POST reçu par l'API (débit et latence)
+- reconnect : déconnexion -> connexion rétablie, via PoolRegulatorMonitor.run()
+
+Les résultats (percentiles en µs ou ms, débits) sont écrits en JSON et
+comparés à une référence enregistrée : toute dégradation au-delà de la
+tolérance fait échouer le script (code de sortie 1).
+
+Usage: python3 benchmarks/bench_pipeline.py [--output results.json]
+       python3 benchmarks/bench_pipeline.py --save-baseline benchmarks/baseline.json
+       python3 benchmarks/bench_pipeline.py --baseline benchmarks/baseline.json [--tolerance 0.25]
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+RASPBERRY_PI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, RASPBERRY_PI_DIR)
+
+# Configuration lue à l'import du moniteur : tout dans un répertoire temporaire
+WORKDIR = tempfile.mkdtemp(prefix='pool-bench-')
+os.environ.update({
+    'LOG_FILE': os.path.join(WORKDIR, 'monitor.log'),
+    'LOG_LEVEL': 'WARNING',
+    'BLE_STATE_PATH': os.path.join(WORKDIR, 'ble_state.json'),
+    'MEASUREMENT_INTERVAL': '1',
+    'FAST_MEASUREMENT_INTERVAL': '1',
+    'SLOW_MEASUREMENT_INTERVAL': '1',
+})
+
+import ble_scanner  # noqa: E402
+import bluetooth_monitor_cloud as monitor_module  # noqa: E402
+from outbox import Outbox  # noqa: E402
+from pool_protocol import FrameDecoder, decode_measurements  # noqa: E402
+from pool_protocol.wire import CONTENT_TYPE as FRAMES_CONTENT_TYPE  # noqa: E402
+from simulator import RegulatorSimulator, install  # noqa: E402
+from timeseries import TimeSeriesStore  # noqa: E402
+from uploader import ApiUploader  # noqa: E402
+
+# Métrique comparée à la référence pour chaque banc, et sens de l'amélioration
+COMPARED = {
+    'framing': ('p50_us', 'lower'),
+    'process_trame': ('p50_us', 'lower'),
+    'send_to_api': ('p50_us', 'lower'),
+    'batch_body': ('p50_us', 'lower'),
+    'pipeline_throughput': ('measurements_per_s', 'higher'),
+    'pipeline_latency': ('p50_ms', 'lower'),
+    'reconnect': ('p50_ms', 'lower'),
+}
+
+
+def percentiles(samples, unit, scale):
+    """Résumé d'une série de durées (secondes) : percentiles dans l'unité demandée"""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+
+    def at(q):
+        return round(ordered[min(last, int(q * len(ordered)))] * scale, 3)
+
+    return {
+        'count': len(ordered),
+        f'mean_{unit}': round(sum(ordered) / len(ordered) * scale, 3),
+        f'p50_{unit}': at(0.50),
+        f'p90_{unit}': at(0.90),
+        f'p99_{unit}': at(0.99),
+        f'max_{unit}': round(ordered[-1] * scale, 3),
+    }
+
+
+def time_per_op(func, items, chunk=100):
+    """Durée par opération, mesurée par paquets de `chunk` appels (coût de l'horloge amorti)"""
+    samples = []
+    for i in range(0, len(items) - chunk + 1, chunk):
+        block = items[i:i + chunk]
+        start = time.perf_counter()
+        for item in block:
+            func(item)
+        samples.append((time.perf_counter() - start) / chunk)
+    return samples
+
+
+def make_monitor(uploader, scanner, timeseries):
+    monitor = monitor_module.PoolRegulatorMonitor(uploader, scanner, timeseries)
+    # État BLE partagé entre les bancs : chaque banc part d'un régulateur inconnu
+    monitor.device_cache.address = None
+    return monitor
+
+
+# ==================== MICROBENCHS ====================
+
+def bench_framing(frames, noise):
+    simulator = RegulatorSimulator(max_chunk=7, noise=noise, crc_error_rate=noise / 10, seed=1)
+    notifications = [chunk for _ in range(frames) for chunk in simulator.notifications(simulator.frame('M'))]
+    decoder = FrameDecoder()
+
+    def feed(data):
+        for _ in decoder.feed(data):
+            pass
+
+    samples = time_per_op(feed, notifications)
+    result = percentiles(samples, 'us', 1e6)
+    result['notifications'] = len(notifications)
+    result['decoder'] = decoder.get_stats()
+    return result
+
+
+def bench_process_trame(monitor, frames):
+    simulator = RegulatorSimulator(seed=2)
+    trames = [simulator.frame('M') for _ in range(frames)]
+    return percentiles(time_per_op(monitor.process_trame, trames), 'us', 1e6)
+
+
+def bench_send_to_api(monitor, frames):
+    """submit() = sérialisation JSON de la mesure + INSERT SQLite (commit groupé)"""
+    simulator = RegulatorSimulator(seed=3)
+    measurements = [monitor.process_trame(simulator.frame('M')) for _ in range(frames)]
+    samples = time_per_op(lambda data: monitor.sinks.submit(data, data), measurements)
+    monitor.uploader.outbox.flush()
+    return percentiles(samples, 'us', 1e6)
+
+
+def bench_batch_body(monitor, batch_size, repeat=200):
+    """Corps d'un POST /measurements/batch : JSON + gzip, par mesure"""
+    simulator = RegulatorSimulator(seed=4)
+    payloads = [monitor.process_trame(simulator.frame('M')) for _ in range(batch_size)]
+    for payload in payloads:
+        payload['idempotency_key'] = os.urandom(16).hex()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        gzip.compress(json.dumps({'measurements': payloads}).encode('utf-8'), compresslevel=6)
+        samples.append((time.perf_counter() - start) / batch_size)
+    return percentiles(samples, 'us', 1e6)
+
+
+# ==================== BOUT EN BOUT ====================
+
+async def start_sink(latencies):
+    """API factice : note, pour chaque mesure reçue, le délai depuis son horodatage"""
+    from aiohttp import web
+
+    async def measurements(request):
+        if request.content_type == FRAMES_CONTENT_TYPE:
+            batch = decode_measurements(await request.read())
+        else:
+            body = await request.json()
+            batch = body.get('measurements', [body])
+        received = time.time()
+        for measurement in batch:
+            ts = datetime.fromisoformat(measurement['timestamp']).replace(tzinfo=timezone.utc).timestamp()
+            latencies.append(received - ts)
+        return web.json_response({'success': True})
+
+    async def accepted(request):
+        await request.read()
+        return web.json_response({'success': True})
+
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app.router.add_post('/api/measurements', measurements)
+    app.router.add_post('/api/measurements/batch', measurements)
+    app.router.add_post('/api/error-logs', accepted)
+    app.router.add_post('/api/error-logs/batch', accepted)
+    app.router.add_post('/api/alerts', accepted)
+    app.router.add_post('/api/daily-averages', accepted)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{port}/api'
+
+
+async def run_monitor(simulator, name, duration, batch_size, batch_max_age, on_monitor=None):
+    """Lance PoolRegulatorMonitor.run() contre `simulator` pendant `duration` secondes"""
+    latencies = []
+    runner, api = await start_sink(latencies)
+    outbox = Outbox(os.path.join(WORKDIR, f'{name}.db'))
+    outbox.open()
+    uploader = ApiUploader(f'{api}/measurements', f'{api}/error-logs', outbox,
+                           batch_size=batch_size, batch_max_age=batch_max_age,
+                           wire_format=os.environ.get('WIRE_FORMAT', 'json'))
+    await uploader.start()
+    timeseries = TimeSeriesStore(os.path.join(WORKDIR, name))
+    timeseries.open()
+    scanner = ble_scanner.RegulatorScanner()
+    install([simulator], monitor_module, ble_scanner)
+    monitor = make_monitor(uploader, scanner, timeseries)
+    monitor.address = simulator.address
+    if on_monitor:
+        on_monitor(monitor)
+
+    started = time.perf_counter()
+    task = asyncio.create_task(monitor.run())
+    await asyncio.sleep(duration)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    # Dernier lot : laisse le drain vider l'outbox
+    deadline = time.monotonic() + batch_max_age + 5
+    while outbox.depth() and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - started
+
+    await uploader.stop()
+    outbox.close()
+    timeseries.close()
+    await runner.cleanup()
+    return monitor, latencies, elapsed
+
+
+async def bench_pipeline(push_rate, duration, batch_size):
+    simulator = RegulatorSimulator(address='5E:00:00:00:00:10', max_chunk=10, push_rate=push_rate, seed=5)
+    monitor, latencies, elapsed = await run_monitor(simulator, 'pipeline', duration, batch_size, batch_max_age=1)
+    throughput = {
+        'push_rate': push_rate,
+        'frames_sent': simulator.frames,
+        'frames_decoded': monitor.frame_decoder.frames,
+        'measurements_uploaded': len(latencies),
+        'measurements_per_s': round(len(latencies) / elapsed, 1),
+    }
+    return throughput, percentiles(latencies, 'ms', 1e3)
+
+
+async def bench_reconnect(duration, every):
+    """Le simulateur coupe la liaison toutes les `every` trames ; run() doit se reconnecter"""
+    simulator = RegulatorSimulator(address='5E:00:00:00:00:20', disconnect_after=every, latency=0.01,
+                                   connect_delay=0.05, seed=6)
+    samples = []
+    state = {}
+
+    def instrument(monitor):
+        on_disconnect = monitor._on_disconnect
+        notification_handler = monitor.notification_handler
+
+        def timed_disconnect(client):
+            state['disconnected_at'] = time.perf_counter()
+            on_disconnect(client)
+
+        async def timed_handler(sender, data):
+            # Première donnée reçue après la reconnexion
+            disconnected_at = state.pop('disconnected_at', None)
+            if disconnected_at is not None:
+                samples.append(time.perf_counter() - disconnected_at)
+            await notification_handler(sender, data)
+
+        monitor._on_disconnect = timed_disconnect
+        monitor.notification_handler = timed_handler
+
+    await run_monitor(simulator, 'reconnect', duration, batch_size=100, batch_max_age=1, on_monitor=instrument)
+    result = percentiles(samples, 'ms', 1e3)
+    result['disconnects'] = simulator.disconnects
+    return result
+
+
+# ==================== RÉFÉRENCE ====================
+
+def compare(results, baseline, tolerance):
+    """Liste des dégradations au-delà de la tolérance (fraction) par rapport à la référence"""
+    regressions = []
+    for name, (metric, better) in COMPARED.items():
+        current = results.get(name, {}).get(metric)
+        reference = baseline.get('results', {}).get(name, {}).get(metric)
+        if current is None or not reference:
+            continue
+        change = (current - reference) / reference
+        worse = change > tolerance if better == 'lower' else change < -tolerance
+        status = 'DÉGRADÉ' if worse else 'ok'
+        print(f"  {name:20s} {metric:20s} {reference:>12} -> {current:>12} ({change:+.1%}) {status}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+async def run(args):
+    scanner = ble_scanner.RegulatorScanner()
+    outbox = Outbox(os.path.join(WORKDIR, 'micro.db'))
+    outbox.open()
+    uploader = ApiUploader('http://127.0.0.1:9/api/measurements', 'http://127.0.0.1:9/api/error-logs', outbox)
+    monitor = make_monitor(uploader, scanner, None)
+
+    results = {}
+    print("Microbenchs...")
+    results['framing'] = bench_framing(args.frames, args.noise)
+    results['process_trame'] = bench_process_trame(monitor, args.frames)
+    results['send_to_api'] = bench_send_to_api(monitor, min(args.frames, 20000))
+    results['batch_body'] = bench_batch_body(monitor, args.batch_size)
+    outbox.close()
+
+    print(f"Pipeline complet ({args.push_rate} trames/s pendant {args.duration}s)...")
+    results['pipeline_throughput'], results['pipeline_latency'] = await bench_pipeline(
+        args.push_rate, args.duration, args.batch_size
+    )
+    print(f"Reconnexions ({args.duration}s)...")
+    results['reconnect'] = await bench_reconnect(args.duration, args.disconnect_every)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--frames', type=int, default=50000)
+    parser.add_argument('--noise', type=float, default=0.3)
+    parser.add_argument('--push-rate', type=float, default=2000, help="trames M par seconde pour le pipeline")
+    parser.add_argument('--duration', type=float, default=10.0, help="durée des bancs de bout en bout (s)")
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--disconnect-every', type=int, default=5, help="trames entre deux déconnexions")
+    parser.add_argument('--output', help="fichier JSON des résultats (défaut : sortie standard)")
+    parser.add_argument('--baseline', help="référence à comparer")
+    parser.add_argument('--save-baseline', help="enregistre les résultats comme nouvelle référence")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="dégradation tolérée (fraction)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    report = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'node': platform.node(),
+            'args': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline', 'save_baseline')},
+        },
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            f.write(text)
+        print(f"Référence enregistrée: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Comparaison avec {args.baseline} (tolérance {args.tolerance:.0%}):")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Dégradations: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Scan BLE partagé entre plusieurs régulateurs
+
+Un seul adaptateur ne peut mener qu'une recherche à la fois : les moniteurs
+qui cherchent leur régulateur s'inscrivent auprès d'un scan commun, arrêté
+dès que plus personne n'attend. Chaque appareil trouvé est réservé au
+moniteur qui l'a demandé, pour que deux moniteurs ne se connectent pas au
+même régulateur.
+"""
+
+import asyncio
+import logging
+
+from bleak import BleakScanner
+
+logger = logging.getLogger(__name__)
+
+
+class RegulatorScanner:
+    """Scan BLE unique, résolu appareil par appareil pour chaque demandeur"""
+
+    def __init__(self, poll_interval=0.2):
+        self.poll_interval = poll_interval
+        self._waiters = []      # [(match, owner, future)]
+        self._claimed = {}      # adresse -> propriétaire
+        self._task = None
+
+        self.scans = 0
+
+    def claim(self, address, owner):
+        """Réserve une adresse (régulateur configuré ou déjà connecté)"""
+        if address:
+            self._claimed[address.upper()] = owner
+
+    def is_available(self, address, owner):
+        return self._claimed.get(address.upper(), owner) == owner
+
+    async def find(self, match, owner=None, timeout=15.0):
+        """Premier appareil non réservé par un autre moniteur pour lequel match(device, adv) est vrai
+
+        Retourne None après `timeout` secondes sans correspondance.
+        """
+        future = asyncio.get_running_loop().create_future()
+        waiter = (match, owner, future)
+        self._waiters.append(waiter)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._scan())
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._waiters.remove(waiter)
+
+    def _on_detection(self, device, advertisement):
+        for match, owner, future in self._waiters:
+            if future.done() or not self.is_available(device.address, owner):
+                continue
+            if match(device, advertisement):
+                self.claim(device.address, owner)
+                future.set_result(device)
+                break
+
+    async def _scan(self):
+        """Scan actif tant qu'au moins un moniteur attend un appareil"""
+        self.scans += 1
+        try:
+            async with BleakScanner(detection_callback=self._on_detection):
+                while any(not future.done() for _, _, future in self._waiters):
+                    await asyncio.sleep(self.poll_interval)
+        except Exception as e:
+            logger.error(f"Erreur du scan BLE: {e}")
+            for _, _, future in self._waiters:
+                if not future.done():
+                    future.set_exception(e)
+                    future.exception()
+
+        # Demande arrivée pendant l'arrêt du scan : on relance
+        if any(not future.done() for _, _, future in self._waiters):
+            self._task = asyncio.create_task(self._scan())
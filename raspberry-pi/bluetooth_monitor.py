@@ -14,6 +14,8 @@ from bleak import BleakClient, BleakScanner
 import requests
 from requests.exceptions import RequestException
 
+from pool_protocol import FrameDecoder, calculate_crc, decode_frame
+
 # Configuration
 BT_NAMES = ["CORELEC Regulateur", "REGUL."]
 BT_UART_SERVICE = "0bd51666-e7cb-469b-8e4d-2742f1ba77cc"
@@ -35,7 +37,8 @@ logger = logging.getLogger(__name__)
 class PoolRegulatorMonitor:
     def __init__(self):
         self.client = None
-        self.ble_buffer = bytearray()
+        self.frame_decoder = FrameDecoder()
+        self.regulator_state = {}
         self.is_connected = False
         
     async def find_regulator(self):
@@ -69,75 +72,27 @@ class PoolRegulatorMonitor:
     
     async def notification_handler(self, sender, data):
         """Gestionnaire des notifications Bluetooth"""
-        self.ble_buffer.extend(data)
-        
-        # Recherche d'une trame complète
-        trame = self.parse_buffer()
-        if trame:
+        # Toutes les trames complètes de la notification sont traitées
+        for trame in self.frame_decoder.feed(data):
             logger.debug(f"Trame reçue: {trame.hex()}")
             pool_data = self.process_trame(trame)
             if pool_data:
                 await self.send_to_api(pool_data)
     
-    def parse_buffer(self):
-        """Analyse du buffer pour extraire une trame complète"""
-        if len(self.ble_buffer) < 17:
-            return None
-        
-        # Recherche du début de trame (0x2A) et fin (0x2A à la position 16)
-        for i in range(len(self.ble_buffer) - 16):
-            if self.ble_buffer[i] == 0x2A and self.ble_buffer[i + 16] == 0x2A:
-                trame = self.ble_buffer[i:i + 17]
-                
-                # Vérification du CRC
-                if self.calculate_crc(trame[:15]) == trame[15]:
-                    # Suppression de la trame traitée du buffer
-                    self.ble_buffer = self.ble_buffer[i + 17:]
-                    return trame
-        
-        # Nettoyage du buffer si trop gros
-        if len(self.ble_buffer) > 500:
-            self.ble_buffer = self.ble_buffer[-100:]
-        
-        return None
-    
-    def calculate_crc(self, data):
-        """Calcul du CRC"""
-        crc = 0
-        for byte in data:
-            crc ^= byte
-        return crc
-    
-    def bytes_to_double(self, high_byte, low_byte):
-        """Conversion de 2 bytes en double"""
-        return (high_byte << 8) + low_byte
-    
     def process_trame(self, trame):
-        """Traitement d'une trame reçue"""
-        if len(trame) < 17:
+        """Traitement d'une trame reçue : retourne les mesures (trame M), mémorise les autres"""
+        fields = decode_frame(trame)
+        if fields is None:
             return None
         
         mnemo = chr(trame[1])
+        if mnemo != 'M':
+            # Consignes, seuils et électrolyse (S, D, E, A...) : état courant du régulateur
+            self.regulator_state[mnemo] = fields
+            logger.debug(f"Trame {mnemo}: {fields}")
+            return None
         
-        # Traitement selon le type de trame
-        if mnemo == 'M':  # Trame des mesures principales
-            return {
-                'timestamp': datetime.utcnow().isoformat(),
-                'ph': self.bytes_to_double(trame[2], trame[3]) / 100.0,
-                'redox': self.bytes_to_double(trame[4], trame[5]),
-                'temperature': self.bytes_to_double(trame[6], trame[7]) / 10.0,
-                'salt': self.bytes_to_double(trame[8], trame[9]) / 10.0,
-                'alarm': trame[10],
-                'warning': trame[11] & 15,
-                'alarm_redox': trame[11] >> 4,
-                'regulator_type': trame[12] & 15,
-                'pump_plus_active': bool(trame[12] & 0x80),
-                'pump_minus_active': bool(trame[12] & 0x40),
-                'pump_chlore_active': bool(trame[12] & 0x20),
-                'filter_relay_active': bool(trame[12] & 0x10)
-            }
-        
-        return None
+        return {'timestamp': datetime.utcnow().isoformat(), **fields}
     
     async def send_to_api(self, data):
         """Envoi des données vers l'API"""
@@ -164,7 +119,7 @@ class PoolRegulatorMonitor:
         
         # Création de la trame de commande
         cmd_frame = bytearray([0x2A, 0x52, 0x3F, ord(command), 0xFF, 0x2A])
-        cmd_frame[4] = self.calculate_crc(cmd_frame[:4])
+        cmd_frame[4] = calculate_crc(cmd_frame[:4])
         
         try:
             await self.client.write_gatt_char(BT_UART_CHARACTERISTIC, cmd_frame)
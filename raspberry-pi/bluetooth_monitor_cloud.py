@@ -11,26 +11,122 @@ import logging
 import json
 import time
 import os
-from datetime import datetime, time as dt_time, timedelta
-from bleak import BleakClient, BleakScanner
-import requests
-from requests.exceptions import RequestException
+import signal
+from datetime import datetime, time as dt_time
+from bleak import BleakClient
+
+from alerts import ALERT_COOLDOWN, AlertEngine
+from ble_scanner import RegulatorScanner
+from capture import CaptureWriter
+from change_filter import DEFAULT_DEADBANDS, ChangeFilter, parse_deadbands
+from command_scheduler import CommandScheduler
+from device_cache import DeviceCache
+from local_api import LocalApiServer, RecentMeasurements
+from memory_profiling import MIB, MemoryProfiler, rss_bytes
+from metrics import DECODE_BOUNDS, RECONNECT_BOUNDS, LatencyHistogram, LoopLagMonitor, MetricsServer
+from outbox import Outbox
+from polling import PollingPolicy
+from rollups import RollupTracker
+from pool_protocol import FrameDecoder, calculate_crc, decode_frame
+from sinks import NAMES as SINK_NAMES, ApiSink, FileSink, FirestoreSink, MqttSink, SinkFanOut
+from timeseries import TimeSeriesStore
+from uploader import ApiUploader
 
 # Configuration
 BT_NAMES = ["CORELEC Regulateur", "REGUL."]
 BT_UART_SERVICE = "0bd51666-e7cb-469b-8e4d-2742f1ba77cc"
 BT_UART_CHARACTERISTIC = "e7add780-b042-4876-aae1-112855353cc1"
 
+# Régulateurs supervisés : "id=adresse" ou "id" seul (premier régulateur trouvé), séparés par des virgules
+# Vide : un seul régulateur, recherché par son nom
+REGULATORS = os.getenv('REGULATORS', '')
+
+# Dernier régulateur connecté (adresse + handle UART) : reconnexion directe sans scan
+BLE_STATE_PATH = os.getenv('BLE_STATE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ble_state.json'))
+BLE_CONNECT_TIMEOUT = float(os.getenv('BLE_CONNECT_TIMEOUT', 10))  # secondes
+
 # URL de l'API cloud - À modifier avec votre URL Vercel
 API_URL = os.getenv('API_URL', 'https://votre-api.vercel.app/api/measurements')
 ERROR_LOG_URL = os.getenv('ERROR_LOG_URL', API_URL.replace('/measurements', '/error-logs'))
+# Sondage adaptatif (voir polling.py) : intervalle de base, rapide (pompes en marche, valeurs en mouvement),
+# maximal quand les valeurs sont stables, et de veille quand la filtration est arrêtée
 MEASUREMENT_INTERVAL = int(os.getenv('MEASUREMENT_INTERVAL', 30))  # secondes
+FAST_MEASUREMENT_INTERVAL = int(os.getenv('FAST_MEASUREMENT_INTERVAL', 10))  # secondes
+SLOW_MEASUREMENT_INTERVAL = int(os.getenv('SLOW_MEASUREMENT_INTERVAL', 120))  # secondes
+IDLE_MEASUREMENT_INTERVAL = int(os.getenv('IDLE_MEASUREMENT_INTERVAL', 300))  # secondes
+POLL_BACKOFF = float(os.getenv('POLL_BACKOFF', 1.5))  # allongement de l'intervalle à chaque mesure stable
+
+# Envoi sur changement : tolérance par mesure ("ph=0.05,redox=10,...") ; vide = toutes les mesures envoyées
+DEADBANDS = os.getenv('DEADBANDS')
+HEARTBEAT_INTERVAL = float(os.getenv('HEARTBEAT_INTERVAL', 300))  # secondes sans envoi au maximum
+
+# Alertes évaluées sur le Pi (mêmes règles que api-cloud, seuils du régulateur) ; 0 = évaluation cloud seule
+LOCAL_ALERTS = int(os.getenv('LOCAL_ALERTS', 1))
+ALERT_SUSTAIN = float(os.getenv('ALERT_SUSTAIN', 600))  # secondes de dépassement avant une alerte "warning"
+ALERT_COOLDOWN_SECONDS = float(os.getenv('ALERT_COOLDOWN', ALERT_COOLDOWN))
+
+# Commandes : attente de la trame réponse, renvois, espacement minimal entre deux écritures BLE
+COMMAND_TIMEOUT = float(os.getenv('COMMAND_TIMEOUT', 2.0))  # secondes
+COMMAND_RETRIES = int(os.getenv('COMMAND_RETRIES', 2))
+COMMAND_SPACING = float(os.getenv('COMMAND_SPACING', 0.2))  # secondes
+MAX_MISSED_REPLIES = 3  # réponses M manquées d'affilée avant reconnexion
 API_TIMEOUT = int(os.getenv('API_TIMEOUT', 15))  # secondes
 MAX_RETRIES = int(os.getenv('MAX_RETRIES', 3))
 
-# Horaires de fonctionnement (7h - 21h)
-OPERATION_START_HOUR = int(os.getenv('OPERATION_START_HOUR', 7))
-OPERATION_END_HOUR = int(os.getenv('OPERATION_END_HOUR', 21))
+# Logs d'erreur : agrégés par type sur une fenêtre, puis envoyés par lots (au plus ERROR_LOG_RATE requêtes
+# par minute, rafales de ERROR_LOG_BURST) via l'outbox et la session HTTP des mesures
+ERROR_LOG_WINDOW = int(os.getenv('ERROR_LOG_WINDOW', 60))  # secondes
+ERROR_LOG_RATE = float(os.getenv('ERROR_LOG_RATE', 6))  # requêtes par minute
+ERROR_LOG_BURST = int(os.getenv('ERROR_LOG_BURST', 3))
+
+# Outbox persistante : les mesures survivent aux pannes d'API et aux redémarrages
+OUTBOX_PATH = os.getenv('OUTBOX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'outbox.db'))
+OUTBOX_MAX_ROWS = int(os.getenv('OUTBOX_MAX_ROWS', 100000))  # ~35 jours à 30s
+
+# Envoi par lots : un POST pour UPLOAD_BATCH_SIZE mesures, ou dès que la plus ancienne a UPLOAD_BATCH_MAX_AGE secondes
+UPLOAD_BATCH_SIZE = int(os.getenv('UPLOAD_BATCH_SIZE', 100))
+UPLOAD_BATCH_MAX_AGE = int(os.getenv('UPLOAD_BATCH_MAX_AGE', 60))
+# Format des envois : 'json', ou 'frames' (binaire compact, ~12x plus petit, pour les liaisons 4G facturées)
+WIRE_FORMAT = os.getenv('WIRE_FORMAT', 'json')
+
+# Destinations des mesures, séparées par des virgules : api, file, mqtt, firestore (voir sinks.py)
+SINKS = os.getenv('SINKS', 'api')
+SINK_QUEUE_SIZE = int(os.getenv('SINK_QUEUE_SIZE', 10000))  # mesures en attente par destination
+SINK_FILE_PATH = os.getenv('SINK_FILE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'export'))
+MQTT_HOST = os.getenv('MQTT_HOST', 'localhost')
+MQTT_PORT = int(os.getenv('MQTT_PORT', 1883))
+MQTT_PREFIX = os.getenv('MQTT_PREFIX', 'pool')
+MQTT_QOS = int(os.getenv('MQTT_QOS', 1))
+MQTT_INFLIGHT = int(os.getenv('MQTT_INFLIGHT', 20))  # publications QoS 1 en attente d'acquittement
+MQTT_USERNAME = os.getenv('MQTT_USERNAME') or None
+MQTT_PASSWORD = os.getenv('MQTT_PASSWORD') or None
+FIRESTORE_COLLECTION = os.getenv('FIRESTORE_COLLECTION', 'pool_data')
+
+# Historique local (mesures brutes journalières + agrégats 1 min / 15 min / 1 h), consultable hors ligne
+TIMESERIES_PATH = os.getenv('TIMESERIES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'timeseries'))
+TIMESERIES_RAW_DAYS = int(os.getenv('TIMESERIES_RAW_DAYS', 90))  # les agrégats sont conservés sans limite
+
+# Agrégats horaires / journaliers / 24 h glissantes tenus à jour à chaque mesure et transmis à l'API
+# (/daily-averages) ; instantané de l'heure et du jour en cours toutes les ROLLUP_SNAPSHOT_INTERVAL secondes
+ROLLUP_STATE_PATH = os.getenv('ROLLUP_STATE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'rollups.json'))
+ROLLUP_SNAPSHOT_INTERVAL = float(os.getenv('ROLLUP_SNAPSHOT_INTERVAL', 900))  # secondes ; 0 = tranches terminées seules
+
+# Journal des trames brutes (rejeu, correction du décodage après coup, voir capture.py) ; vide = désactivé
+CAPTURE_PATH = os.getenv('CAPTURE_PATH', '')
+
+# API HTTP locale (/latest, /stats, /chart-data) servie depuis la mémoire ; 0 = désactivée
+LOCAL_API_PORT = int(os.getenv('LOCAL_API_PORT', 0))
+LOCAL_API_HOST = os.getenv('LOCAL_API_HOST', '0.0.0.0')
+
+# Métriques Prometheus (/metrics) ; 0 = désactivées
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+METRICS_HOST = os.getenv('METRICS_HOST', '0.0.0.0')
+
+# Diagnostic des fuites mémoire (voir memory_profiling.py) : instantanés tracemalloc comparés toutes les
+# MEMORY_PROFILE_INTERVAL secondes ; démarré/arrêté par SIGUSR1, ou dès le lancement avec MEMORY_PROFILE=1
+MEMORY_PROFILE = int(os.getenv('MEMORY_PROFILE', 0))
+MEMORY_PROFILE_INTERVAL = float(os.getenv('MEMORY_PROFILE_INTERVAL', 300))  # secondes
+MEMORY_PROFILE_TOP = int(os.getenv('MEMORY_PROFILE_TOP', 10))  # sites d'allocation par rapport
 
 # Configuration du logging
 log_level = os.getenv('LOG_LEVEL', 'INFO')
@@ -38,122 +134,261 @@ logging.basicConfig(
     level=getattr(logging, log_level.upper()),
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler('/var/log/pool_monitor_cloud.log'),
+        logging.FileHandler(os.getenv('LOG_FILE', '/var/log/pool_monitor_cloud.log')),
         logging.StreamHandler()
     ]
 )
 logger = logging.getLogger(__name__)
 
+
+def parse_regulators(value):
+    """REGULATORS="piscine=80:4B:50:D0:53:49,spa" -> [('piscine', '80:4B:50:D0:53:49'), ('spa', None)]"""
+    regulators = []
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        regulator_id, _, address = entry.partition('=')
+        regulators.append((regulator_id.strip(), address.strip().upper() or None))
+    # Mode historique : un seul régulateur sans identifiant
+    return regulators or [(None, None)]
+
+
+class _RegulatorLogAdapter(logging.LoggerAdapter):
+    """Préfixe les messages par l'identifiant du régulateur"""
+
+    def process(self, msg, kwargs):
+        return f"[{self.extra['regulator_id']}] {msg}", kwargs
+
+
+def build_sinks(uploader, names):
+    """Destinations configurées par SINKS (dans l'ordre donné)"""
+    sinks = []
+    for name in (n.strip() for n in names.split(',')):
+        if not name:
+            continue
+        if name == 'api':
+            sinks.append(ApiSink(uploader))
+        elif name == 'file':
+            sinks.append(FileSink(SINK_FILE_PATH, max_queue=SINK_QUEUE_SIZE))
+        elif name == 'mqtt':
+            sinks.append(MqttSink(MQTT_HOST, MQTT_PORT, MQTT_PREFIX, qos=MQTT_QOS, inflight=MQTT_INFLIGHT,
+                                  username=MQTT_USERNAME, password=MQTT_PASSWORD, max_queue=SINK_QUEUE_SIZE))
+        elif name == 'firestore':
+            # Identifiants : GOOGLE_APPLICATION_CREDENTIALS (ou FIRESTORE_EMULATOR_HOST)
+            import firebase_admin
+            from firebase_admin import firestore
+            if not firebase_admin._apps:
+                firebase_admin.initialize_app()
+            sinks.append(FirestoreSink(firestore.client(), FIRESTORE_COLLECTION, max_queue=SINK_QUEUE_SIZE))
+        else:
+            raise ValueError(f"Destination inconnue: {name} (valeurs possibles: {', '.join(SINK_NAMES)})")
+    return SinkFanOut(sinks)
+
+
 class PoolRegulatorMonitor:
-    def __init__(self):
+    def __init__(self, uploader, scanner, timeseries, recent=None, capture=None, sinks=None, rollups=None,
+                 regulator_id=None, address=None):
+        self.regulator_id = regulator_id
+        self.address = address
+        self.logger = logger if regulator_id is None else _RegulatorLogAdapter(logger, {'regulator_id': regulator_id})
+        # Un seul BleakClient par adresse, réutilisé d'une reconnexion à l'autre
         self.client = None
-        self.ble_buffer = bytearray()
+        self._client_device = None
+        self.uart_char = None
+        if regulator_id is None:
+            state_path = BLE_STATE_PATH
+        else:
+            root, ext = os.path.splitext(BLE_STATE_PATH)
+            state_path = f"{root}-{regulator_id}{ext}"
+        self.device_cache = DeviceCache(state_path)
+        self.device_cache.load()
+        if address and self.device_cache.address != address:
+            # Adresse configurée prioritaire sur l'état mémorisé
+            self.device_cache.address = address
+            self.device_cache.char_handle = None
+        self.scanner = scanner
+        self.scanner.claim(self.device_cache.address, self)
+        # Réveil de la boucle de monitoring : déconnexion, ou mesure demandant un sondage plus rapide
+        self._wakeup = asyncio.Event()
+        self.frame_decoder = FrameDecoder()
+        self.scheduler = CommandScheduler(
+            self.send_command,
+            timeout=COMMAND_TIMEOUT,
+            retries=COMMAND_RETRIES,
+            spacing=COMMAND_SPACING
+        )
+        self.regulator_state = {}
+        self.last_measurement = None
+        deadbands = DEFAULT_DEADBANDS if not DEADBANDS else parse_deadbands(DEADBANDS)
+        self.change_filter = None if DEADBANDS == '' else ChangeFilter(deadbands, heartbeat=HEARTBEAT_INTERVAL)
+        self.polling = PollingPolicy(
+            base=MEASUREMENT_INTERVAL,
+            fast=FAST_MEASUREMENT_INTERVAL,
+            slow=SLOW_MEASUREMENT_INTERVAL,
+            idle=IDLE_MEASUREMENT_INTERVAL,
+            backoff=POLL_BACKOFF,
+            deadbands=deadbands
+        )
+        self.alerts = AlertEngine(cooldown=ALERT_COOLDOWN_SECONDS, sustain=ALERT_SUSTAIN) if LOCAL_ALERTS else None
         self.is_connected = False
         self.failed_attempts = 0
-        self.last_successful_send = None
-        self.last_error_logged = None
-    
-    def is_operation_time(self):
-        """Vérifie si nous sommes dans les horaires de fonctionnement (7h-21h)"""
-        now = datetime.now()
-        current_hour = now.hour
-        return OPERATION_START_HOUR <= current_hour < OPERATION_END_HOUR
+        # Instrumentation (exportée par collect())
+        self.decode_latency = LatencyHistogram(DECODE_BOUNDS)
+        self.reconnect_latency = LatencyHistogram(RECONNECT_BOUNDS)
+        self.reconnects = 0
+        self._disconnected_at = None
+        # Partagés entre régulateurs : outbox, envoi et destinations ; propres à chacun : historique et mémoire récente
+        self.uploader = uploader
+        self.sinks = sinks if sinks is not None else SinkFanOut([ApiSink(uploader)])
+        self.timeseries = timeseries
+        self.recent = recent
+        self.capture = capture
+        self.rollups = rollups
+        self._last_snapshot = time.monotonic()
     
-    async def log_error_to_api(self, error_type, error_message, context=None):
-        """Envoie les erreurs vers l'API pour logging"""
-        try:
-            error_data = {
-                'timestamp': datetime.utcnow().isoformat(),
-                'error_type': error_type,
-                'error_message': str(error_message),
-                'context': context or {},
-                'source': 'raspberry_pi_monitor'
-            }
-            
-            response = requests.post(
-                ERROR_LOG_URL,
-                json=error_data,
-                timeout=API_TIMEOUT,
-                headers={
-                    'Content-Type': 'application/json',
-                    'User-Agent': 'PoolMonitor/1.0'
-                }
-            )
-            
-            if response.status_code in [200, 201]:
-                self.last_error_logged = datetime.now()
-                logger.debug(f"Erreur loggée dans l'API: {error_type}")
-            else:
-                logger.warning(f"Échec du logging d'erreur: {response.status_code}")
-                
-        except Exception as e:
-            logger.error(f"Erreur lors du logging d'erreur: {e}")
+    def log_error_to_api(self, error_type, error_message, context=None):
+        """Signale une erreur à l'API (agrégée par type, envoyée plus tard par l'uploader)"""
+        if self.regulator_id is not None:
+            context = {**(context or {}), 'regulator_id': self.regulator_id}
+        self.uploader.submit_error(error_type, error_message, context)
         
     async def find_regulator(self):
-        """Recherche le régulateur CORELEC"""
-        logger.info("Recherche du régulateur CORELEC...")
+        """Recherche le régulateur CORELEC (scan partagé, arrêté dès qu'il est vu)"""
+        self.logger.info("Recherche du régulateur CORELEC...")
         
         try:
-            devices = await BleakScanner.discover(timeout=15.0)
+            if self.address:
+                # Régulateur configuré : on attend son adresse, quel que soit son nom
+                device = await self.scanner.find(
+                    lambda d, adv: d.address.upper() == self.address, self, timeout=45.0
+                )
+                if device:
+                    self.logger.info(f"Régulateur trouvé: {device.name} ({device.address})")
+                    return device
+                raise Exception(f"Régulateur {self.address} introuvable")
             
-            for device in devices:
-                if device.name in BT_NAMES:
-                    logger.info(f"Régulateur trouvé: {device.name} ({device.address})")
-                    return device.address
+            device = await self.scanner.find(
+                lambda d, adv: (d.name or adv.local_name) in BT_NAMES, self, timeout=15.0
+            )
+            if device:
+                self.logger.info(f"Régulateur trouvé: {device.name} ({device.address})")
+                return device
             
             # Recherche étendue si aucun appareil trouvé
-            logger.warning("Aucun régulateur trouvé, recherche étendue...")
-            devices = await BleakScanner.discover(timeout=30.0)
+            self.logger.warning("Aucun régulateur trouvé, recherche étendue...")
+            
+            def is_candidate(d, adv):
+                name = (d.name or adv.local_name or '').lower()
+                return any(pattern in name for pattern in ['corelec', 'regul'])
             
-            for device in devices:
-                if device.name and any(name.lower() in device.name.lower() for name in ['corelec', 'regul']):
-                    logger.info(f"Régulateur potentiel trouvé: {device.name} ({device.address})")
-                    return device.address
+            device = await self.scanner.find(is_candidate, self, timeout=30.0)
+            if device:
+                self.logger.info(f"Régulateur potentiel trouvé: {device.name} ({device.address})")
+                return device
                     
         except Exception as e:
-            logger.error(f"Erreur lors de la recherche: {e}")
-            await self.log_error_to_api("bluetooth_search_error", str(e))
+            self.logger.error(f"Erreur lors de la recherche: {e}")
+            self.log_error_to_api("bluetooth_search_error", str(e))
         
         error_msg = "Aucun régulateur CORELEC trouvé"
-        await self.log_error_to_api("device_not_found", error_msg)
+        self.log_error_to_api("device_not_found", error_msg)
         raise Exception(error_msg)
     
-    async def connect(self, address):
-        """Connexion au régulateur avec retry"""
-        max_attempts = 3
+    async def connect_regulator(self):
+        """Connexion directe au dernier régulateur connu ; recherche BLE seulement en cas d'échec"""
+        if self.device_cache.address:
+            try:
+                await self.connect(self.device_cache.address, max_attempts=1)
+                return
+            except Exception as e:
+                self.logger.warning(f"Connexion directe impossible ({e}), nouvelle recherche du régulateur")
+        
+        device = await self.find_regulator()
+        await self.connect(device)
+    
+    def _on_disconnect(self, client):
+        """Callback bleak : réveille immédiatement la boucle de monitoring"""
+        if client is not self.client:
+            return
+        self.logger.warning("Régulateur déconnecté")
+        self.is_connected = False
+        self._disconnected_at = time.monotonic()
+        self._wakeup.set()
+    
+    def _resolve_uart(self, address):
+        """Caractéristique UART : handle mémorisé s'il est toujours valide, sinon recherche par UUID"""
+        services = self.client.services
+        if self.device_cache.address == address and self.device_cache.char_handle is not None:
+            char = services.get_characteristic(self.device_cache.char_handle)
+            if char is not None and char.uuid.lower() == BT_UART_CHARACTERISTIC:
+                return char
+        if services.get_service(BT_UART_SERVICE) is None:
+            return None
+        return services.get_characteristic(BT_UART_CHARACTERISTIC)
+    
+    async def _get_client(self, device):
+        """BleakClient de l'adresse, réutilisé entre tentatives et reconnexions
+
+        Un nouveau client n'est créé que pour une autre adresse, ou pour un
+        BLEDevice issu d'un nouveau scan ; l'ancien est alors déconnecté avant
+        d'être remplacé.
+        """
+        client = self.client
+        if client is not None and (device is self._client_device or (
+                isinstance(device, str) and device.upper() == client.address.upper())):
+            return client
+        self.client = None  # déconnexion de l'ancien client ignorée par _on_disconnect
+        if client is not None and client.is_connected:
+            await client.disconnect()
+        self.client = BleakClient(
+            device,
+            disconnected_callback=self._on_disconnect,
+            services=[BT_UART_SERVICE],
+            timeout=BLE_CONNECT_TIMEOUT
+        )
+        self._client_device = device
+        return self.client
+    
+    async def connect(self, device, max_attempts=3):
+        """Connexion au régulateur (BLEDevice issu du scan ou adresse mémorisée) avec retry"""
+        address = getattr(device, 'address', device)
         
         for attempt in range(max_attempts):
             try:
-                logger.info(f"Tentative de connexion {attempt + 1}/{max_attempts} au régulateur {address}...")
+                self.logger.info(f"Tentative de connexion {attempt + 1}/{max_attempts} au régulateur {address}...")
                 
-                self.client = BleakClient(address)
+                await self._get_client(device)
                 await self.client.connect()
                 
                 if not self.client.is_connected:
                     raise Exception("Connexion échouée")
                 
-                # Vérification du service
-                services = await self.client.get_services()
-                service_found = False
-                for service in services:
-                    if service.uuid.lower() == BT_UART_SERVICE.lower():
-                        service_found = True
-                        break
-                
-                if not service_found:
+                # Vérification du service (table résolue à la connexion, sans nouvel échange GATT)
+                self.uart_char = self._resolve_uart(address)
+                if self.uart_char is None:
                     await self.client.disconnect()
                     raise Exception(f"Service UART non trouvé")
                 
                 # Activation des notifications
-                await self.client.start_notify(BT_UART_CHARACTERISTIC, self.notification_handler)
+                self.frame_decoder.reset()
+                self._wakeup.clear()
+                await self.client.start_notify(self.uart_char, self.notification_handler)
                 self.is_connected = True
                 self.failed_attempts = 0
+                if self._disconnected_at is not None:
+                    self.reconnects += 1
+                    self.reconnect_latency.observe(time.monotonic() - self._disconnected_at)
+                    self._disconnected_at = None
                 
-                logger.info("Connexion établie avec le régulateur")
+                name = getattr(device, 'name', None) or self.device_cache.name
+                self.device_cache.save(address, name, self.uart_char.handle)
+                self.scanner.claim(address, self)
+                self.logger.info("Connexion établie avec le régulateur")
                 return
                 
             except Exception as e:
-                logger.error(f"Tentative {attempt + 1} échouée: {e}")
+                self.logger.error(f"Tentative {attempt + 1} échouée: {e}")
                 if self.client and self.client.is_connected:
                     await self.client.disconnect()
                 
@@ -164,184 +399,183 @@ class PoolRegulatorMonitor:
     
     async def notification_handler(self, sender, data):
         """Gestionnaire des notifications Bluetooth"""
+        started = time.perf_counter()
+        # Chemin critique : formatage des logs de debug seulement s'ils sont émis
+        debug = self.logger.isEnabledFor(logging.DEBUG)
         try:
-            self.ble_buffer.extend(data)
-            
-            # Recherche d'une trame complète
-            trame = self.parse_buffer()
-            if trame:
-                logger.debug(f"Trame reçue: {trame.hex()}")
+            # Toutes les trames complètes de la notification sont traitées
+            for trame in self.frame_decoder.feed(data):
+                if debug:
+                    self.logger.debug("Trame reçue: %s", trame.hex())
+                if self.capture is not None:
+                    self.capture.append(trame)
+                self.scheduler.on_frame(trame)
                 pool_data = self.process_trame(trame)
                 if pool_data:
-                    await self.send_to_api(pool_data)
+                    self.last_measurement = pool_data
+                    if self.polling.observe(pool_data):
+                        self._wakeup.set()
+                    if self.alerts is not None:
+                        self.check_alerts(pool_data)
+                    self.publish(pool_data)
+                    self.timeseries.add(pool_data)
+                    if self.rollups is not None:
+                        for entry in self.rollups.add(pool_data):
+                            self.uploader.submit_rollup(entry)
+                    if self.recent is not None:
+                        self.recent.add(pool_data)
+            self.decode_latency.observe(time.perf_counter() - started)
         except Exception as e:
-            logger.error(f"Erreur dans notification_handler: {e}")
-    
-    def parse_buffer(self):
-        """Analyse du buffer pour extraire une trame complète"""
-        if len(self.ble_buffer) < 17:
-            return None
-        
-        # Recherche du début de trame (0x2A) et fin (0x2A à la position 16)
-        for i in range(len(self.ble_buffer) - 16):
-            if self.ble_buffer[i] == 0x2A and self.ble_buffer[i + 16] == 0x2A:
-                trame = self.ble_buffer[i:i + 17]
-                
-                # Vérification du CRC
-                if self.calculate_crc(trame[:15]) == trame[15]:
-                    # Suppression de la trame traitée du buffer
-                    self.ble_buffer = self.ble_buffer[i + 17:]
-                    return trame
-        
-        # Nettoyage du buffer si trop gros
-        if len(self.ble_buffer) > 500:
-            self.ble_buffer = self.ble_buffer[-100:]
-        
-        return None
-    
-    def calculate_crc(self, data):
-        """Calcul du CRC"""
-        crc = 0
-        for byte in data:
-            crc ^= byte
-        return crc
-    
-    def bytes_to_double(self, high_byte, low_byte):
-        """Conversion de 2 bytes en double"""
-        return (high_byte << 8) + low_byte
+            self.logger.error(f"Erreur dans notification_handler: {e}")
     
     def process_trame(self, trame):
-        """Traitement d'une trame reçue"""
-        if len(trame) < 17:
+        """Traitement d'une trame reçue : retourne les mesures (trame M), mémorise les autres"""
+        fields = decode_frame(trame)
+        if fields is None:
             return None
         
         mnemo = chr(trame[1])
+        if mnemo != 'M':
+            # Consignes, seuils et électrolyse (S, D, E, A...) : état courant du régulateur
+            self.regulator_state[mnemo] = fields
+            if self.alerts is not None:
+                self.alerts.update_settings(mnemo, fields)
+            self.sinks.submit_state(self.regulator_id, mnemo, fields)
+            self.logger.debug("Trame %s: %s", mnemo, fields)
+            return None
         
-        # Traitement selon le type de trame
-        if mnemo == 'M':  # Trame des mesures principales
-            return {
-                'timestamp': datetime.utcnow().isoformat(),
-                'ph': round(self.bytes_to_double(trame[2], trame[3]) / 100.0, 2),
-                'redox': round(self.bytes_to_double(trame[4], trame[5]), 0),
-                'temperature': round(self.bytes_to_double(trame[6], trame[7]) / 10.0, 1),
-                'salt': round(self.bytes_to_double(trame[8], trame[9]) / 10.0, 1),
-                'alarm': trame[10],
-                'warning': trame[11] & 15,
-                'alarm_redox': trame[11] >> 4,
-                'regulator_type': trame[12] & 15,
-                'pump_plus_active': bool(trame[12] & 0x80),
-                'pump_minus_active': bool(trame[12] & 0x40),
-                'pump_chlore_active': bool(trame[12] & 0x20),
-                'filter_relay_active': bool(trame[12] & 0x10)
-            }
-        
-        return None
+        # Le dict du décodeur est propre à cette trame : complété sur place plutôt que copié
+        data = fields
+        data['timestamp'] = datetime.utcnow().isoformat()
+        if self.regulator_id is not None:
+            data['regulator_id'] = self.regulator_id
+        if self.alerts is not None:
+            # Alertes déjà évaluées ici : l'API n'analyse pas la mesure une seconde fois
+            data['device_alerts'] = True
+        return data
     
-    async def send_to_api(self, data):
-        """Envoi des données vers l'API cloud avec retry"""
-        for attempt in range(MAX_RETRIES):
-            try:
-                response = requests.post(
-                    API_URL,
-                    json=data,
-                    timeout=API_TIMEOUT,
-                    headers={
-                        'Content-Type': 'application/json',
-                        'User-Agent': 'PoolMonitor/1.0'
-                    }
-                )
-                
-                if response.status_code in [200, 201]:
-                    self.last_successful_send = datetime.now()
-                    self.failed_attempts = 0
-                    logger.info(f"✓ Données envoyées: pH={data['ph']}, T={data['temperature']}°C, Sel={data['salt']}g/L, Redox={data['redox']}mV")
-                    return
-                else:
-                    logger.warning(f"Réponse API non-OK: {response.status_code} - {response.text[:200]}")
-                    
-            except requests.exceptions.Timeout:
-                logger.error(f"Timeout API (tentative {attempt + 1}/{MAX_RETRIES})")
-            except requests.exceptions.ConnectionError:
-                logger.error(f"Erreur de connexion API (tentative {attempt + 1}/{MAX_RETRIES})")
-            except RequestException as e:
-                logger.error(f"Erreur requête API (tentative {attempt + 1}/{MAX_RETRIES}): {e}")
-            except Exception as e:
-                logger.error(f"Erreur inattendue envoi API (tentative {attempt + 1}/{MAX_RETRIES}): {e}")
-            
-            if attempt < MAX_RETRIES - 1:
-                await asyncio.sleep(2 ** attempt)  # Backoff exponentiel
-        
-        self.failed_attempts += 1
-        error_msg = f"✗ Échec envoi API après {MAX_RETRIES} tentatives (échecs consécutifs: {self.failed_attempts})"
-        logger.error(error_msg)
-        await self.log_error_to_api("api_send_failure", error_msg, {
-            'failed_attempts': self.failed_attempts,
-            'max_retries': MAX_RETRIES
-        })
+    def check_alerts(self, data):
+        """Évalue les règles d'alerte sur la mesure et transmet l'alerte éventuelle"""
+        alert = self.alerts.evaluate(data)
+        if alert is None:
+            return
+        if self.regulator_id is not None:
+            alert['regulator_id'] = self.regulator_id
+        messages = '; '.join(issue['message'] for issue in alert['issues'])
+        self.logger.warning(f"Alerte {alert['severity']}: {messages}")
+        self.uploader.submit_alert(alert)
+    
+    def publish(self, data):
+        """Distribue la mesure aux destinations (files en mémoire : ne bloque jamais le décodage sur le réseau)"""
+        changed = data if self.change_filter is None else self.change_filter.filter(data)
+        self.sinks.submit(data, changed)
     
     async def send_command(self, command):
-        """Envoi d'une commande au régulateur"""
+        """Écriture d'une commande au régulateur (les réponses sont suivies par self.scheduler)"""
         if not self.is_connected or not self.client:
-            return
+            raise ConnectionError("Régulateur non connecté")
         
         # Création de la trame de commande
         cmd_frame = bytearray([0x2A, 0x52, 0x3F, ord(command), 0xFF, 0x2A])
-        cmd_frame[4] = self.calculate_crc(cmd_frame[:4])
+        cmd_frame[4] = calculate_crc(cmd_frame[:4])
         
-        try:
-            await self.client.write_gatt_char(BT_UART_CHARACTERISTIC, cmd_frame)
-            logger.debug(f"Commande envoyée: {command}")
-        except Exception as e:
-            logger.error(f"Erreur envoi commande {command}: {e}")
+        await self.client.write_gatt_char(self.uart_char, cmd_frame)
+        self.logger.debug("Commande envoyée: %s", command)
     
     async def initialize_regulator(self):
-        """Séquence d'initialisation du régulateur"""
-        logger.info("Initialisation du régulateur...")
+        """Séquence d'initialisation du régulateur (commandes en pipeline, fin dès les réponses reçues)"""
+        self.logger.info("Initialisation du régulateur...")
         
         commands = ['M', 'E', 'S', 'A', 'D', 'B']
+        started = time.monotonic()
         
-        for cmd in commands:
-            await self.send_command(cmd)
-            await asyncio.sleep(0.8)  # Délai un peu plus long pour la stabilité
+        results = await asyncio.gather(
+            *(self.scheduler.request(cmd) for cmd in commands),
+            return_exceptions=True
+        )
+        missing = [cmd for cmd, result in zip(commands, results) if isinstance(result, Exception)]
+        if missing:
+            self.logger.warning(f"Sans réponse à l'initialisation: {', '.join(missing)}")
         
-        logger.info("Initialisation terminée")
+        self.logger.info(f"Initialisation terminée en {time.monotonic() - started:.1f}s")
+    
+    def collect(self, exposition):
+        """Métriques du régulateur : trames, décodage, commandes, connexion (voir metrics.py)"""
+        labels = {'regulator': self.regulator_id or 'default'}
+        decoder = self.frame_decoder
+        exposition.counter('pool_frames_total', "Trames valides reçues", decoder.frames, labels)
+        exposition.counter('pool_crc_errors_total', "Trames rejetées (CRC faux)", decoder.crc_errors, labels)
+        exposition.counter('pool_resyncs_total', "Pertes de synchronisation du flux", decoder.resyncs, labels)
+        exposition.counter('pool_bytes_discarded_total', "Octets écartés par le décodeur", decoder.bytes_discarded, labels)
+        exposition.histogram('pool_decode_seconds', "Traitement d'une notification BLE", self.decode_latency, labels)
+        for command, stats in sorted(self.scheduler.commands.items()):
+            command_labels = {**labels, 'command': command}
+            exposition.counter('pool_commands_sent_total', "Commandes écrites", stats.sent, command_labels)
+            exposition.counter('pool_command_retries_total', "Commandes renvoyées", stats.retries, command_labels)
+            exposition.counter('pool_command_timeouts_total', "Commandes restées sans réponse", stats.timeouts, command_labels)
+            exposition.histogram('pool_command_rtt_seconds', "Temps aller-retour des commandes", stats.latency, command_labels)
+        exposition.gauge('pool_connected', "Régulateur connecté", int(self.is_connected), labels)
+        exposition.counter('pool_reconnects_total', "Reconnexions après une coupure", self.reconnects, labels)
+        exposition.histogram('pool_reconnect_seconds', "Durée de coupure avant reconnexion", self.reconnect_latency, labels)
+        exposition.gauge('pool_poll_interval_seconds', "Intervalle de sondage en cours", self.polling.interval, labels)
+        for mode, count in self.polling.polls.items():
+            exposition.counter('pool_polls_total', "Sondages par mode", count, {**labels, 'mode': mode})
+        if self.change_filter:
+            exposition.counter('pool_filter_suppressed_total', "Mesures non envoyées (sans changement)",
+                               self.change_filter.suppressed, labels)
+            for reason, count in self.change_filter.sent.items():
+                exposition.counter('pool_filter_sent_total', "Mesures envoyées, par motif", count,
+                                   {**labels, 'reason': reason})
+        if self.alerts:
+            for severity, count in self.alerts.alerts.items():
+                exposition.counter('pool_alerts_total', "Alertes émises par le Pi", count,
+                                   {**labels, 'severity': severity})
+        if self.rollups:
+            sliding = self.rollups.sliding().summary()
+            for name, metric in sliding.items():
+                if isinstance(metric, dict):
+                    metric_labels = {**labels, 'metric': name}
+                    exposition.gauge('pool_measurement_24h_avg', "Moyenne glissante sur 24 h", metric['avg'], metric_labels)
+                    exposition.gauge('pool_measurement_24h_std', "Écart type glissant sur 24 h", metric['std'], metric_labels)
     
     async def health_check(self):
-        """Vérification périodique de l'état du système"""
-        try:
-            # Test de l'API cloud
-            health_response = requests.get(
-                API_URL.replace('/measurements', '/health'),
-                timeout=10
-            )
-            
-            if health_response.status_code == 200:
-                logger.debug("API cloud accessible")
-            else:
-                logger.warning(f"API cloud répond avec le code: {health_response.status_code}")
-                
-        except Exception as e:
-            logger.warning(f"Health check API échoué: {e}")
+        """Vérification périodique de l'état du régulateur (l'API cloud est suivie par le superviseur)"""
+        self.logger.info(f"Décodeur de trames: {self.frame_decoder.get_stats()}")
+        self.logger.info(f"Commandes: {self.scheduler.get_stats()}")
+        self.logger.info(f"Sondage: {self.polling.get_stats()}")
+        self.logger.info(f"Historique local: {self.timeseries.get_stats()}")
+        if self.capture:
+            self.logger.info(f"Capture des trames: {self.capture.get_stats()}")
+            self.capture.flush()
+        if self.change_filter:
+            self.logger.info(f"Filtre de changement: {self.change_filter.get_stats()}")
+        if self.alerts:
+            self.logger.info(f"Alertes: {self.alerts.get_stats()}")
+        if self.rollups:
+            self.logger.info(f"Agrégats: {self.rollups.get_stats()}")
+            if ROLLUP_SNAPSHOT_INTERVAL and time.monotonic() - self._last_snapshot >= ROLLUP_SNAPSHOT_INTERVAL:
+                for entry in self.rollups.snapshot():
+                    self.uploader.submit_rollup(entry)
+                self._last_snapshot = time.monotonic()
+            self.rollups.save()
+        self.timeseries.flush()
         
         # Vérification de la connexion Bluetooth
         if not self.is_connected or not self.client or not self.client.is_connected:
-            logger.warning("Connexion Bluetooth perdue")
+            self.logger.warning("Connexion Bluetooth perdue")
             raise Exception("Connexion Bluetooth interrompue")
     
     async def monitoring_loop(self):
-        """Boucle principale de monitoring avec vérification horaire"""
-        logger.info(f"Démarrage du monitoring (intervalle: {MEASUREMENT_INTERVAL}s)...")
+        """Boucle principale de monitoring (intervalle donné par la politique de sondage)"""
+        self.logger.info(f"Démarrage du monitoring (intervalle: {FAST_MEASUREMENT_INTERVAL}-{SLOW_MEASUREMENT_INTERVAL}s, "
+                         f"veille: {IDLE_MEASUREMENT_INTERVAL}s)...")
         
         health_check_interval = 300  # 5 minutes
         last_health_check = 0
+        missed_replies = 0
         
         while self.is_connected:
             try:
-                # Vérification des horaires de fonctionnement
-                if not self.is_operation_time():
-                    logger.info(f"Fin des horaires de fonctionnement ({OPERATION_END_HOUR}h atteinte)")
-                    break
-                
                 current_time = time.time()
                 
                 # Health check périodique
@@ -349,20 +583,33 @@ class PoolRegulatorMonitor:
                     await self.health_check()
                     last_health_check = current_time
                 
-                # Demande des mesures principales
-                await self.send_command('M')
+                # Demande des mesures principales (la trame M est traitée par notification_handler)
+                try:
+                    await self.scheduler.request('M')
+                    missed_replies = 0
+                except asyncio.TimeoutError:
+                    missed_replies += 1
+                    self.logger.warning(f"Pas de réponse à la commande M ({missed_replies}/{MAX_MISSED_REPLIES})")
+                    if missed_replies >= MAX_MISSED_REPLIES:
+                        raise Exception("Le régulateur ne répond plus")
                 
                 # Statistiques
-                if self.last_successful_send:
-                    time_since_last = datetime.now() - self.last_successful_send
+                if self.uploader.last_successful_send:
+                    time_since_last = datetime.now() - self.uploader.last_successful_send
                     if time_since_last.total_seconds() > 300:  # 5 minutes
-                        logger.warning(f"Pas d'envoi réussi depuis {time_since_last}")
+                        self.logger.warning(f"Pas d'envoi réussi depuis {time_since_last}")
                 
-                await asyncio.sleep(MEASUREMENT_INTERVAL)
+                # Attente de la prochaine mesure, interrompue dès une déconnexion ou un changement d'état
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.polling.next_interval())
+                except asyncio.TimeoutError:
+                    pass
+                if self.is_connected:
+                    self._wakeup.clear()
                 
             except Exception as e:
-                logger.error(f"Erreur dans la boucle de monitoring: {e}")
-                await self.log_error_to_api("monitoring_error", str(e), {
+                self.logger.error(f"Erreur dans la boucle de monitoring: {e}")
+                self.log_error_to_api("monitoring_error", str(e), {
                     'monitoring_active': True,
                     'connected': self.is_connected
                 })
@@ -370,90 +617,217 @@ class PoolRegulatorMonitor:
                 break
     
     async def run(self):
-        """Fonction principale avec gestion de reconnexion et horaires"""
+        """Fonction principale avec gestion de reconnexion"""
         while True:
             try:
-                # Vérification des horaires de fonctionnement
-                if not self.is_operation_time():
-                    current_time = datetime.now()
-                    next_start = current_time.replace(
-                        hour=OPERATION_START_HOUR, minute=0, second=0, microsecond=0
-                    )
-                    
-                    # Si on est après 21h, attendre jusqu'à 7h le lendemain
-                    if current_time.hour >= OPERATION_END_HOUR:
-                        next_start = next_start + timedelta(days=1)
-                    
-                    wait_seconds = (next_start - current_time).total_seconds()
-                    logger.info(f"Hors horaires de fonctionnement ({OPERATION_START_HOUR}h-{OPERATION_END_HOUR}h). Attente de {wait_seconds/3600:.1f}h jusqu'à {next_start.strftime('%H:%M')}")
-                    
-                    # Attendre par blocs de 30 minutes pour pouvoir réagir aux interruptions
-                    while wait_seconds > 0 and not self.is_operation_time():
-                        sleep_time = min(1800, wait_seconds)  # max 30 minutes
-                        await asyncio.sleep(sleep_time)
-                        wait_seconds -= sleep_time
-                    
-                    continue
-                
-                logger.info(f"Début de la session de monitoring (horaire: {OPERATION_START_HOUR}h-{OPERATION_END_HOUR}h)")
+                self.logger.info("Début de la session de monitoring")
                 
-                # Recherche et connexion au régulateur
-                address = await self.find_regulator()
-                await self.connect(address)
+                # Connexion au régulateur (directe si déjà connu, sinon recherche)
+                await self.connect_regulator()
                 
                 # Initialisation
                 await self.initialize_regulator()
                 
-                # Boucle de monitoring avec vérification horaire
+                # Boucle de monitoring
                 await self.monitoring_loop()
                 
             except KeyboardInterrupt:
-                logger.info("Arrêt demandé par l'utilisateur")
+                self.logger.info("Arrêt demandé par l'utilisateur")
                 break
             except Exception as e:
-                logger.error(f"Erreur: {e}")
-                await self.log_error_to_api("system_error", str(e), {
+                self.logger.error(f"Erreur: {e}")
+                self.log_error_to_api("system_error", str(e), {
                     'failed_attempts': self.failed_attempts,
                     'is_connected': self.is_connected
                 })
                 self.failed_attempts += 1
                 
-                # Délai progressif en cas d'échecs répétés
+                # Délai progressif en cas d'échecs répétés ; en veille (filtration arrêtée, régulateur
+                # souvent hors tension avec elle), nouvelle tentative au rythme du sondage de veille
                 delay = min(60, 10 * self.failed_attempts)
-                logger.info(f"Nouvelle tentative dans {delay} secondes...")
+                if self.polling.is_idle:
+                    delay = max(delay, IDLE_MEASUREMENT_INTERVAL)
+                self.logger.info(f"Nouvelle tentative dans {delay} secondes...")
                 await asyncio.sleep(delay)
                 
             finally:
                 # Nettoyage
+                if self.is_connected and self._disconnected_at is None:
+                    self._disconnected_at = time.monotonic()
                 self.is_connected = False
                 if self.client and self.client.is_connected:
                     try:
                         await self.client.disconnect()
-                        logger.info("Déconnexion du régulateur")
+                        self.logger.info("Déconnexion du régulateur")
                     except:
                         pass
 
+class PoolSupervisor:
+    """Plusieurs régulateurs dans une seule boucle asyncio
+
+    Chaque régulateur a son moniteur (connexion, décodeur, ordonnanceur de
+    commandes, reprise sur erreur) ; le scan BLE, l'outbox et l'envoi vers
+    l'API sont partagés, de même que les destinations des mesures (SINKS).
+    """
+    
+    def __init__(self, regulators):
+        self.outbox = Outbox(OUTBOX_PATH, max_rows=OUTBOX_MAX_ROWS)
+        self.uploader = ApiUploader(
+            API_URL, ERROR_LOG_URL, self.outbox,
+            timeout=API_TIMEOUT,
+            max_retries=MAX_RETRIES,
+            batch_size=UPLOAD_BATCH_SIZE,
+            batch_max_age=UPLOAD_BATCH_MAX_AGE,
+            wire_format=WIRE_FORMAT,
+            error_window=ERROR_LOG_WINDOW,
+            error_rate=ERROR_LOG_RATE / 60,
+            error_burst=ERROR_LOG_BURST,
+        )
+        self.sinks = build_sinks(self.uploader, SINKS)
+        self.scanner = RegulatorScanner()
+        
+        self.monitors = []
+        for regulator_id, address in regulators:
+            path = TIMESERIES_PATH if regulator_id is None else os.path.join(TIMESERIES_PATH, regulator_id)
+            if regulator_id is None:
+                rollup_path = ROLLUP_STATE_PATH
+            else:
+                root, ext = os.path.splitext(ROLLUP_STATE_PATH)
+                rollup_path = f"{root}-{regulator_id}{ext}"
+            capture = None
+            if CAPTURE_PATH:
+                capture = CaptureWriter(CAPTURE_PATH if regulator_id is None else os.path.join(CAPTURE_PATH, regulator_id))
+            self.monitors.append(PoolRegulatorMonitor(
+                self.uploader,
+                self.scanner,
+                TimeSeriesStore(path, raw_retention_days=TIMESERIES_RAW_DAYS),
+                recent=RecentMeasurements() if LOCAL_API_PORT else None,
+                capture=capture,
+                sinks=self.sinks,
+                rollups=RollupTracker(regulator_id, rollup_path),
+                regulator_id=regulator_id,
+                address=address
+            ))
+        
+        self.memory = MemoryProfiler(interval=MEMORY_PROFILE_INTERVAL, top=MEMORY_PROFILE_TOP)
+        self.loop_lag = None
+        self.metrics = None
+        if METRICS_PORT:
+            self.loop_lag = LoopLagMonitor()
+            collectors = [monitor.collect for monitor in self.monitors]
+            collectors += [self.uploader.collect, self.sinks.collect, self.loop_lag.collect, self.memory.collect]
+            self.metrics = MetricsServer(collectors, METRICS_HOST, METRICS_PORT)
+        
+        self.local_api = None
+        if LOCAL_API_PORT:
+            self.local_api = LocalApiServer(
+                {monitor.regulator_id: monitor.recent for monitor in self.monitors},
+                LOCAL_API_HOST, LOCAL_API_PORT
+            )
+    
+    async def start(self):
+        self.outbox.open()
+        for monitor in self.monitors:
+            monitor.timeseries.open()
+            monitor.rollups.load()
+            if monitor.capture:
+                monitor.capture.open()
+        await self.uploader.start()
+        await self.sinks.start()
+        if self.local_api:
+            for monitor in self.monitors:
+                monitor.recent.load(monitor.timeseries)
+            await self.local_api.start()
+        if self.metrics:
+            self.loop_lag.start()
+            await self.metrics.start()
+        if hasattr(signal, 'SIGUSR1'):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, self.memory.toggle)
+        if MEMORY_PROFILE:
+            self.memory.start()
+    
+    async def stop(self):
+        if hasattr(signal, 'SIGUSR1'):
+            asyncio.get_running_loop().remove_signal_handler(signal.SIGUSR1)
+        self.memory.stop()
+        if self.metrics:
+            self.loop_lag.stop()
+            await self.metrics.stop()
+        if self.local_api:
+            await self.local_api.stop()
+        await self.sinks.stop()
+        await self.uploader.stop()
+        self.outbox.close()
+        for monitor in self.monitors:
+            monitor.timeseries.close()
+            monitor.rollups.save()
+            if monitor.capture:
+                monitor.capture.close()
+    
+    async def run(self):
+        """Lance tous les moniteurs ; l'échec de l'un n'interrompt pas les autres"""
+        health_task = asyncio.create_task(self._health_loop())
+        try:
+            await asyncio.gather(*(self._supervise(monitor) for monitor in self.monitors))
+        finally:
+            health_task.cancel()
+    
+    async def _supervise(self, monitor):
+        """Relance le moniteur d'un régulateur s'il s'arrête sur une erreur inattendue"""
+        while True:
+            try:
+                await monitor.run()
+                return
+            except Exception as e:
+                monitor.logger.error(f"Arrêt inattendu du moniteur: {e}, relance dans 30 secondes")
+                await asyncio.sleep(30)
+    
+    async def _health_loop(self, interval=300):
+        """Suivi des éléments partagés : API cloud, file d'envoi, API locale"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.uploader.check_health()
+                logger.info(f"File d'envoi: {self.uploader.get_stats()}")
+                logger.info(f"Destinations: {self.sinks.get_stats()}")
+                if self.local_api:
+                    logger.info(f"API locale: {self.local_api.get_stats()}")
+                connected = [m.regulator_id or 'régulateur' for m in self.monitors if m.is_connected]
+                logger.info(f"Régulateurs connectés: {len(connected)}/{len(self.monitors)} {connected}")
+                rss = rss_bytes()
+                if rss is not None:
+                    logger.info(f"Mémoire résidente: {rss / MIB:.1f} Mo")
+            except Exception as e:
+                logger.error(f"Erreur du suivi de santé: {e}")
+
+
 async def main():
     """Point d'entrée principal"""
     logger.info("=== Pool Monitor Cloud - Démarrage ===")
     logger.info(f"API URL: {API_URL}")
-    logger.info(f"Intervalle de mesure: {MEASUREMENT_INTERVAL}s")
+    logger.info(f"Destinations: {SINKS}")
+    logger.info(f"Intervalle de mesure: {MEASUREMENT_INTERVAL}s ({FAST_MEASUREMENT_INTERVAL}-{SLOW_MEASUREMENT_INTERVAL}s, "
+                f"veille {IDLE_MEASUREMENT_INTERVAL}s)")
+    
+    regulators = parse_regulators(REGULATORS)
+    if regulators[0][0] is not None:
+        logger.info(f"Régulateurs supervisés: {', '.join(r for r, _ in regulators)}")
     
-    monitor = PoolRegulatorMonitor()
+    supervisor = PoolSupervisor(regulators)
+    await supervisor.start()
     
     try:
-        await monitor.run()
+        await supervisor.run()
     except KeyboardInterrupt:
         logger.info("Arrêt du programme")
     except Exception as e:
         logger.error(f"Erreur fatale: {e}")
     finally:
+        await supervisor.stop()
         logger.info("=== Pool Monitor Cloud - Arrêt ===")
 
 if __name__ == "__main__":
-    # Configuration des signaux pour un arrêt propre
-    import signal
-    
+    # Configuration des signaux pour un arrêt propre (SIGUSR1 : suivi mémoire, voir PoolSupervisor.start)
     def signal_handler(signum, frame):
         logger.info(f"Signal {signum} reçu, arrêt en cours...")
         raise KeyboardInterrupt()
@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+"""
+Journal de capture des trames brutes et outil de reprise
+
+Chaque trame validée par FrameDecoder est ajoutée telle quelle (17 octets),
+avec son horodatage (epoch) et l'horloge monotone, à un fichier journalier
+en ajout seul. Un index clairsemé (une entrée toutes les INDEX_EVERY trames)
+permet de retrouver un intervalle de temps sans parcourir le fichier. Les
+octets d'origine étant conservés, une correction du décodeur peut être
+appliquée après coup à tout l'historique.
+
+En ligne de commande, les captures sont projetées en mémoire (mmap) et
+décodées par blocs de colonnes (decode_batch), sans boucle Python par octet :
+
+    python3 capture.py info DIR
+    python3 capture.py decode DIR --from 2025-06-01 --to 2025-06-02 [--mnemo S]
+    python3 capture.py aggregate DIR --from 2025-06-01 --width 3600
+    python3 capture.py timeseries DIR --output /tmp/timeseries
+    python3 capture.py upload DIR --from 2025-06-01T08:00 --api-url https://.../api/measurements
+
+Les dates sont en UTC (ISO 8601) ou en epoch.
+
+Un retour en arrière de l'horloge (Pi sans RTC avant NTP) est conservé tel
+quel dans les enregistrements ; l'index suit le maximum atteint, si bien que
+ces trames ne sont retrouvées que par un intervalle couvrant le saut.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from datetime import datetime, timezone
+
+from pool_protocol import FRAME_FIELDS, FRAME_LENGTH, decode_batch, encode_measurements
+from pool_protocol.wire import CONTENT_TYPE as FRAMES_CONTENT_TYPE
+
+logger = logging.getLogger(__name__)
+
+# Horodatage (epoch), horloge monotone (ns), trame
+RECORD = struct.Struct(f'<dq{FRAME_LENGTH}s')
+# Maximum des horodatages jusqu'à l'enregistrement, numéro de l'enregistrement
+INDEX_RECORD = struct.Struct('<dQ')
+
+# Magic, version, taille d'enregistrement
+_HEADER = struct.Struct('<4sHH')
+_MAGIC = b'PFC1'
+_INDEX_MAGIC = b'PFI1'
+_VERSION = 1
+
+INDEX_EVERY = 256
+# Trames décodées par bloc dans les outils de reprise
+CHUNK_FRAMES = 1 << 16
+
+_NATIVE_BIG_ENDIAN = sys.byteorder == 'big'
+_FRAME_OFFSET = 16  # RECORD : 8 + 8 octets avant la trame
+
+
+def _day_name(ts):
+    return time.strftime('%Y-%m-%d', time.gmtime(ts))
+
+
+def _open_checked(path, magic, record_size):
+    """Fichier existant en ajout, tronqué au dernier enregistrement complet (coupure pendant une écriture)"""
+    f = open(path, 'r+b')
+    header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        f.seek(0)
+        f.truncate()
+        f.write(_HEADER.pack(magic, _VERSION, record_size))
+        return f, 0
+    found, version, size = _HEADER.unpack(header)
+    if found != magic or version != _VERSION or size != record_size:
+        f.close()
+        raise ValueError(f"{path}: format de fichier inattendu")
+    count = (os.fstat(f.fileno()).st_size - _HEADER.size) // record_size
+    f.truncate(_HEADER.size + count * record_size)
+    f.seek(0, os.SEEK_END)
+    return f, count
+
+
+class CaptureWriter:
+    """Ajout des trames validées au fichier du jour (UTC) et à son index"""
+
+    def __init__(self, directory, index_every=INDEX_EVERY, flush_interval=60.0):
+        self.directory = directory
+        self.index_every = index_every
+        self.flush_interval = flush_interval
+
+        self._data = None
+        self._index = None
+        self._day = None
+        self._count = 0
+        self._max_ts = -math.inf
+        self._last_flush = time.monotonic()
+
+        self.frames = 0
+        self.bytes_written = 0
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        return self
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+            self._index.close()
+            self._data = self._index = None
+            self._day = None
+
+    def flush(self):
+        """Vide les tampons vers le système (appelé périodiquement, pas à chaque trame)"""
+        if self._data is not None:
+            self._data.flush()
+            self._index.flush()
+        self._last_flush = time.monotonic()
+
+    def _open_day(self, day):
+        self.close()
+        data_path = os.path.join(self.directory, f'{day}.cap')
+        index_path = os.path.join(self.directory, f'{day}.idx')
+        if os.path.exists(data_path):
+            self._data, self._count = _open_checked(data_path, _MAGIC, RECORD.size)
+        else:
+            self._data = open(data_path, 'w+b')
+            self._data.write(_HEADER.pack(_MAGIC, _VERSION, RECORD.size))
+            self._count = 0
+
+        self._max_ts = -math.inf
+        if os.path.exists(index_path):
+            self._index, entries = _open_checked(index_path, _INDEX_MAGIC, INDEX_RECORD.size)
+            # Entrées au-delà des trames conservées (index écrit, trames perdues à la coupure)
+            entries = min(entries, (self._count + self.index_every - 1) // self.index_every)
+            self._index.truncate(_HEADER.size + entries * INDEX_RECORD.size)
+            if entries:
+                self._index.seek(_HEADER.size + (entries - 1) * INDEX_RECORD.size)
+                self._max_ts = INDEX_RECORD.unpack(self._index.read(INDEX_RECORD.size))[0]
+            self._index.seek(0, os.SEEK_END)
+        else:
+            self._index = open(index_path, 'w+b')
+            self._index.write(_HEADER.pack(_INDEX_MAGIC, _VERSION, INDEX_RECORD.size))
+            if self._count:
+                self._rebuild_index()
+
+        # Trames postérieures à la dernière entrée d'index : le maximum repart de leur horodatage
+        tail = self._count % self.index_every
+        if tail:
+            self._data.seek(_HEADER.size + (self._count - tail) * RECORD.size)
+            for ts, _, _ in RECORD.iter_unpack(self._data.read(tail * RECORD.size)):
+                self._max_ts = max(self._max_ts, ts)
+            self._data.seek(0, os.SEEK_END)
+        self._day = day
+
+    def _rebuild_index(self):
+        """Index perdu : entrées recalculées à partir des trames du fichier"""
+        logger.warning(f"Capture {self._data.name}: index absent, reconstruction")
+        self._data.seek(_HEADER.size)
+        position = 0
+        while position < self._count:
+            block = self._data.read(min(self._count - position, CHUNK_FRAMES) * RECORD.size)
+            for ts, _, _ in RECORD.iter_unpack(block):
+                self._max_ts = max(self._max_ts, ts)
+                if position % self.index_every == 0:
+                    self._index.write(INDEX_RECORD.pack(self._max_ts, position))
+                position += 1
+        self._data.seek(0, os.SEEK_END)
+
+    def append(self, frame, timestamp=None, monotonic_ns=None):
+        """Ajoute une trame de 17 octets (timestamp : epoch, défaut maintenant)"""
+        ts = time.time() if timestamp is None else timestamp
+        day = _day_name(ts)
+        if day != self._day:
+            self._open_day(day)
+
+        self._data.write(RECORD.pack(ts, time.monotonic_ns() if monotonic_ns is None else monotonic_ns, frame))
+        if ts > self._max_ts:
+            self._max_ts = ts
+        if self._count % self.index_every == 0:
+            self._index.write(INDEX_RECORD.pack(self._max_ts, self._count))
+        self._count += 1
+        self.frames += 1
+        self.bytes_written += RECORD.size
+
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def get_stats(self):
+        return {'frames': self.frames, 'bytes': self.bytes_written, 'day': self._day}
+
+
+class CaptureFile:
+    """Fichier de capture d'un jour projeté en mémoire, en lecture seule"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._mm = None
+        self._index = None
+        self.count = 0
+
+    def open(self):
+        self._file = open(self.path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < _HEADER.size:
+            self.count = 0
+            return self
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size = _HEADER.unpack_from(self._mm)
+        if magic != _MAGIC or version != _VERSION or record_size != RECORD.size:
+            self.close()
+            raise ValueError(f"{self.path}: format de fichier inattendu")
+        self.count = (size - _HEADER.size) // RECORD.size
+        self._index = self._load_index()
+        return self
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _load_index(self):
+        """(maxima, numéros) de l'index ; reconstruit en mémoire s'il manque"""
+        index_path = self.path[:-len('.cap')] + '.idx'
+        keys, positions = array('d'), array('Q')
+        try:
+            with open(index_path, 'rb') as f:
+                magic, version, size = _HEADER.unpack(f.read(_HEADER.size))
+                if magic == _INDEX_MAGIC and version == _VERSION and size == INDEX_RECORD.size:
+                    body = f.read()
+                    body = body[:len(body) - len(body) % INDEX_RECORD.size]
+                    for key, position in INDEX_RECORD.iter_unpack(body):
+                        if position < self.count:
+                            keys.append(key)
+                            positions.append(position)
+                    return keys, positions
+        except (OSError, struct.error):
+            pass
+
+        logger.warning(f"{index_path}: index absent ou illisible, reconstruction")
+        running = -math.inf
+        for position, ts in enumerate(self.timestamps(0, self.count)):
+            running = max(running, ts)
+            if position % INDEX_EVERY == 0:
+                keys.append(running)
+                positions.append(position)
+        return keys, positions
+
+    def first_last(self):
+        """Horodatages de la première et de la dernière trame"""
+        if not self.count:
+            return None, None
+        return (RECORD.unpack_from(self._mm, _HEADER.size)[0],
+                RECORD.unpack_from(self._mm, _HEADER.size + (self.count - 1) * RECORD.size)[0])
+
+    def locate(self, start, end):
+        """Enregistrements [lo, hi) pouvant appartenir à [start, end), par l'index"""
+        keys, positions = self._index
+        lo_entry = _bisect_left(keys, start)
+        lo = positions[lo_entry - 1] if lo_entry else 0
+        hi_entry = _bisect_left(keys, end)
+        hi = positions[hi_entry] if hi_entry < len(positions) else self.count
+        return lo, max(lo, hi)
+
+    def _column(self, lo, hi, offset, width):
+        """Octets [offset, offset + width) de chaque enregistrement, contigus (copies à pas fixe, en C)"""
+        count = hi - lo
+        column = bytearray(count * width)
+        base = _HEADER.size + lo * RECORD.size + offset
+        end = _HEADER.size + hi * RECORD.size
+        for byte in range(width):
+            column[byte::width] = self._mm[base + byte:end:RECORD.size]
+        return column
+
+    def timestamps(self, lo, hi):
+        column = array('d', self._column(lo, hi, 0, 8))
+        if _NATIVE_BIG_ENDIAN:
+            column.byteswap()
+        return column
+
+    def frames(self, lo, hi):
+        """Trames des enregistrements [lo, hi), contiguës (entrée de decode_batch)"""
+        return bytes(self._column(lo, hi, _FRAME_OFFSET, FRAME_LENGTH))
+
+
+def _bisect_left(values, key):
+    lo, hi = 0, len(values)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if values[mid] < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class CaptureReader:
+    """Lecture d'un répertoire de captures par intervalle de temps"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def days(self):
+        return sorted(name[:-4] for name in os.listdir(self.directory) if name.endswith('.cap'))
+
+    def _path(self, day):
+        return os.path.join(self.directory, f'{day}.cap')
+
+    def info(self):
+        """[(jour, trames, première, dernière)]"""
+        result = []
+        for day in self.days():
+            capture = CaptureFile(self._path(day)).open()
+            try:
+                result.append((day, capture.count, *capture.first_last()))
+            finally:
+                capture.close()
+        return result
+
+    def chunks(self, start=0.0, end=math.inf, mnemo=None, chunk=CHUNK_FRAMES):
+        """Blocs (horodatages, trames contiguës) des trames de [start, end), du mnémonique donné si mnemo"""
+        code = ord(mnemo) if mnemo else None
+        first_day = _day_name(start) if start > 0 else ''
+        last_day = _day_name(end) if end < math.inf else '9999'
+        for day in self.days():
+            if not first_day <= day <= last_day:
+                continue
+            capture = CaptureFile(self._path(day)).open()
+            try:
+                lo, hi = capture.locate(start, end) if capture.count else (0, 0)
+                for block in range(lo, hi, chunk):
+                    block_end = min(hi, block + chunk)
+                    stamps = capture.timestamps(block, block_end)
+                    frames = capture.frames(block, block_end)
+                    yield _select(stamps, frames, start, end, code)
+            finally:
+                capture.close()
+
+    def columns(self, start=0.0, end=math.inf, mnemo='M', chunk=CHUNK_FRAMES):
+        """Blocs (horodatages, colonnes decode_batch) des trames `mnemo` de [start, end)"""
+        for stamps, frames in self.chunks(start, end, mnemo, chunk):
+            if stamps:
+                yield stamps, decode_batch(frames, mnemo, validate=False)
+
+
+def _select(stamps, frames, start, end, code):
+    """Garde les trames dans [start, end) (et du mnémonique `code`) ; sans copie si toutes conviennent"""
+    mnemos = frames[1::FRAME_LENGTH]
+    in_range = stamps[0] >= start and stamps[-1] < end and min(stamps) >= start and max(stamps) < end
+    if in_range and (code is None or mnemos.count(code) == len(mnemos)):
+        return stamps, frames
+    keep = [i for i, (ts, mnemo) in enumerate(zip(stamps, mnemos))
+            if start <= ts < end and (code is None or mnemo == code)]
+    view = memoryview(frames)
+    return (array('d', (stamps[i] for i in keep)),
+            b''.join(view[i * FRAME_LENGTH:(i + 1) * FRAME_LENGTH] for i in keep))
+
+
+# ==================== OUTILS DE REPRISE ====================
+
+def _rows(stamps, columns, mnemo='M'):
+    """(horodatage, dict) par trame d'un bloc de colonnes ; mêmes clés que process_trame"""
+    names = list(columns)
+    kinds = {field.name: field.kind for field in FRAME_FIELDS[mnemo]}
+    converters = [bool if kinds[name] == 'bool' else None for name in names]
+    for ts, values in zip(stamps, zip(*columns.values())):
+        row = {'timestamp': datetime.utcfromtimestamp(ts).isoformat()}
+        for name, convert, value in zip(names, converters, values):
+            row[name] = convert(value) if convert else value
+        yield ts, row
+
+
+
+def _parse_time(value):
+    """ISO 8601 (UTC si sans fuseau) ou epoch"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        moment = datetime.fromisoformat(value)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.timestamp()
+
+
+def _idempotency_key(regulator_id, ts, frame):
+    """Clé déterministe : un second envoi du même intervalle est dédoublonné par l'API"""
+    digest = hashlib.blake2b(f'{regulator_id or ""}:{ts!r}:'.encode() + frame, digest_size=16)
+    return digest.hexdigest()
+
+
+def cmd_info(reader, args):
+    total = 0
+    for day, count, first, last in reader.info():
+        total += count
+        span = f"{datetime.utcfromtimestamp(first).isoformat()} -> {datetime.utcfromtimestamp(last).isoformat()}" if count else '-'
+        print(f"{day}: {count} trames ({span})")
+    print(f"Total: {total} trames")
+
+
+def cmd_decode(reader, args):
+    out = sys.stdout
+    count = 0
+    for stamps, columns in reader.columns(args.start, args.end, args.mnemo):
+        for _, row in _rows(stamps, columns, args.mnemo):
+            out.write(json.dumps(row))
+            out.write('\n')
+        count += len(stamps)
+    return count
+
+
+def cmd_aggregate(reader, args):
+    from timeseries import METRICS, Aggregate
+
+    count = 0
+    bucket_start, aggregate = None, None
+    for stamps, columns in reader.columns(args.start, args.end, 'M'):
+        count += len(stamps)
+        for ts, values in zip(stamps, zip(*(columns[name] for name in METRICS))):
+            start = ts - ts % args.width
+            if start != bucket_start:
+                if aggregate is not None:
+                    print(json.dumps({'start': datetime.utcfromtimestamp(bucket_start).isoformat(), **aggregate.to_dict()}))
+                bucket_start, aggregate = start, Aggregate()
+            aggregate.add(values)
+    if aggregate is not None:
+        print(json.dumps({'start': datetime.utcfromtimestamp(bucket_start).isoformat(), **aggregate.to_dict()}))
+    return count
+
+
+def cmd_timeseries(reader, args):
+    """Reconstruit un historique local (TimeSeriesStore) à partir des captures"""
+    from timeseries import TimeSeriesStore
+
+    store = TimeSeriesStore(args.output, raw_retention_days=0)
+    store.open()
+    count = 0
+    try:
+        for stamps, columns in reader.columns(args.start, args.end, 'M'):
+            for ts, row in _rows(stamps, columns):
+                store.add(row, timestamp=ts)
+            count += len(stamps)
+    finally:
+        store.flush()
+        store.close()
+    print(f"Historique: {store.get_stats()}", file=sys.stderr)
+    return count
+
+
+def cmd_upload(reader, args):
+    """Renvoie les mesures de l'intervalle à /measurements/batch, par lots gzip"""
+    import requests
+
+    batch_url = args.api_url.rstrip('/') + '/batch'
+    session = requests.Session()
+    count = 0
+
+    def post(batch):
+        if args.wire_format == 'frames':
+            body, content_type = encode_measurements(batch), FRAMES_CONTENT_TYPE
+        else:
+            body, content_type = json.dumps({'measurements': batch}).encode('utf-8'), 'application/json'
+        response = session.post(batch_url, data=gzip.compress(body, compresslevel=6), timeout=args.timeout,
+                                headers={'Content-Type': content_type, 'Content-Encoding': 'gzip'})
+        response.raise_for_status()
+
+    batch = []
+    for stamps, frames in reader.chunks(args.start, args.end, 'M'):
+        columns = decode_batch(frames, 'M', validate=False)
+        for i, (ts, row) in enumerate(_rows(stamps, columns)):
+            if args.regulator_id:
+                row['regulator_id'] = args.regulator_id
+            row['idempotency_key'] = _idempotency_key(args.regulator_id, ts, frames[i * FRAME_LENGTH:(i + 1) * FRAME_LENGTH])
+            batch.append(row)
+            if len(batch) >= args.batch_size:
+                post(batch)
+                count += len(batch)
+                batch = []
+    if batch:
+        post(batch)
+        count += len(batch)
+    return count
+
+
+COMMANDS = {
+    'info': cmd_info,
+    'decode': cmd_decode,
+    'aggregate': cmd_aggregate,
+    'timeseries': cmd_timeseries,
+    'upload': cmd_upload,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('command', choices=sorted(COMMANDS))
+    parser.add_argument('directory', help="répertoire de captures (CAPTURE_PATH, un sous-répertoire par régulateur)")
+    parser.add_argument('--from', dest='start', help="début (UTC, ISO 8601 ou epoch)")
+    parser.add_argument('--to', dest='end', help="fin exclue (UTC, ISO 8601 ou epoch)")
+    parser.add_argument('--mnemo', default='M', help="trames à décoder (decode)")
+    parser.add_argument('--width', type=int, default=3600, help="largeur des tranches en secondes (aggregate)")
+    parser.add_argument('--output', help="répertoire de l'historique reconstruit (timeseries)")
+    parser.add_argument('--api-url', help="URL de /api/measurements (upload)")
+    parser.add_argument('--regulator-id', help="identifiant du régulateur ajouté aux mesures (upload)")
+    parser.add_argument('--batch-size', type=int, default=1000, help="mesures par requête (upload)")
+    parser.add_argument('--wire-format', choices=('json', 'frames'), default='json', help="format des envois (upload)")
+    parser.add_argument('--timeout', type=float, default=60.0)
+    args = parser.parse_args()
+
+    start = _parse_time(args.start)
+    end = _parse_time(args.end)
+    args.start = 0.0 if start is None else start
+    args.end = math.inf if end is None else end
+    if args.command == 'timeseries' and not args.output:
+        parser.error("--output est requis pour timeseries")
+    if args.command == 'upload' and not args.api_url:
+        parser.error("--api-url est requis pour upload")
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    started = time.perf_counter()
+    count = COMMANDS[args.command](CaptureReader(args.directory), args)
+    if count is not None:
+        elapsed = time.perf_counter() - started
+        print(f"{count} trames en {elapsed:.2f}s ({count / max(elapsed, 1e-9) * 60:,.0f} trames/min)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
@@ -0,0 +1,116 @@
+"""
+Filtre de changement (bande morte) avant l'envoi vers l'API
+
+Les mesures varient très peu d'une trame à l'autre : seules sont envoyées
+celles qui apportent une information. Une mesure part immédiatement si un
+état change (alarme, avertissement, pompes, relais, capteurs), si une valeur
+s'écarte de la dernière valeur envoyée d'au moins sa tolérance, ou si le
+délai maximal sans envoi (heartbeat) est atteint. Les mesures retenues
+localement sont résumées (nombre, moyenne / min / max, période) dans le champ
+`summary` de la mesure envoyée suivante.
+
+L'historique local et l'API locale reçoivent toujours toutes les mesures.
+"""
+
+import logging
+import time
+
+from timeseries import METRICS, Aggregate
+
+logger = logging.getLogger(__name__)
+
+# Champs d'état : tout changement est envoyé sans attendre
+EVENT_FIELDS = (
+    'alarm', 'warning', 'alarm_redox', 'regulator_type',
+    'pump_plus_active', 'pump_minus_active', 'pump_chlore_active', 'filter_relay_active',
+    'pump_plus_enabled', 'pump_minus_enabled', 'pump_chlore_enabled', 'pumps_forced',
+    'temperature_sensor', 'salt_sensor', 'flow_switch',
+)
+
+# Tolérances par défaut (unités des mesures)
+DEFAULT_DEADBANDS = {'ph': 0.05, 'redox': 10, 'temperature': 0.3, 'salt': 0.2}
+
+
+def parse_deadbands(value):
+    """DEADBANDS="ph=0.05,redox=10" -> {'ph': 0.05, 'redox': 10.0}"""
+    deadbands = {}
+    for entry in value.split(','):
+        name, _, tolerance = entry.partition('=')
+        name = name.strip()
+        if not name:
+            continue
+        if name not in METRICS:
+            raise ValueError(f"Mesure inconnue dans DEADBANDS: {name}")
+        deadbands[name] = float(tolerance)
+    return deadbands
+
+
+class ChangeFilter:
+    """Décide, mesure par mesure, de l'envoi vers l'API"""
+
+    def __init__(self, deadbands=None, heartbeat=300.0):
+        self.deadbands = DEFAULT_DEADBANDS if deadbands is None else deadbands
+        self.heartbeat = heartbeat
+
+        self._last_sent = None
+        self._last_sent_at = 0.0
+        self._suppressed = Aggregate()
+        self._suppressed_from = None
+        self._suppressed_to = None
+
+        self.received = 0
+        self.suppressed = 0
+        # Motif d'envoi -> nombre de mesures
+        self.sent = {'first': 0, 'event': 0, 'change': 0, 'heartbeat': 0}
+
+    def _reason(self, measurement, now):
+        last = self._last_sent
+        if last is None:
+            return 'first'
+        for name in EVENT_FIELDS:
+            if measurement.get(name) != last.get(name):
+                return 'event'
+        for name, tolerance in self.deadbands.items():
+            # Marge pour les valeurs arrondies (7.25 - 7.20 = 0.04999...)
+            if abs(measurement[name] - last[name]) >= tolerance - 1e-9:
+                return 'change'
+        if now - self._last_sent_at >= self.heartbeat:
+            return 'heartbeat'
+        return None
+
+    def filter(self, measurement, now=None):
+        """Mesure à envoyer (avec `summary` si des mesures ont été retenues), ou None"""
+        now = time.monotonic() if now is None else now
+        self.received += 1
+
+        reason = self._reason(measurement, now)
+        if reason is None:
+            self.suppressed += 1
+            self._suppressed.add(tuple(float(measurement[name]) for name in METRICS))
+            if self._suppressed_from is None:
+                self._suppressed_from = measurement['timestamp']
+            self._suppressed_to = measurement['timestamp']
+            return None
+
+        self.sent[reason] += 1
+        self._last_sent = measurement
+        self._last_sent_at = now
+        if not self._suppressed.count:
+            return measurement
+
+        summary = self._suppressed.to_dict()
+        summary['from'] = self._suppressed_from
+        summary['to'] = self._suppressed_to
+        self._suppressed = Aggregate()
+        self._suppressed_from = None
+        self._suppressed_to = None
+        logger.debug(f"Envoi ({reason}) après {summary['count']} mesure(s) retenue(s)")
+        return {**measurement, 'summary': summary}
+
+    def get_stats(self):
+        return {
+            'received': self.received,
+            'suppressed': self.suppressed,
+            'sent': dict(self.sent),
+            'ratio': round(self.received / max(1, sum(self.sent.values())), 1),
+        }
@@ -0,0 +1,152 @@
+"""
+Ordonnanceur de commandes du régulateur
+
+Chaque commande `*R?<X><crc>*` appelle une trame réponse de même mnémonique
+(trame[1] == X). Les requêtes sont associées à leur réponse par mnémonique,
+avec délai d'attente et renvoi ; plusieurs commandes distinctes peuvent être
+en vol simultanément (pipeline), les écritures restant espacées pour ne pas
+saturer le régulateur. Les temps aller-retour sont suivis par commande dans
+des histogrammes.
+"""
+
+import asyncio
+import logging
+import time
+
+from metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# Bornes supérieures des classes d'histogramme (secondes)
+LATENCY_BOUNDS = (0.025, 0.05, 0.1, 0.2, 0.4, 0.8, 1.6, 3.2)
+
+
+class CommandStats:
+    """Compteurs et latences d'une commande"""
+
+    __slots__ = ('sent', 'replies', 'retries', 'timeouts', 'errors', 'latency')
+
+    def __init__(self):
+        self.sent = 0
+        self.replies = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.latency = LatencyHistogram(LATENCY_BOUNDS)
+
+    def to_dict(self):
+        return {
+            'sent': self.sent,
+            'replies': self.replies,
+            'retries': self.retries,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'rtt': self.latency.to_dict(),
+        }
+
+
+class CommandScheduler:
+    """Envoie les commandes et attend la trame réponse correspondante"""
+
+    def __init__(self, send, timeout=2.0, retries=2, spacing=0.2, max_in_flight=4):
+        # send(command) : coroutine qui écrit la trame de commande (lève en cas d'échec)
+        self._send = send
+        self.timeout = timeout
+        self.retries = retries
+        self.spacing = spacing
+
+        self._pending = {}   # mnémonique (int) -> future de la réponse
+        self._sent_at = {}   # mnémonique (int) -> instant du dernier envoi
+        self._write_lock = asyncio.Lock()
+        self._window = asyncio.Semaphore(max_in_flight)
+        self._last_write = 0.0
+
+        self.commands = {}
+        self.unsolicited = 0
+
+    def _stats_for(self, command):
+        stats = self.commands.get(command)
+        if stats is None:
+            stats = self.commands[command] = CommandStats()
+        return stats
+
+    async def request(self, command, timeout=None, retries=None):
+        """Envoie `command` et retourne la trame réponse ; asyncio.TimeoutError après les renvois
+
+        Une requête pour une commande déjà en vol attend la même réponse au
+        lieu d'envoyer une seconde fois.
+        """
+        code = ord(command)
+        pending = self._pending.get(code)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        stats = self._stats_for(command)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[code] = future
+        try:
+            async with self._window:
+                for attempt in range(retries + 1):
+                    if attempt:
+                        stats.retries += 1
+                        logger.debug(f"Commande {command}: pas de réponse, renvoi {attempt}/{retries}")
+                    await self._write(command, code, stats)
+                    try:
+                        return await asyncio.wait_for(asyncio.shield(future), timeout)
+                    except asyncio.TimeoutError:
+                        continue
+            stats.timeouts += 1
+            error = asyncio.TimeoutError(f"Pas de réponse à la commande {command}")
+        except asyncio.CancelledError:
+            error = None
+            raise
+        except Exception as e:
+            stats.errors += 1
+            error = e
+        finally:
+            if self._pending.get(code) is future:
+                del self._pending[code]
+            if not future.done():
+                if error is None:
+                    future.cancel()
+                else:
+                    # Transmis aux éventuelles requêtes jointes ; marqué comme lu sinon
+                    future.set_exception(error)
+                    future.exception()
+        raise error
+
+    async def _write(self, command, code, stats):
+        """Écrit la commande en respectant l'espacement minimal entre deux écritures"""
+        async with self._write_lock:
+            delay = self._last_write + self.spacing - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._sent_at[code] = time.monotonic()
+            try:
+                await self._send(command)
+                stats.sent += 1
+            finally:
+                self._last_write = time.monotonic()
+
+    def on_frame(self, frame):
+        """À appeler pour chaque trame reçue : résout la requête en attente de ce mnémonique"""
+        code = frame[1]
+        future = self._pending.get(code)
+        if future is None or future.done():
+            self.unsolicited += 1
+            return False
+        stats = self._stats_for(chr(code))
+        stats.replies += 1
+        stats.latency.observe(time.monotonic() - self._sent_at[code])
+        future.set_result(frame)
+        return True
+
+    def get_stats(self):
+        """Compteurs et latences par commande"""
+        return {
+            'commands': {command: stats.to_dict() for command, stats in sorted(self.commands.items())},
+            'in_flight': len(self._pending),
+            'unsolicited': self.unsolicited,
+        }
@@ -0,0 +1,65 @@
+"""
+Mémorisation du dernier régulateur connecté
+
+L'adresse BLE et le handle de la caractéristique UART sont conservés dans un
+petit fichier JSON : à la reconnexion, le moniteur tente d'abord une
+connexion directe (sans scan ni recherche de service) et ne relance la
+recherche qu'en cas d'échec.
+"""
+
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceCache:
+    """État BLE persistant : adresse, nom et handle de la caractéristique UART"""
+
+    def __init__(self, path):
+        self.path = path
+        self.address = None
+        self.name = None
+        self.char_handle = None
+
+    def load(self):
+        """Relit le fichier d'état (absent ou illisible : cache vide)"""
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"État BLE illisible ({self.path}): {e}")
+            return
+        self.address = state.get('address')
+        self.name = state.get('name')
+        self.char_handle = state.get('char_handle')
+        if self.address:
+            logger.info(f"Dernier régulateur connu: {self.name} ({self.address})")
+
+    def save(self, address, name, char_handle):
+        """Enregistre le régulateur après une connexion réussie (écriture atomique)"""
+        if (address, name, char_handle) == (self.address, self.name, self.char_handle):
+            return
+        self.address = address
+        self.name = name
+        self.char_handle = char_handle
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({
+                    'address': address,
+                    'name': name,
+                    'char_handle': char_handle,
+                    'updated_at': time.time(),
+                }, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Impossible d'enregistrer l'état BLE: {e}")
@@ -0,0 +1,100 @@
+"""
+Agrégation et limitation des logs d'erreur envoyés à l'API
+
+Pendant une panne (API, Bluetooth), la même erreur se répète à chaque
+tentative. Au lieu d'un envoi par occurrence, les erreurs sont regroupées
+par error_type sur une fenêtre : nombre d'occurrences, première et dernière
+apparition, dernier message et quelques contextes d'exemple. Les agrégats
+sont ensuite persistés dans l'outbox et expédiés par lots, au rythme d'un
+seau à jetons (token bucket) qui borne le nombre de requêtes.
+"""
+
+import asyncio
+import time
+from datetime import datetime
+
+SOURCE = 'raspberry_pi_monitor'
+
+
+class ErrorAggregator:
+    """Regroupe les erreurs par error_type jusqu'au prochain drain()"""
+
+    def __init__(self, max_samples=3, max_types=50, max_message=1000):
+        self.max_samples = max_samples
+        self.max_types = max_types      # types distincts par fenêtre, au-delà les erreurs sont comptées puis écartées
+        self.max_message = max_message  # caractères conservés par message
+        self._pending = {}  # error_type -> agrégat (dict)
+
+        self.received = 0
+        self.aggregates = 0
+        self.dropped = 0
+
+    def add(self, error_type, error_message, context=None):
+        timestamp = datetime.utcnow().isoformat()
+        self.received += 1
+        error_message = str(error_message)[:self.max_message]
+        entry = self._pending.get(error_type)
+        if entry is None:
+            if len(self._pending) >= self.max_types:
+                self.dropped += 1
+                return
+            entry = self._pending[error_type] = {
+                'timestamp': timestamp,
+                'error_type': error_type,
+                'error_message': error_message,
+                'context': context or {},
+                'source': SOURCE,
+                'count': 0,
+                'first_seen': timestamp,
+                'last_seen': timestamp,
+                'samples': [],
+            }
+        entry['count'] += 1
+        entry['timestamp'] = entry['last_seen'] = timestamp
+        entry['error_message'] = error_message
+        entry['context'] = context or {}
+        if len(entry['samples']) < self.max_samples:
+            entry['samples'].append({'timestamp': timestamp, 'error_message': error_message,
+                                     'context': context or {}})
+
+    def drain(self):
+        """Agrégats de la fenêtre écoulée (un par error_type), dans l'ordre de première apparition"""
+        entries = list(self._pending.values())
+        self._pending = {}
+        self.aggregates += len(entries)
+        return entries
+
+    def __len__(self):
+        return len(self._pending)
+
+
+class TokenBucket:
+    """Seau à jetons : `rate` jetons par seconde, au plus `burst` accumulés"""
+
+    def __init__(self, rate, burst):
+        if rate <= 0:
+            raise ValueError(f"débit du seau à jetons invalide: {rate}")
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+
+        self.waits = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        """Attend un jeton disponible"""
+        while not self.try_acquire():
+            self.waits += 1
+            await asyncio.sleep((1 - self.tokens) / self.rate)
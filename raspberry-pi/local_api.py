@@ -0,0 +1,267 @@
+"""
+API HTTP locale du Raspberry Pi (optionnelle)
+
+Sert /latest, /stats et /chart-data (ainsi que les chemins /api/measurements/*
+de l'API cloud, pour pointer directement le tableau de bord web-cloud vers le
+Pi) avec les formes JSON lues par le tableau de bord (/stats : forme plate
+min_ph, avg_ph... de api/stats.js). Les réponses sont calculées en
+mémoire uniquement : tampon circulaire des dernières mesures et agrégats par
+minute / heure / jour tenus à jour à chaque trame. Aucune E/S disque ou
+réseau par requête ; ETag + 304 pour les clients qui rafraîchissent sans
+nouvelle donnée.
+"""
+
+import json
+import logging
+import time
+from collections import deque
+from datetime import datetime
+
+from aiohttp import web
+
+from timeseries import METRICS, Aggregate
+
+logger = logging.getLogger(__name__)
+
+# Intervalles de /chart-data (mêmes valeurs que storage._groupByInterval) et largeur en secondes
+INTERVALS = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Abréviations de toLocaleDateString('fr-FR', { month: 'short' })
+_MONTHS_FR = ('janv.', 'févr.', 'mars', 'avr.', 'mai', 'juin',
+              'juil.', 'août', 'sept.', 'oct.', 'nov.', 'déc.')
+
+
+def _local_day_start(ts):
+    """Minuit (heure locale) du jour de ts, comme new Date(y, m, d) côté API"""
+    local = time.localtime(ts)
+    return time.mktime((local.tm_year, local.tm_mon, local.tm_mday, 0, 0, 0, 0, 0, -1))
+
+
+def _category(ts, interval):
+    """Libellé d'abscisse identique à celui de l'API (Highcharts)"""
+    date = datetime.fromtimestamp(ts)
+    if interval == 'minute':
+        return date.strftime('%H:%M')
+    day = f"{date.day} {_MONTHS_FR[date.month - 1]}"
+    if interval == 'hour':
+        return f"{day}, {date.hour:02d} h"
+    return day
+
+
+class RecentMeasurements:
+    """Dernières mesures et agrégats incrémentaux, en mémoire"""
+
+    def __init__(self, max_measurements=5000, max_hours=24 * 7):
+        self.max_hours = max_hours
+        self.measurements = deque(maxlen=max_measurements)
+        # Début de tranche (epoch) -> Aggregate, dans l'ordre d'insertion (chronologique)
+        self.buckets = {interval: {} for interval in INTERVALS}
+        # Incrémenté à chaque mesure : base des ETag
+        self.version = 0
+
+    def add(self, measurement, timestamp=None):
+        """Ajoute un résultat de process_trame (timestamp epoch, défaut : maintenant)"""
+        ts = time.time() if timestamp is None else timestamp
+        self.measurements.append((ts, measurement))
+
+        values = tuple(float(measurement[name]) for name in METRICS)
+        starts = {
+            'minute': ts - ts % 60,
+            'hour': ts - ts % 3600,
+            'day': _local_day_start(ts),
+        }
+        cutoff = ts - self.max_hours * 3600
+        for interval, buckets in self.buckets.items():
+            aggregate = buckets.get(starts[interval])
+            if aggregate is None:
+                aggregate = buckets[starts[interval]] = Aggregate()
+                # Purge des tranches trop anciennes (les plus anciennes sont en tête)
+                while buckets and next(iter(buckets)) < cutoff - 86400:
+                    del buckets[next(iter(buckets))]
+            aggregate.add(values)
+        self.version += 1
+
+    def load(self, store):
+        """Préremplit depuis l'historique local (au démarrage uniquement)"""
+        now = time.time()
+        for measurement in store.measurements(now - self.max_hours * 3600, now):
+            ts = measurement['timestamp']
+            measurement['timestamp'] = datetime.utcfromtimestamp(ts).isoformat()
+            self.add(measurement, ts)
+        if self.version:
+            logger.info(f"API locale: {self.version} mesures rechargées depuis l'historique")
+
+    def latest(self):
+        if not self.measurements:
+            return None
+        return self.measurements[-1][1]
+
+    def stats(self, hours):
+        """Forme plate de api/stats.js lue par web-cloud : min_ph, max_ph, avg_ph... et total_measurements
+        (à la minute près pour le début de la période)"""
+        since = time.time() - hours * 3600
+        total = Aggregate()
+        hour_start = since - since % 3600 + 3600
+        # Heure partielle en début de période : tranches minute ; heures complètes ensuite
+        for start, aggregate in self.buckets['minute'].items():
+            if since <= start < hour_start:
+                total.merge(aggregate)
+        for start, aggregate in self.buckets['hour'].items():
+            if start >= hour_start:
+                total.merge(aggregate)
+        result = {'period_hours': hours, 'total_measurements': total.count}
+        for name, metric in total.to_dict().items():
+            if name == 'count':
+                continue
+            for key in ('min', 'max', 'avg'):
+                result[f'{key}_{name}'] = metric[key] if metric else None
+        return result
+
+    def chart_rows(self, hours, interval):
+        """Même forme que storage.getChartData : [{timestamp, ph, redox, temperature, salt, count}]"""
+        since = time.time() - hours * 3600
+        rows = []
+        if interval in self.buckets:
+            width = INTERVALS[interval]
+            for start, aggregate in self.buckets[interval].items():
+                if start + width <= since:
+                    continue
+                stats = aggregate.to_dict()
+                row = {'timestamp': start}
+                row.update((name, stats[name]['avg']) for name in METRICS)
+                row['count'] = aggregate.count
+                rows.append(row)
+        else:
+            # Intervalle inconnu : une ligne par mesure, comme côté API
+            for ts, measurement in self.measurements:
+                if ts >= since:
+                    row = {'timestamp': ts}
+                    row.update((name, measurement[name]) for name in METRICS)
+                    row['count'] = 1
+                    rows.append(row)
+        return rows
+
+
+class LocalApiServer:
+    """Serveur aiohttp exposant les RecentMeasurements de chaque régulateur sur le réseau local
+
+    sources : {identifiant du régulateur: RecentMeasurements} ; le paramètre
+    ?regulator= choisit le régulateur (par défaut le premier).
+    """
+
+    def __init__(self, sources, host='0.0.0.0', port=8080):
+        self.sources = sources
+        self.default_source = next(iter(sources))
+        self.host = host
+        self.port = port
+        self._runner = None
+        # (régulateur, chemin, paramètres) -> (version, etag, corps)
+        self._cache = {}
+        # Distingue les ETag d'un redémarrage à l'autre (la version repart de 0)
+        self._instance = int(time.time())
+
+        self.requests = 0
+        self.not_modified = 0
+
+    async def start(self):
+        app = web.Application()
+        for path, handler in (
+            ('/latest', self._latest),
+            ('/stats', self._stats),
+            ('/chart-data', self._chart_data),
+        ):
+            app.router.add_get(path, handler)
+            app.router.add_get(f'/api/measurements{path}', handler)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"API locale démarrée sur http://{self.host}:{self.port}")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def get_stats(self):
+        return {'requests': self.requests, 'not_modified': self.not_modified}
+
+    def _source(self, request):
+        regulator_id = request.query.get('regulator', self.default_source)
+        if regulator_id not in self.sources:
+            raise web.HTTPNotFound(text=f'Régulateur inconnu: {regulator_id}')
+        return regulator_id, self.sources[regulator_id]
+
+    def _respond(self, request, key, build):
+        """Réponse JSON mise en cache par version des données ; 304 si l'ETag du client est à jour"""
+        self.requests += 1
+        regulator_id, recent = self._source(request)
+        key = (regulator_id, *key)
+        version = recent.version
+        cached = self._cache.get(key)
+        if cached is None or cached[0] != version:
+            if len(self._cache) > 256:
+                self._cache.clear()
+            etag = f'"{self._instance:x}-{version:x}-{abs(hash(key)) & 0xFFFFFFFF:x}"'
+            body = json.dumps(build(recent), ensure_ascii=False).encode()
+            cached = self._cache[key] = (version, etag, body)
+
+        headers = {
+            'ETag': cached[1],
+            'Cache-Control': 'no-cache',
+            'Access-Control-Allow-Origin': '*',
+        }
+        if cached[1] in request.headers.get('If-None-Match', ''):
+            self.not_modified += 1
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=cached[2], content_type='application/json', headers=headers)
+
+    @staticmethod
+    def _hours(request):
+        try:
+            return int(request.query.get('hours', 24))
+        except ValueError:
+            raise web.HTTPBadRequest(text='hours doit être un entier')
+
+    async def _latest(self, request):
+        return self._respond(request, ('latest',), lambda recent: {
+            'success': True,
+            'data': recent.latest(),
+        })
+
+    async def _stats(self, request):
+        hours = self._hours(request)
+        # La fenêtre glisse avec le temps : l'ETag change aussi chaque minute
+        key = ('stats', hours, int(time.time() // 60))
+        return self._respond(request, key, lambda recent: {
+            'success': True,
+            'data': recent.stats(hours),
+            'period_hours': hours,
+        })
+
+    async def _chart_data(self, request):
+        hours = self._hours(request)
+        interval = request.query.get('interval', 'hour')
+        key = ('chart-data', hours, interval, int(time.time() // 60))
+        return self._respond(request, key, lambda recent: self._chart_payload(recent, hours, interval))
+
+    @staticmethod
+    def _chart_payload(recent, hours, interval):
+        rows = recent.chart_rows(hours, interval)
+        series = (
+            ('pH', 'ph'),
+            ('Redox (mV)', 'redox'),
+            ('Température (°C)', 'temperature'),
+            ('Sel (g/L)', 'salt'),
+        )
+        return {
+            'success': True,
+            'data': {
+                'categories': [_category(row['timestamp'], interval) for row in rows],
+                'series': [
+                    {'name': name, 'data': [row[metric] for row in rows], 'yAxis': axis}
+                    for axis, (name, metric) in enumerate(series)
+                ],
+            },
+            'period_hours': hours,
+            'interval': interval,
+        }
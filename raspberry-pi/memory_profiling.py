@@ -0,0 +1,127 @@
+"""
+Suivi de la mémoire du moniteur (Pi 512 Mo, des mois sans redémarrage)
+
+rss_bytes() lit la mémoire résidente du processus (/proc/self/statm) : assez
+peu coûteux pour être journalisé à chaque suivi de santé et exporté en
+métrique.
+
+MemoryProfiler est un mode de diagnostic des fuites : tracemalloc est démarré
+à la demande (signal SIGUSR1, ou MEMORY_PROFILE=1 au démarrage), puis un
+instantané est pris toutes les `interval` secondes et comparé au précédent et
+au premier. Les `top` lignes de code dont les allocations ont le plus augmenté
+sont journalisées : une croissance continue d'un rapport à l'autre désigne la
+fuite. Un second SIGUSR1 arrête le suivi ; tracemalloc ralentit chaque
+allocation et garde ses propres traces en mémoire, il n'est donc jamais
+actif en temps normal.
+
+    kill -USR1 $(pgrep -f bluetooth_monitor_cloud.py)
+"""
+
+import asyncio
+import logging
+import os
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+MIB = 1024 * 1024
+
+# Allocations du suivi lui-même et des imports, sans intérêt pour la recherche de fuites
+_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def rss_bytes():
+    """Mémoire résidente du processus en octets ; None hors Linux"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryProfiler:
+    """Instantanés tracemalloc périodiques et sites d'allocation en croissance"""
+
+    def __init__(self, interval=300.0, top=10, frames=1):
+        self.interval = interval
+        self.top = top
+        self.frames = frames
+        self._task = None
+        self._baseline = None  # premier instantané du suivi en cours
+        self._previous = None  # instantané du rapport précédent
+
+        self.reports = 0
+
+    @property
+    def active(self):
+        return self._task is not None
+
+    def toggle(self):
+        """Gestionnaire du signal : démarre ou arrête le suivi"""
+        if self.active:
+            self.stop()
+        else:
+            self.start()
+
+    def start(self):
+        if self.active:
+            return
+        tracemalloc.start(self.frames)
+        self._baseline = self._previous = self._snapshot()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Suivi mémoire démarré (rapport toutes les {self.interval:.0f}s, {self.top} sites)")
+
+    def stop(self):
+        """Dernier rapport, puis arrêt de tracemalloc (ses traces sont libérées)"""
+        if not self.active:
+            return
+        self._task.cancel()
+        self._task = None
+        try:
+            self.report()
+        finally:
+            self._baseline = self._previous = None
+            tracemalloc.stop()
+        logger.info("Suivi mémoire arrêté")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.report()
+            except Exception as e:
+                logger.error(f"Suivi mémoire: {e}")
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(_FILTERS)
+
+    def report(self):
+        """Journalise la mémoire tracée et les sites en croissance depuis le rapport précédent et le démarrage"""
+        snapshot = self._snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        rss = rss_bytes()
+        logger.info(f"Mémoire: résidente {rss / MIB if rss else 0:.1f} Mo, "
+                    f"tracée {current / MIB:.1f} Mo (pic {peak / MIB:.1f} Mo)")
+        for label, reference in (('depuis le rapport précédent', self._previous),
+                                 ('depuis le début du suivi', self._baseline)):
+            growth = [stat for stat in snapshot.compare_to(reference, 'lineno') if stat.size_diff > 0]
+            logger.info(f"Croissance des allocations {label}: {sum(s.size_diff for s in growth) / 1024:+.1f} Kio")
+            for stat in growth[:self.top]:
+                frame = stat.traceback[0]
+                logger.info(f"  {frame.filename}:{frame.lineno}: {stat.size_diff / 1024:+.1f} Kio "
+                            f"({stat.count_diff:+d} blocs), {stat.size / 1024:.1f} Kio au total")
+        self._previous = snapshot
+        self.reports += 1
+
+    def collect(self, exposition):
+        """Métriques mémoire (voir metrics.py) ; la mémoire tracée seulement pendant le suivi"""
+        exposition.gauge('pool_memory_resident_bytes', "Mémoire résidente du processus", rss_bytes())
+        if self.active:
+            current, peak = tracemalloc.get_traced_memory()
+            exposition.gauge('pool_memory_traced_bytes', "Mémoire allouée par Python (tracemalloc)", current)
+            exposition.gauge('pool_memory_traced_peak_bytes', "Pic de mémoire allouée (tracemalloc)", peak)
@@ -0,0 +1,184 @@
+"""
+Métriques du moniteur au format texte Prometheus
+
+Les compteurs existants (décodeur de trames, ordonnanceur de commandes, file
+d'envoi, outbox) sont lus au moment de la collecte : le chemin des
+notifications ne fait rien de plus qu'avant, hormis l'histogramme du temps de
+décodage. Le serveur /metrics (aiohttp) est optionnel, sur son propre port ;
+aiohttp n'est importé qu'à son démarrage, ce qui laisse les histogrammes
+utilisables sans lui (sinks.py depuis python/app.py).
+"""
+
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+# Bornes des histogrammes (secondes)
+DECODE_BOUNDS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005)
+UPLOAD_BOUNDS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RECONNECT_BOUNDS = (0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+LOOP_LAG_BOUNDS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class LatencyHistogram:
+    """Histogramme cumulatif à classes fixes (compatible avec un export Prometheus)"""
+
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'max')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # dernière classe : au-delà de la plus grande borne
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Borne supérieure de la classe contenant le quantile q (None si vide)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self):
+        result = {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count * 1000, 1) if self.count else None,
+            'max_ms': round(self.max * 1000, 1),
+        }
+        for q in (0.5, 0.95):
+            value = self.quantile(q)
+            result[f'p{int(q * 100)}_ms'] = round(value * 1000, 1) if value is not None else None
+        return result
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+
+class Exposition:
+    """Échantillons d'une collecte, regroupés par métrique (HELP/TYPE une seule fois)"""
+
+    def __init__(self):
+        self._metrics = {}  # nom -> (type, aide, [lignes])
+
+    def _lines(self, name, kind, help_text):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = (kind, help_text, [])
+        return metric[2]
+
+    def counter(self, name, help_text, value, labels=None):
+        self._lines(name, 'counter', help_text).append(f'{name}{_labels(labels)} {value}')
+
+    def gauge(self, name, help_text, value, labels=None):
+        if value is not None:
+            self._lines(name, 'gauge', help_text).append(f'{name}{_labels(labels)} {value}')
+
+    def histogram(self, name, help_text, histogram, labels=None):
+        lines = self._lines(name, 'histogram', help_text)
+        labels = labels or {}
+        cumulative = 0
+        for bound, count in zip(histogram.bounds, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels({**labels, "le": bound})} {cumulative}')
+        lines.append(f'{name}_bucket{_labels({**labels, "le": "+Inf"})} {histogram.count}')
+        lines.append(f'{name}_sum{_labels(labels)} {histogram.total}')
+        lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+
+    def render(self):
+        output = []
+        for name, (kind, help_text, lines) in self._metrics.items():
+            output.append(f'# HELP {name} {help_text}')
+            output.append(f'# TYPE {name} {kind}')
+            output.extend(lines)
+        return '\n'.join(output) + '\n'
+
+
+class LoopLagMonitor:
+    """Retard de la boucle asyncio : écart entre le réveil prévu et le réveil effectif"""
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.latency = LatencyHistogram(LOOP_LAG_BOUNDS)
+        self.last = 0.0
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, time.monotonic() - expected)
+            self.latency.observe(self.last)
+
+    def collect(self, exposition):
+        exposition.histogram('pool_event_loop_lag_seconds', "Retard de réveil de la boucle asyncio", self.latency)
+
+
+class MetricsServer:
+    """Serveur aiohttp exposant /metrics ; collectors : fonctions collect(exposition)"""
+
+    def __init__(self, collectors, host='0.0.0.0', port=9100):
+        self.collectors = collectors
+        self.host = host
+        self.port = port
+        self._runner = None
+        self.scrapes = 0
+
+    async def start(self):
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get('/metrics', self._metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Métriques exposées sur http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def render(self):
+        exposition = Exposition()
+        for collect in self.collectors:
+            try:
+                collect(exposition)
+            except Exception as e:
+                logger.error(f"Erreur de collecte des métriques: {e}")
+        self.scrapes += 1
+        exposition.counter('pool_metrics_scrapes_total', "Collectes /metrics servies", self.scrapes)
+        return exposition.render()
+
+    async def _metrics(self, request):
+        from aiohttp import web
+
+        return web.Response(body=self.render().encode(), headers={'Content-Type': CONTENT_TYPE})
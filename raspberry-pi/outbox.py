@@ -0,0 +1,148 @@
+"""
+Outbox persistante (write-ahead) pour les mesures, alertes, agrégats et logs d'erreur
+
+Chaque mesure décodée est d'abord écrite dans une base SQLite en mode WAL sur
+la carte SD, puis rejouée dans l'ordre vers l'API par la tâche de drain.
+Les commits sont regroupés (par nombre ou par durée) pour limiter les fsync
+et l'usure de la carte ; la taille de la base est plafonnée. Chaque entrée a
+une nature (KINDS) : chaque nature forme sa propre file FIFO, plafonnée
+séparément.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('measurement', 'alert', 'rollup', 'error')
+
+
+class Outbox:
+    """File FIFO durable adossée à SQLite (WAL)"""
+
+    def __init__(self, path, max_rows=100000, commit_batch=20, commit_interval=5.0):
+        self.path = path
+        self.max_rows = max_rows
+        self.commit_batch = commit_batch
+        self.commit_interval = commit_interval
+
+        self.conn = None
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+        self._counts = dict.fromkeys(KINDS, 0)
+        self.evicted = 0
+
+    def open(self):
+        """Ouvre (ou crée) la base et restaure le compteur d'entrées en attente"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.conn = sqlite3.connect(self.path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # En WAL, NORMAL ne synchronise qu'aux checkpoints : pas de fsync par mesure
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        # Plafonne le fichier -wal après chaque checkpoint (4 Mo)
+        self.conn.execute("PRAGMA journal_size_limit=4194304")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                kind TEXT NOT NULL DEFAULT 'measurement'
+            )
+        """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(outbox)")]
+        if 'kind' not in columns:
+            # Base créée avant les alertes et logs d'erreur : toutes ses entrées sont des mesures
+            self.conn.execute("ALTER TABLE outbox ADD COLUMN kind TEXT NOT NULL DEFAULT 'measurement'")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS outbox_kind ON outbox (kind, id)")
+        for kind, count in self.conn.execute("SELECT kind, COUNT(*) FROM outbox GROUP BY kind"):
+            self._counts[kind] = count
+        pending = {kind: count for kind, count in self._counts.items() if count}
+        if pending:
+            logger.info(f"Outbox: entrées en attente depuis la dernière exécution: {pending}")
+
+    def close(self):
+        """Valide les écritures en cours et ferme la base"""
+        if self.conn:
+            self.flush()
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.conn.close()
+            self.conn = None
+
+    def append(self, payload, kind='measurement'):
+        """Persiste une entrée avec une clé d'idempotence et retourne la clé
+
+        La clé n'est ajoutée qu'à la copie sérialisée : le dict de l'appelant est
+        aussi celui que reçoivent les autres destinations (fichiers, MQTT,
+        Firestore, API locale), qui ne doivent pas la voir.
+        """
+        key = payload.get('idempotency_key') or uuid.uuid4().hex
+
+        if self._uncommitted == 0:
+            self.conn.execute("BEGIN")
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO outbox (idempotency_key, payload, created_at, kind) VALUES (?, ?, ?, ?)",
+            (key, json.dumps({**payload, 'idempotency_key': key}), time.time(), kind)
+        )
+        self._uncommitted += 1
+        self._counts[kind] += cursor.rowcount
+
+        if (self._uncommitted >= self.commit_batch
+                or time.monotonic() - self._last_commit >= self.commit_interval):
+            self.flush()
+        return key
+
+    def flush(self):
+        """Valide la transaction en cours (un seul fsync pour tout le lot)"""
+        if self._uncommitted:
+            self.conn.execute("COMMIT")
+            self._uncommitted = 0
+            self._enforce_cap()
+        self._last_commit = time.monotonic()
+
+    def peek(self, limit=1, kind='measurement'):
+        """Retourne les plus anciennes entrées [(id, payload)] sans les retirer"""
+        # La connexion voit ses propres écritures non validées : pas de commit forcé
+        rows = self.conn.execute(
+            "SELECT id, payload FROM outbox WHERE kind = ? ORDER BY id LIMIT ?", (kind, limit)
+        ).fetchall()
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def ack(self, ids, kind='measurement'):
+        """Retire les entrées envoyées avec succès"""
+        if not ids:
+            return
+        self.conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+        self._counts[kind] = max(0, self._counts[kind] - len(ids))
+
+    def oldest_created_at(self, kind='measurement'):
+        """Horodatage d'écriture de la plus ancienne entrée en attente (None si vide)"""
+        row = self.conn.execute(
+            "SELECT created_at FROM outbox WHERE kind = ? ORDER BY id LIMIT 1", (kind,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def depth(self, kind='measurement'):
+        """Nombre d'entrées en attente d'envoi"""
+        return self._counts[kind]
+
+    def _enforce_cap(self):
+        """Supprime les entrées les plus anciennes au-delà de max_rows, par nature"""
+        for kind, count in self._counts.items():
+            excess = count - self.max_rows
+            if excess <= 0:
+                continue
+            self.conn.execute(
+                "DELETE FROM outbox WHERE id IN (SELECT id FROM outbox WHERE kind = ? ORDER BY id LIMIT ?)",
+                (kind, excess)
+            )
+            self._counts[kind] -= excess
+            self.evicted += excess
+            logger.warning(f"Outbox pleine: {excess} entrées ({kind}) les plus anciennes supprimées")
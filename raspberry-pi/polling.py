@@ -0,0 +1,120 @@
+"""
+Politique de sondage du régulateur (commande M)
+
+L'intervalle entre deux demandes de mesures s'adapte à l'état du bassin au
+lieu d'être fixe et limité à une plage horaire :
+
+- pompes ou électrolyse en marche, ou valeurs en mouvement (écart à la
+  dernière référence supérieur à la tolérance) : intervalle rapide ;
+- filtration en marche, valeurs stables : l'intervalle s'allonge d'un
+  facteur `backoff` à chaque sondage, de `base` jusqu'à `slow` ;
+- relais de filtration arrêté : veille (`idle`), la connexion BLE est gardée
+  avec un sondage espacé, et le retour de la filtration (bit du relais dans la
+  trame M) ramène l'intervalle de base, sans dépendre de l'heure.
+
+observe() est appelée pour chaque trame M (sondée ou spontanée) ; elle
+indique si la mesure demande de sonder plus tôt que prévu, ce qui réveille
+la boucle de monitoring.
+"""
+
+import logging
+
+from change_filter import DEFAULT_DEADBANDS
+
+logger = logging.getLogger(__name__)
+
+MODES = ('active', 'moving', 'stable', 'idle')
+
+_PUMPS = ('pump_plus_active', 'pump_minus_active', 'pump_chlore_active')
+
+_DESCRIPTIONS = {
+    'active': "pompes en marche",
+    'moving': "valeurs en mouvement",
+    'stable': "valeurs stables",
+    'idle': "filtration arrêtée",
+}
+
+
+class PollingPolicy:
+    """Intervalle de sondage adaptatif"""
+
+    def __init__(self, base=30.0, fast=10.0, slow=120.0, idle=300.0, backoff=1.5, deadbands=None):
+        self.base = base
+        self.fast = fast
+        self.slow = max(slow, base)
+        self.idle = idle
+        self.backoff = backoff
+        self.deadbands = DEFAULT_DEADBANDS if deadbands is None else deadbands
+
+        self.mode = None
+        self.interval = base
+        self._reference = None   # valeurs au dernier mouvement détecté
+        self._moving = False
+        self._active = False
+        self._filtering = True
+
+        self.polls = dict.fromkeys(MODES, 0)
+        self.mode_changes = 0
+
+    def _target_mode(self):
+        if not self._filtering:
+            return 'idle'
+        if self._active:
+            return 'active'
+        if self._moving:
+            return 'moving'
+        return 'stable'
+
+    def observe(self, measurement):
+        """Prend en compte une mesure M ; True si elle demande de sonder avant la fin de l'intervalle en cours"""
+        self._filtering = bool(measurement.get('filter_relay_active'))
+        self._active = any(measurement.get(name) for name in _PUMPS)
+
+        reference = self._reference
+        if reference is None:
+            self._reference = measurement
+        else:
+            for name, tolerance in self.deadbands.items():
+                # Même marge que ChangeFilter pour les valeurs arrondies
+                if abs(measurement[name] - reference[name]) >= tolerance - 1e-9:
+                    self._moving = True
+                    self._reference = measurement
+                    break
+
+        mode = self._target_mode()
+        return mode != self.mode and self._interval_for(mode) < self.interval
+
+    def _interval_for(self, mode):
+        if mode == 'idle':
+            return self.idle
+        if mode in ('active', 'moving'):
+            return self.fast
+        if self.mode == 'stable':
+            return min(self.slow, self.interval * self.backoff)
+        return self.base
+
+    def next_interval(self):
+        """Attente avant le prochain sondage (appelée une fois par cycle de la boucle de monitoring)"""
+        mode = self._target_mode()
+        self.interval = self._interval_for(mode)
+        if mode != self.mode:
+            if self.mode is not None:
+                self.mode_changes += 1
+            logger.info(f"Sondage: {_DESCRIPTIONS[mode]}, intervalle {self.interval:.0f}s")
+            self.mode = mode
+        self.polls[mode] += 1
+        # Mouvement pris en compte pour ce cycle : il doit se confirmer pour rester en sondage rapide
+        self._moving = False
+        return self.interval
+
+    @property
+    def is_idle(self):
+        return self.mode == 'idle'
+
+    def get_stats(self):
+        return {
+            'mode': self.mode,
+            'interval': round(self.interval, 1),
+            'polls': dict(self.polls),
+            'mode_changes': self.mode_changes,
+        }
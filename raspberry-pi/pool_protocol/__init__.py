@@ -0,0 +1,31 @@
+"""
+Protocole BLE du régulateur CORELEC (trames de 17 octets)
+
+Paquet partagé par les moniteurs Raspberry Pi et les scripts de python/ :
+découpage du flux (FrameDecoder), décodage trame par trame (decode_frame,
+Measurement), décodage par lots en colonnes (decode_batch) et format binaire
+compact des envois à l'API (encode_measurements).
+"""
+
+from .batch import decode_batch, select_frames
+from .decoder import FRAME_FIELDS, decode_frame
+from .framing import FRAME_LENGTH, FRAME_DELIMITER, FrameDecoder, calculate_crc
+from .records import MEASUREMENT_FIELDS, Measurement, decode_measurement
+from .wire import decode_measurements, encode_frame, encode_measurements
+
+__all__ = [
+    'FRAME_FIELDS',
+    'decode_frame',
+    'decode_batch',
+    'select_frames',
+    'MEASUREMENT_FIELDS',
+    'Measurement',
+    'decode_measurement',
+    'encode_frame',
+    'encode_measurements',
+    'decode_measurements',
+    'FRAME_LENGTH',
+    'FRAME_DELIMITER',
+    'FrameDecoder',
+    'calculate_crc',
+]
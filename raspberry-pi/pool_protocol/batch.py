@@ -0,0 +1,133 @@
+"""
+Décodage par lots : N trames contiguës -> colonnes (array.array)
+
+Pour les outils de reprise et de rejeu qui traitent des milliers de trames :
+au lieu d'un dict par trame, chaque champ de FRAME_FIELDS devient une colonne
+calculée d'un bloc par des opérations C (découpage à pas de 17 octets,
+bytes.translate pour les masques, array pour les mots big-endian). Aucune
+boucle Python par trame sur le chemin nominal.
+"""
+
+import sys
+from array import array
+from functools import lru_cache
+from itertools import repeat
+from operator import truediv
+
+from .decoder import FRAME_FIELDS
+from .framing import CRC_INDEX, FRAME_DELIMITER, FRAME_LENGTH
+
+_NATIVE_BIG_ENDIAN = sys.byteorder == 'big'
+
+
+# Tables bytes.translate de 256 entrées, calculées une fois par masque
+
+@lru_cache(maxsize=None)
+def _flag_table(mask):
+    return bytes(int(i & mask == mask) for i in range(256))
+
+
+@lru_cache(maxsize=None)
+def _bits_table(mask):
+    shift = (mask & -mask).bit_length() - 1
+    return bytes((i & mask) >> shift for i in range(256))
+
+
+@lru_cache(maxsize=None)
+def _differs_table(value):
+    return bytes(int(i != value) for i in range(256))
+
+
+def _byte_column(data, offset):
+    return data[offset::FRAME_LENGTH]
+
+
+def _word_column(data, offset, count):
+    """Mots big-endian (octets offset, offset+1) de chaque trame -> array('H')"""
+    interleaved = bytearray(2 * count)
+    interleaved[0::2] = data[offset::FRAME_LENGTH]
+    interleaved[1::2] = data[offset + 1::FRAME_LENGTH]
+    column = array('H', interleaved)
+    if not _NATIVE_BIG_ENDIAN:
+        column.byteswap()
+    return column
+
+
+def _invalid_mask(data, count, mnemo):
+    """Octet non nul par trame invalide (délimiteurs, mnémonique ou CRC)"""
+    not_delimiter = _differs_table(FRAME_DELIMITER)
+    not_mnemo = _differs_table(mnemo)
+    bad = (int.from_bytes(data[0::FRAME_LENGTH].translate(not_delimiter), 'big')
+           | int.from_bytes(data[FRAME_LENGTH - 1::FRAME_LENGTH].translate(not_delimiter), 'big')
+           | int.from_bytes(data[1::FRAME_LENGTH].translate(not_mnemo), 'big'))
+
+    # XOR des 15 premiers octets et du CRC : nul pour chaque trame valide
+    crc = 0
+    for offset in range(CRC_INDEX + 1):
+        crc ^= int.from_bytes(data[offset::FRAME_LENGTH], 'big')
+    return (bad | crc).to_bytes(count, 'big')
+
+
+def select_frames(data, mnemo='M', validate=True):
+    """Ne garde que les trames du mnémonique donné (et valides si validate) ; retourne des bytes
+
+    data doit être une suite de trames de 17 octets alignées (ex. journal de
+    capture), pas un flux BLE brut : utiliser FrameDecoder dans ce cas.
+    """
+    data = bytes(data)
+    if len(data) % FRAME_LENGTH:
+        raise ValueError(f"Longueur {len(data)} non multiple de {FRAME_LENGTH}")
+    count = len(data) // FRAME_LENGTH
+    code = ord(mnemo)
+
+    if validate:
+        invalid = _invalid_mask(data, count, code)
+        if not any(invalid):
+            return data
+        keep = [i for i, flag in enumerate(invalid) if not flag]
+    else:
+        mnemos = data[1::FRAME_LENGTH]
+        if mnemos.count(code) == count:
+            return data
+        keep = [i for i, value in enumerate(mnemos) if value == code]
+
+    view = memoryview(data)
+    return b''.join(view[i * FRAME_LENGTH:(i + 1) * FRAME_LENGTH] for i in keep)
+
+
+def decode_batch(data, mnemo='M', validate=True):
+    """Décode toutes les trames `mnemo` de data en colonnes {champ: array}
+
+    Colonnes : 'd' pour les valeurs mises à l'échelle, 'H'/'B' pour les
+    valeurs entières, 'B' (0/1) pour les booléens. Les trames d'un autre
+    mnémonique, et les trames invalides si validate, sont ignorées.
+    """
+    fields = FRAME_FIELDS[mnemo]
+    frames = select_frames(data, mnemo, validate)
+    count = len(frames) // FRAME_LENGTH
+
+    raw = {}
+    columns = {}
+    for field in fields:
+        source = (field.offset, field.width)
+        if source not in raw:
+            if field.width == 2:
+                raw[source] = _word_column(frames, field.offset, count)
+            else:
+                raw[source] = _byte_column(frames, field.offset)
+        values = raw[source]
+
+        if field.kind == 'bool':
+            column = array('B', values.translate(_flag_table(field.mask)))
+        elif field.kind == 'bits':
+            column = array('B', values.translate(_bits_table(field.mask)))
+        elif field.scale:
+            column = array('d', map(truediv, values, repeat(field.scale)))
+            if field.digits is not None and field.scale != 10 ** field.digits:
+                column = array('d', map(round, column, repeat(field.digits)))
+        elif field.width == 2:
+            column = values
+        else:
+            column = array('B', values)
+        columns[field.name] = column
+    return columns
@@ -0,0 +1,253 @@
+"""
+Décodage des trames du régulateur, piloté par tables
+
+Chaque mnémonique (M, S, D, E, A, J, B) est décrit par une table de champs
+(offset, largeur, échelle, masque), reprise de csharp/Trames.cs
+(ExtractionTrameX). Les tables sont préparées une fois au chargement en deux
+fonctions par mnémonique : un struct.Struct.unpack_from par groupe d'octets
+sans chevauchement (un seul pour M), puis une conversion par champ, rendues
+en dict (DECODERS) ou en tuple dans l'ordre de la table (VALUE_DECODERS,
+pour les enregistrements compacts de pool_protocol.records).
+"""
+
+import struct
+from collections import namedtuple
+from operator import getitem, itemgetter, truediv
+
+# Un champ de trame
+#   offset : position du premier octet dans la trame
+#   width  : 1 (octet) ou 2 (mot big-endian, cf. Utils.ByteVersDouble)
+#   scale  : diviseur appliqué à la valeur brute (None = valeur entière)
+#   digits : arrondi après mise à l'échelle (None = pas d'arrondi)
+#   mask   : masque de bits appliqué à la valeur brute (None = valeur entière)
+#   kind   : 'int', 'float', 'bool' (tous les bits du masque à 1) ou 'bits' ((v & mask) >> décalage)
+Field = namedtuple('Field', 'name offset width scale digits mask kind')
+
+
+def value(name, offset, width=2, scale=None, digits=None):
+    """Valeur numérique sur 1 ou 2 octets"""
+    return Field(name, offset, width, scale, digits, None, 'float' if scale else 'int')
+
+
+def bits(name, offset, mask):
+    """Sous-champ numérique d'un octet : (octet & mask) >> décalage"""
+    return Field(name, offset, 1, None, None, mask, 'bits')
+
+
+def flag(name, offset, mask):
+    """Booléen : vrai si tous les bits du masque sont à 1"""
+    return Field(name, offset, 1, None, None, mask, 'bool')
+
+
+FRAME_FIELDS = {
+    # Mesures principales (ExtractionTrameM)
+    'M': (
+        value('ph', 2, scale=100.0, digits=2),
+        value('redox', 4),  # entier en mV, comme round(int, 0) dans process_trame d'origine
+        value('chlorine_amp', 4, scale=100.0, digits=2),
+        value('temperature', 6, scale=10.0, digits=1),
+        value('salt', 8, scale=10.0, digits=1),
+        value('alarm', 10, width=1),
+        bits('warning', 11, 0x0F),
+        bits('alarm_redox', 11, 0xF0),
+        bits('regulator_type', 12, 0x0F),
+        flag('pump_plus_active', 12, 0x80),
+        flag('pump_minus_active', 12, 0x40),
+        flag('pump_chlore_active', 12, 0x20),
+        flag('filter_relay_active', 12, 0x10),
+        flag('pump_minus_enabled', 13, 0x01),
+        flag('pump_plus_enabled', 13, 0x02),
+        flag('temperature_sensor', 13, 0x04),
+        flag('salt_sensor', 13, 0x08),
+        flag('flow_switch', 13, 0x10),
+        flag('pump_chlore_enabled', 13, 0x20),
+        flag('pumps_forced', 13, 0x80),
+    ),
+    # Consigne et seuils pH (ExtractionTrameS)
+    'S': (
+        value('ph_setpoint', 2, scale=100.0, digits=2),
+        value('ph_error_max', 10, scale=100.0, digits=2),
+        value('ph_error_min', 12, scale=100.0, digits=2),
+    ),
+    # Seuils température et sel (ExtractionTrameD ; maxima d'après CompositionSeuils)
+    'D': (
+        value('temperature_error_max', 4, width=1),
+        value('temperature_error_min', 5, width=1),
+        value('temperature_warning_max', 6, width=1),
+        value('temperature_warning_min', 7, width=1),
+        value('salt_warning_min', 8, width=1, scale=10.0, digits=1),
+        value('salt_error_min', 9, width=1, scale=10.0, digits=1),
+    ),
+    # Consigne redox / chlore ampérométrique (ExtractionTrameE)
+    'E': (
+        value('redox_setpoint', 2),
+        value('chlorine_setpoint', 2, scale=100.0, digits=2),
+        value('pin_code', 12),
+    ),
+    # Électrolyse (ExtractionTrameA)
+    'A': (
+        value('electrolysis', 2, width=1),
+        value('boost_duration', 2),  # boost actif si > 0
+        value('cover_production', 9, width=1),
+        bits('salinity', 10, 0x03),
+        flag('flow_switch', 10, 0x04),
+        flag('cover_forced', 10, 0x08),
+        flag('cover_active', 10, 0x10),
+        bits('alarm_electrolysis', 12, 0x0F),
+        flag('sleep', 13, 0x60),
+        flag('timer', 13, 0xA0),
+        bits('st_duration', 13, 0x1F),
+    ),
+    # Date (J) et trame B : pas de champ exploité par l'application d'origine
+    'J': (),
+    'B': (),
+}
+
+
+def _unpacker(fields):
+    """Fonction frame -> tuple des valeurs brutes, une par (offset, largeur) distinct
+
+    Les octets sources distincts sont regroupés en structures sans
+    chevauchement (ex. A lit l'octet 2 seul puis le mot 2-3) ; chaque
+    structure couvre la trame entière avec des octets de remplissage.
+    Renvoie aussi l'index de chaque source dans le tuple.
+    """
+    sources = []
+    for field in fields:
+        source = (field.offset, field.width)
+        if source not in sources:
+            sources.append(source)
+
+    # Répartition gloutonne des sources en groupes sans chevauchement
+    groups = []
+    for offset, width in sorted(sources):
+        for group in groups:
+            last_offset, last_width = group[-1]
+            if offset >= last_offset + last_width:
+                group.append((offset, width))
+                break
+        else:
+            groups.append([(offset, width)])
+
+    index = {}
+    unpackers = []
+    for group in groups:
+        fmt = '>'
+        cursor = 0
+        for offset, width in group:
+            if offset > cursor:
+                fmt += f'{offset - cursor}x'
+            fmt += 'H' if width == 2 else 'B'
+            cursor = offset + width
+            index[(offset, width)] = len(index)
+        unpackers.append(struct.Struct(fmt).unpack_from)
+
+    if not unpackers:
+        return (lambda frame: ()), index
+    if len(unpackers) == 1:
+        return unpackers[0], index
+
+    def unpack(frame):
+        raw = ()
+        for unpack_from in unpackers:
+            raw += unpack_from(frame)
+        return raw
+    return unpack, index
+
+
+def _convert(field, raw):
+    """Valeur d'un champ à partir de sa valeur brute"""
+    if field.kind == 'bool':
+        return raw & field.mask == field.mask
+    if field.kind == 'bits':
+        return (raw & field.mask) >> (field.mask & -field.mask).bit_length() - 1
+    if field.kind == 'float':
+        result = raw / field.scale
+        return result if field.digits is None else round(result, field.digits)
+    return raw
+
+
+def _picker(indices):
+    """itemgetter rendant toujours un tuple, même pour zéro ou un index
+
+    itemgetter(i) rend l'élément seul et itemgetter() n'existe pas : une
+    tranche (slice) rend alors un tuple de un ou zéro élément.
+    """
+    if len(indices) > 1:
+        return itemgetter(*indices)
+    if indices:
+        return itemgetter(slice(indices[0], indices[0] + 1))
+    return itemgetter(slice(0, 0))
+
+
+def _build_layout(fields):
+    """Fonctions decode(frame) -> dict et values(frame) -> tuple pour une table de champs
+
+    Les conversions sont résolues une fois : un champ d'un octet devient une
+    table de ses 256 valeurs, un mot une division par son échelle (arrondie
+    seulement si l'échelle n'est pas 10**digits : la division entière/10**d
+    donne déjà le flottant le plus proche de la valeur décimale). Le décodage
+    n'enchaîne que des itemgetter et des map() sur ces tables, puis remet les
+    valeurs dans l'ordre de la table.
+    """
+    # unpack(frame) -> valeurs brutes, une par source (offset, largeur) ; index : source -> position
+    unpack, index = _unpacker(fields)
+
+    # Les champs sont répartis en quatre groupes, chacun converti par un seul map() :
+    #   tabled  : champs d'un octet (entiers, booléens, sous-champs, échelles sur un octet),
+    #             valeur lue dans une table précalculée des 256 valeurs possibles
+    #   scaled  : mots divisés par leur échelle (ph, temperature...)
+    #   rounded : mots divisés puis arrondis (échelle autre que 10**digits ; aucun aujourd'hui)
+    #   plain   : mots gardés entiers (redox, pin_code...)
+    tabled = [field for field in fields if field.width == 1]
+    scaled = [field for field in fields if field.width == 2 and field.kind == 'float'
+              and (field.digits is None or field.scale == 10 ** field.digits)]
+    rounded = [field for field in fields if field.width == 2 and field.kind == 'float' and field not in scaled]
+    plain = [field for field in fields if field.width == 2 and field.kind != 'float']
+
+    def pick(group):
+        # Valeurs brutes des champs du groupe, dans l'ordre du groupe (une source peut servir
+        # à plusieurs champs : octet 12 de M pour regulator_type et quatre booléens)
+        return _picker([index[(field.offset, field.width)] for field in group])
+
+    tables = tuple(tuple(_convert(field, raw) for raw in range(256)) for field in tabled)
+    pick_tabled, pick_scaled, pick_rounded, pick_plain = map(pick, (tabled, scaled, rounded, plain))
+    scales = tuple(field.scale for field in scaled)
+    round_scales = tuple(field.scale for field in rounded)
+    round_digits = tuple(field.digits for field in rounded)
+    # Les groupes sont concaténés dans l'ordre tabled, scaled, rounded, plain ;
+    # reorder remet les valeurs dans l'ordre de la table de champs
+    grouped = tabled + scaled + rounded + plain
+    reorder = _picker([grouped.index(field) for field in fields])
+    names = tuple(field.name for field in fields)
+
+    def values(frame):
+        raw = unpack(frame)
+        return reorder((
+            # tables[i][octet] pour chaque champ d'un octet
+            *map(getitem, tables, pick_tabled(raw)),
+            # mot / échelle
+            *map(truediv, pick_scaled(raw), scales),
+            # round(mot / échelle, digits)
+            *map(round, map(truediv, pick_rounded(raw), round_scales), round_digits),
+            # mot tel quel
+            *pick_plain(raw),
+        ))
+
+    def decode(frame):
+        return dict(zip(names, values(frame)))
+
+    return decode, values
+
+
+_LAYOUTS = {ord(mnemo): _build_layout(fields) for mnemo, fields in FRAME_FIELDS.items()}
+DECODERS = {code: decode for code, (decode, _) in _LAYOUTS.items()}
+VALUE_DECODERS = {code: values for code, (_, values) in _LAYOUTS.items()}
+
+
+def decode_frame(frame):
+    """Décode une trame de 17 octets validée ; None si le mnémonique est inconnu"""
+    decoder = DECODERS.get(frame[1])
+    if decoder is None:
+        return None
+    return decoder(frame)
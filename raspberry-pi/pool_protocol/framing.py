@@ -0,0 +1,135 @@
+"""
+Découpage du flux BLE en trames du régulateur
+
+Une trame fait 17 octets : 0x2A, mnémonique, 13 octets de données, CRC (XOR
+des 15 premiers octets), 0x2A. Les notifications BLE peuvent fragmenter ou
+regrouper les trames et contenir du bruit.
+"""
+
+import struct
+from functools import reduce
+from operator import xor
+
+FRAME_LENGTH = 17
+FRAME_DELIMITER = 0x2A
+CRC_INDEX = FRAME_LENGTH - 2
+
+# Les 16 premiers octets d'une trame (CRC compris) en deux entiers de 64 bits
+_WORDS = struct.Struct('<QQ').unpack_from
+
+
+def calculate_crc(data):
+    """CRC des trames : XOR de tous les octets"""
+    return reduce(xor, data, 0)
+
+
+def _xor_fold(data):
+    """XOR des 15 octets de la trame par repliement d'entier (évite une boucle Python par octet)"""
+    value = int.from_bytes(data, 'big')
+    value = (value >> 64) ^ (value & 0xFFFFFFFFFFFFFFFF)
+    value = (value >> 32) ^ (value & 0xFFFFFFFF)
+    value = (value >> 16) ^ (value & 0xFFFF)
+    return (value >> 8) ^ (value & 0xFF)
+
+
+class FrameDecoder:
+    """Décodeur incrémental : reprend l'analyse là où la notification précédente s'est arrêtée
+
+    Le buffer ne conserve jamais plus d'une trame incomplète (< 17 octets)
+    entre deux appels à feed() : tout octet qui ne peut plus débuter une trame
+    valide est écarté au fil de l'analyse.
+    """
+
+    def __init__(self):
+        self._buffer = b''
+        self._in_sync = True
+
+        self.frames = 0
+        self.resyncs = 0
+        self.crc_errors = 0
+        self.bytes_discarded = 0
+
+    def feed(self, data):
+        """Ajoute les octets reçus ; retourne la liste des trames complètes et valides (bytes)
+
+        Chemin critique (une fois par notification BLE) : le bruit est sauté
+        par bytes.find, le CRC vérifié sur deux mots de 64 bits lus en place,
+        et chaque trame n'est copiée qu'une fois. Le buffer, jamais plus grand
+        qu'une trame incomplète plus une notification, est un bytes recomposé
+        à chaque appel : plus rapide qu'un bytearray compacté à ces tailles.
+
+        Liste de bytes plutôt que générateur de memoryview : pour 17 octets,
+        une tranche memoryview coûte une allocation comme la copie, et les
+        trames survivent à la notification (capture, réponse attendue par
+        l'ordonnanceur de commandes), où un bytes se compare, se hache et
+        s'affiche (hex) sans conversion. Mesurés avec bench_framing.py, le
+        générateur et les memoryview ne sont pas plus rapides (égaux au bruit
+        de mesure près, plus lents sur des notifications de 20 à 40 octets).
+        Une liste garantit en outre que le buffer et les compteurs sont à jour
+        au retour de feed(), même si l'appelant ne parcourt pas le résultat
+        jusqu'au bout.
+        """
+        buffer = self._buffer + data if self._buffer else bytes(data)
+        end = len(buffer)
+        # Chemin rapide : pas encore de quoi former une trame
+        if end < FRAME_LENGTH:
+            self._buffer = buffer
+            return ()
+
+        frames = []
+        pos = 0
+        in_sync = self._in_sync
+        while True:
+            if pos < end and buffer[pos] == FRAME_DELIMITER:
+                last = pos + FRAME_LENGTH
+                if last > end:
+                    break
+                if buffer[last - 1] == FRAME_DELIMITER:
+                    # XOR des 15 octets == CRC  <=>  XOR des 16 premiers octets nul
+                    low, high = _WORDS(buffer, pos)
+                    value = low ^ high
+                    value ^= value >> 32
+                    value ^= value >> 16
+                    value ^= value >> 8
+                    if not value & 0xFF:
+                        frames.append(buffer[pos:last])
+                        pos = last
+                        in_sync = True
+                        continue
+                    self.crc_errors += 1
+                # Faux début de trame : on avance d'un octet
+                skip = 1
+            else:
+                start = buffer.find(FRAME_DELIMITER, pos)
+                skip = (end if start < 0 else start) - pos
+                if not skip:
+                    break
+            self.bytes_discarded += skip
+            pos += skip
+            if in_sync:
+                self.resyncs += 1
+                in_sync = False
+
+        self._buffer = buffer[pos:]
+        self._in_sync = in_sync
+        self.frames += len(frames)
+        return frames
+
+    def pending(self):
+        """Nombre d'octets en attente (trame incomplète)"""
+        return len(self._buffer)
+
+    def reset(self):
+        """Vide le buffer (nouvelle connexion) en conservant les compteurs"""
+        self._buffer = b''
+        self._in_sync = True
+
+    def get_stats(self):
+        """Compteurs du décodeur"""
+        return {
+            'frames': self.frames,
+            'resyncs': self.resyncs,
+            'crc_errors': self.crc_errors,
+            'bytes_discarded': self.bytes_discarded,
+            'pending_bytes': self.pending(),
+        }
@@ -0,0 +1,35 @@
+"""
+Enregistrement compact d'une trame de mesures (M)
+
+Measurement est un tuple nommé (pas de dict par instance) dont les champs
+suivent la table FRAME_FIELDS['M'], précédés de l'horodatage. À préférer au
+dict de decode_frame() pour conserver beaucoup de mesures en mémoire ; la
+conversion en dict (_asdict) n'est faite qu'au moment de la sérialisation.
+"""
+
+from collections import namedtuple
+
+from .decoder import FRAME_FIELDS, VALUE_DECODERS
+
+MEASUREMENT_MNEMO = ord('M')
+MEASUREMENT_FIELDS = ('timestamp',) + tuple(field.name for field in FRAME_FIELDS['M'])
+
+_values_M = VALUE_DECODERS[MEASUREMENT_MNEMO]
+
+
+class Measurement(namedtuple('Measurement', MEASUREMENT_FIELDS)):
+    """Mesures d'une trame M (timestamp : ISO 8601 ou None)"""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_frame(cls, frame, timestamp=None):
+        """Construit l'enregistrement depuis une trame M validée de 17 octets"""
+        return tuple.__new__(cls, (timestamp, *_values_M(frame)))
+
+
+def decode_measurement(frame, timestamp=None):
+    """Measurement si la trame est une trame M, None sinon"""
+    if frame[1] != MEASUREMENT_MNEMO:
+        return None
+    return Measurement.from_frame(frame, timestamp)
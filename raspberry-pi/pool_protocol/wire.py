@@ -0,0 +1,158 @@
+"""
+Format binaire compact des mesures envoyées à l'API
+
+Au lieu d'un objet JSON d'une vingtaine de clés (~550 octets), chaque mesure
+voyage sous forme de trame de 17 octets (~45 octets par mesure en tout), reconstruite à partir des champs
+décodés avec la même table FRAME_FIELDS. L'API la décode avec sa copie de la
+table (api-cloud/lib/frame-codec.js).
+
+Corps (Content-Type: application/vnd.pool-monitor.frames) :
+    "PMF" + version (1 octet), puis pour chaque mesure :
+    flags        u8    1 : regulator_id, 2 : summary, 4 : device_alerts,
+                       8 : idempotency_key texte (sinon UUID hexadécimal sur 16 octets)
+    timestamp    u64   millisecondes depuis l'epoch (UTC), petit-boutiste
+    clé          16 octets (UUID) ou u8 longueur + UTF-8
+    trame        17 octets
+    regulator_id u8 longueur + UTF-8                 (si flag 1)
+    summary      u16 longueur + JSON UTF-8            (si flag 2)
+"""
+
+import json
+import struct
+from datetime import datetime, timedelta, timezone
+
+from .decoder import FRAME_FIELDS, decode_frame
+from .framing import CRC_INDEX, FRAME_DELIMITER, FRAME_LENGTH, _xor_fold
+
+CONTENT_TYPE = 'application/vnd.pool-monitor.frames'
+MAGIC = b'PMF\x01'
+
+FLAG_REGULATOR = 0x01
+FLAG_SUMMARY = 0x02
+FLAG_DEVICE_ALERTS = 0x04
+FLAG_TEXT_KEY = 0x08
+
+_HEADER = struct.Struct('<BQ')
+_EPOCH = datetime(1970, 1, 1)
+
+
+def encode_frame(mnemo, fields):
+    """Trame de 17 octets (CRC compris) portant les valeurs `fields` décodées par decode_frame"""
+    frame = bytearray(FRAME_LENGTH)
+    frame[0] = frame[-1] = FRAME_DELIMITER
+    frame[1] = ord(mnemo)
+    for field in FRAME_FIELDS[mnemo]:
+        value = fields[field.name]
+        if field.kind == 'bool':
+            if value:
+                frame[field.offset] |= field.mask
+            continue
+        if field.kind == 'bits':
+            shift = (field.mask & -field.mask).bit_length() - 1
+            frame[field.offset] |= (int(value) << shift) & field.mask
+            continue
+        raw = round(value * field.scale) if field.scale else int(value)
+        if field.width == 2:
+            frame[field.offset] = (raw >> 8) & 0xFF
+            frame[field.offset + 1] = raw & 0xFF
+        else:
+            frame[field.offset] = raw & 0xFF
+    frame[CRC_INDEX] = _xor_fold(frame[:CRC_INDEX])
+    return bytes(frame)
+
+
+def _timestamp_ms(timestamp):
+    """ISO 8601 UTC (naïf, comme datetime.utcnow().isoformat()) -> millisecondes"""
+    moment = datetime.fromisoformat(timestamp)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return (moment - _EPOCH) // timedelta(milliseconds=1)
+
+
+def encode_measurements(measurements):
+    """Corps binaire d'un lot de mesures (dicts de process_trame, avec idempotency_key)"""
+    body = bytearray(MAGIC)
+    for measurement in measurements:
+        key = measurement.get('idempotency_key') or ''
+        regulator_id = measurement.get('regulator_id')
+        summary = measurement.get('summary')
+
+        flags = 0
+        if regulator_id is not None:
+            flags |= FLAG_REGULATOR
+        if summary is not None:
+            flags |= FLAG_SUMMARY
+        if measurement.get('device_alerts'):
+            flags |= FLAG_DEVICE_ALERTS
+        try:
+            raw_key = bytes.fromhex(key) if len(key) == 32 else None
+        except ValueError:
+            raw_key = None
+        if raw_key is None:
+            flags |= FLAG_TEXT_KEY
+
+        body += _HEADER.pack(flags, _timestamp_ms(measurement['timestamp']))
+        if raw_key is None:
+            encoded = key.encode()
+            body.append(len(encoded))
+            body += encoded
+        else:
+            body += raw_key
+        body += encode_frame('M', measurement)
+        if regulator_id is not None:
+            encoded = str(regulator_id).encode()
+            body.append(len(encoded))
+            body += encoded
+        if summary is not None:
+            encoded = json.dumps(summary, separators=(',', ':')).encode()
+            body += struct.pack('<H', len(encoded))
+            body += encoded
+    return bytes(body)
+
+
+def decode_measurements(body):
+    """Inverse de encode_measurements (mêmes clés que les mesures JSON) ; ValueError si le corps est invalide"""
+    if body[:len(MAGIC)] != MAGIC:
+        raise ValueError("En-tête du format binaire invalide")
+    measurements = []
+    pos = len(MAGIC)
+    end = len(body)
+    try:
+        while pos < end:
+            flags, ms = _HEADER.unpack_from(body, pos)
+            pos += _HEADER.size
+            if flags & FLAG_TEXT_KEY:
+                length = body[pos]
+                key = body[pos + 1:pos + 1 + length].decode()
+                pos += 1 + length
+            else:
+                key = body[pos:pos + 16].hex()
+                pos += 16
+            frame = body[pos:pos + FRAME_LENGTH]
+            pos += FRAME_LENGTH
+            if (len(frame) != FRAME_LENGTH or frame[1] != ord('M')
+                    or _xor_fold(frame[:CRC_INDEX]) != frame[CRC_INDEX]):
+                raise ValueError("Trame invalide dans le format binaire")
+
+            measurement = {
+                'timestamp': (_EPOCH + timedelta(milliseconds=ms)).isoformat(timespec='milliseconds'),
+                **decode_frame(frame),
+            }
+            if flags & FLAG_REGULATOR:
+                length = body[pos]
+                measurement['regulator_id'] = body[pos + 1:pos + 1 + length].decode()
+                pos += 1 + length
+            if flags & FLAG_SUMMARY:
+                length, = struct.unpack_from('<H', body, pos)
+                measurement['summary'] = json.loads(body[pos + 2:pos + 2 + length])
+                pos += 2 + length
+            if flags & FLAG_DEVICE_ALERTS:
+                measurement['device_alerts'] = True
+            if key:
+                measurement['idempotency_key'] = key
+            measurements.append(measurement)
+    except (IndexError, struct.error, UnicodeDecodeError) as e:
+        raise ValueError(f"Format binaire tronqué: {e}")
+    if pos != end:
+        raise ValueError("Format binaire tronqué")
+    return measurements
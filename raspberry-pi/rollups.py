@@ -0,0 +1,240 @@
+"""
+Agrégats horaires, journaliers et glissants sur 24 h, tenus à jour à chaque mesure
+
+Pour pH, redox, température et sel : nombre, min, max, moyenne et variance
+(algorithme de Welford, numériquement stable), pour l'heure et le jour en
+cours (UTC, comme timeseries.py). Les heures terminées sont conservées en
+mémoire : la fenêtre glissante de 24 h est leur fusion (formule de Chan)
+avec l'heure en cours, sans relire aucune mesure.
+
+Les tranches terminées sont transmises à l'API (POST /daily-averages, via
+l'outbox), ainsi que des instantanés provisoires de l'heure et du jour en
+cours, que l'API remplace au fil des envois : /stats et /history y sont
+calculés sans parcourir les mesures brutes. L'état est sauvegardé dans un
+fichier JSON pour survivre aux redémarrages.
+"""
+
+import json
+import logging
+import math
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from timeseries import METRICS
+
+logger = logging.getLogger(__name__)
+
+HOUR = 3600
+DAY = 86400
+
+
+class RunningStats:
+    """Nombre, moyenne, somme des carrés des écarts (M2), min et max de chaque mesure"""
+
+    __slots__ = ('count', 'means', 'm2s', 'mins', 'maxs')
+
+    def __init__(self):
+        self.count = 0
+        self.means = [0.0] * len(METRICS)
+        self.m2s = [0.0] * len(METRICS)
+        self.mins = [math.inf] * len(METRICS)
+        self.maxs = [-math.inf] * len(METRICS)
+
+    def add(self, values):
+        self.count += 1
+        count = self.count
+        means, m2s, mins, maxs = self.means, self.m2s, self.mins, self.maxs
+        for i, value in enumerate(values):
+            delta = value - means[i]
+            means[i] += delta / count
+            m2s[i] += delta * (value - means[i])
+            if value < mins[i]:
+                mins[i] = value
+            if value > maxs[i]:
+                maxs[i] = value
+
+    def merge(self, other):
+        """Fusion de deux agrégats (formule de Chan), sans les mesures d'origine"""
+        if not other.count:
+            return
+        total = self.count + other.count
+        for i in range(len(METRICS)):
+            delta = other.means[i] - self.means[i]
+            self.means[i] += delta * other.count / total
+            self.m2s[i] += other.m2s[i] + delta * delta * self.count * other.count / total
+            self.mins[i] = min(self.mins[i], other.mins[i])
+            self.maxs[i] = max(self.maxs[i], other.maxs[i])
+        self.count = total
+
+    def std(self, i):
+        """Écart type (échantillon) de la mesure i"""
+        return math.sqrt(self.m2s[i] / (self.count - 1)) if self.count > 1 else 0.0
+
+    def to_dict(self):
+        """Forme fusionnable transmise à l'API : {count, metric: {mean, m2, min, max}}"""
+        result = {'count': self.count}
+        for i, name in enumerate(METRICS):
+            result[name] = {'mean': self.means[i], 'm2': self.m2s[i], 'min': self.mins[i], 'max': self.maxs[i]}
+        return result
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.count = data['count']
+        for i, name in enumerate(METRICS):
+            metric = data[name]
+            stats.means[i], stats.m2s[i] = metric['mean'], metric['m2']
+            stats.mins[i], stats.maxs[i] = metric['min'], metric['max']
+        return stats
+
+    def summary(self):
+        """Même forme que storage.getStats côté API : {metric: {avg, min, max, std}}"""
+        result = {'count': self.count}
+        for i, name in enumerate(METRICS):
+            if self.count:
+                result[name] = {'avg': round(self.means[i], 2), 'min': round(self.mins[i], 2),
+                                'max': round(self.maxs[i], 2), 'std': round(self.std(i), 3)}
+            else:
+                result[name] = None
+        return result
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class RollupTracker:
+    """Agrégats de l'heure et du jour en cours, et des dernières heures terminées"""
+
+    def __init__(self, regulator_id=None, path=None, window_hours=24):
+        self.regulator_id = regulator_id
+        self.path = path
+        self.window_hours = window_hours
+
+        self.hour = None  # (début epoch, RunningStats)
+        self.day = None
+        self.recent_hours = deque(maxlen=window_hours)  # heures terminées, (début, RunningStats)
+
+        self.measurements = 0
+        self.finished = 0
+        self.out_of_order = 0
+
+    def add(self, measurement, timestamp=None):
+        """Ajoute une mesure ; retourne les tranches terminées (entrées pour l'API) à transmettre"""
+        ts = time.time() if timestamp is None else timestamp
+        hour_start = ts - ts % HOUR
+        if self.hour is not None and hour_start < self.hour[0]:
+            # Horloge revenue en arrière : la mesure n'appartient plus à une tranche ouverte
+            self.out_of_order += 1
+            return []
+
+        finished = []
+        if self.hour is None or hour_start > self.hour[0]:
+            if self.hour is not None and self.hour[1].count:
+                finished.append(self._entry('hour', *self.hour, final=True))
+                self.recent_hours.append(self.hour)
+            self.hour = (hour_start, RunningStats())
+        day_start = ts - ts % DAY
+        if self.day is None or day_start > self.day[0]:
+            if self.day is not None and self.day[1].count:
+                finished.append(self._entry('day', *self.day, final=True))
+            self.day = (day_start, RunningStats())
+
+        values = tuple(float(measurement[name]) for name in METRICS)
+        self.hour[1].add(values)
+        self.day[1].add(values)
+        self.measurements += 1
+        self.finished += len(finished)
+        return finished
+
+    def sliding(self, now=None):
+        """Fenêtre glissante : heures terminées des window_hours dernières heures + heure en cours"""
+        now = time.time() if now is None else now
+        since = now - self.window_hours * HOUR
+        stats = RunningStats()
+        for start, hour in self.recent_hours:
+            if start + HOUR > since:
+                stats.merge(hour)
+        if self.hour is not None:
+            stats.merge(self.hour[1])
+        return stats
+
+    def snapshot(self):
+        """Entrées provisoires de l'heure et du jour en cours (remplacées côté API par les suivantes)"""
+        return [self._entry(period, *current, final=False)
+                for period, current in (('hour', self.hour), ('day', self.day))
+                if current is not None and current[1].count]
+
+    def _entry(self, period, start, stats, final):
+        """Entrée au format dailyAverages de l'API (avg_/min_/max_ + std_ et agrégat fusionnable)"""
+        key = f"{period}-{_iso(start)}"
+        if self.regulator_id is not None:
+            key += f"-{self.regulator_id}"
+        entry = {
+            'id': key,
+            'period': period,
+            'date': _iso(start)[:10],
+            'timestamp': _iso(start),
+            'final': final,
+            'measurement_count': stats.count,
+        }
+        for i, name in enumerate(METRICS):
+            entry[f'avg_{name}'] = round(stats.means[i], 2)
+            entry[f'min_{name}'] = round(stats.mins[i], 2)
+            entry[f'max_{name}'] = round(stats.maxs[i], 2)
+            entry[f'std_{name}'] = round(stats.std(i), 3)
+        entry['stats'] = stats.to_dict()
+        if self.regulator_id is not None:
+            entry['regulator_id'] = self.regulator_id
+        if final:
+            # Une tranche terminée rejouée depuis l'outbox n'est enregistrée qu'une fois
+            entry['idempotency_key'] = f"{key}-final"
+        return entry
+
+    # ==================== PERSISTANCE ====================
+
+    def save(self):
+        """Écriture atomique de l'état (fichier temporaire puis renommage)"""
+        if not self.path:
+            return
+        state = {
+            'hour': [self.hour[0], self.hour[1].to_dict()] if self.hour else None,
+            'day': [self.day[0], self.day[1].to_dict()] if self.day else None,
+            'recent_hours': [[start, stats.to_dict()] for start, stats in self.recent_hours],
+        }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def load(self):
+        """Reprend l'état sauvegardé ; les tranches échues seront transmises à la prochaine mesure"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            for period in ('hour', 'day'):
+                if state.get(period):
+                    start, stats = state[period]
+                    setattr(self, period, (start, RunningStats.from_dict(stats)))
+            self.recent_hours.extend((start, RunningStats.from_dict(stats)) for start, stats in state['recent_hours'])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Agrégats: état illisible ({e}), nouveau départ")
+            self.hour = self.day = None
+            self.recent_hours.clear()
+            return
+        logger.info(f"Agrégats: état repris ({len(self.recent_hours)} heures terminées en mémoire)")
+
+    def get_stats(self):
+        return {
+            'measurements': self.measurements,
+            'finished': self.finished,
+            'out_of_order': self.out_of_order,
+            'sliding_24h': self.sliding().summary(),
+        }
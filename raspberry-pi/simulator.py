@@ -0,0 +1,679 @@
+#!/usr/bin/env python3
+"""
+Régulateur CORELEC simulé (sans matériel) et banc de rejeu
+
+RegulatorSimulator produit des trames de 17 octets réalistes (M, S, D, E, A,
+B, J) en réponse aux commandes `*R?<X><crc>*`, avec latence, fragmentation
+des notifications, bruit, erreurs de CRC et déconnexions paramétrables. Il
+peut aussi pousser des trames sans commande (débit fixe) ou rejouer une
+capture à N fois la vitesse.
+
+SimulatedBleakClient / SimulatedBleakScanner reprennent l'interface bleak
+utilisée par le moniteur ; install() les substitue aux classes bleak des
+modules indiqués. En ligne de commande, le script exécute
+bluetooth_monitor_cloud.main() complet contre des régulateurs simulés et une
+API locale factice, puis affiche les compteurs.
+
+Usage: python3 simulator.py [--regulators 2] [--push-rate 1000] [--duration 30]
+       python3 simulator.py --replay capture.log --speed 100
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+from pool_protocol import FRAME_DELIMITER, FRAME_LENGTH, calculate_crc, decode_measurements
+from pool_protocol.wire import CONTENT_TYPE as FRAMES_CONTENT_TYPE
+
+BT_UART_SERVICE = "0bd51666-e7cb-469b-8e4d-2742f1ba77cc"
+BT_UART_CHARACTERISTIC = "e7add780-b042-4876-aae1-112855353cc1"
+UART_HANDLE = 14
+
+# Adresse -> RegulatorSimulator, renseigné par install()
+_SIMULATORS = {}
+
+
+def build_frame(mnemo, payload):
+    """Trame complète : 0x2A, mnémonique, 13 octets de données, CRC, 0x2A"""
+    frame = bytearray([FRAME_DELIMITER, ord(mnemo)])
+    frame += bytes(payload).ljust(13, b'\x00')[:13]
+    frame.append(calculate_crc(frame))
+    frame.append(FRAME_DELIMITER)
+    return bytes(frame)
+
+
+def load_capture(path):
+    """Lit une capture : lignes "<epoch> <hex>", journal du moniteur ("... - Trame reçue: <hex>")
+    ou répertoire de captures binaires (CAPTURE_PATH, voir capture.py)
+
+    Retourne [(horodatage en secondes, trame)] ; les lignes sans trame sont ignorées.
+    """
+    if os.path.isdir(path):
+        from capture import CaptureReader
+
+        frames = []
+        for stamps, data in CaptureReader(path).chunks():
+            frames.extend((ts, data[i * FRAME_LENGTH:(i + 1) * FRAME_LENGTH]) for i, ts in enumerate(stamps))
+        return frames
+    log_line = re.compile(r'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),(\d{3}) .*Trame reçue: ([0-9a-fA-F]+)')
+    frames = []
+    with open(path) as f:
+        for line in f:
+            match = log_line.match(line)
+            if match:
+                ts = time.mktime(time.strptime(match.group(1), '%Y-%m-%d %H:%M:%S')) + int(match.group(2)) / 1000
+                frames.append((ts, bytes.fromhex(match.group(3))))
+                continue
+            parts = line.split()
+            if len(parts) == 2:
+                try:
+                    frames.append((float(parts[0]), bytes.fromhex(parts[1])))
+                except ValueError:
+                    pass
+    return frames
+
+
+class RegulatorSimulator:
+    """État d'un régulateur simulé et défauts injectés dans le lien BLE"""
+
+    def __init__(self, name='CORELEC Regulateur', address='5E:00:00:00:00:01', latency=0.05, jitter=0.02,
+                 max_chunk=20, noise=0.0, crc_error_rate=0.0, drop_rate=0.0, disconnect_after=None,
+                 push_rate=0.0, replay=None, speed=1.0, connect_delay=0.05, seed=None):
+        self.name = name
+        self.address = address.upper()
+        self.latency = latency
+        self.jitter = jitter
+        self.max_chunk = max_chunk              # taille max d'une notification (octets)
+        self.noise = noise                      # probabilité d'octets parasites avant une trame
+        self.crc_error_rate = crc_error_rate    # probabilité de CRC faux
+        self.drop_rate = drop_rate              # probabilité qu'une commande reste sans réponse
+        self.disconnect_after = disconnect_after  # déconnexion après N trames (None : jamais)
+        self.push_rate = push_rate              # trames M envoyées spontanément par seconde
+        self.replay = replay                    # [(horodatage, trame)] rejouées à `speed` fois la vitesse
+        self.speed = speed
+        self.connect_delay = connect_delay
+        self.rng = random.Random(seed)
+
+        self.ph = 7.2
+        self.redox = 700
+        self.temperature = 26.0
+        self.salt = 3.5
+        self.pump_minus = False
+
+        self.commands = 0
+        self.frames = 0
+        self.bytes = 0
+        self.crc_errors = 0
+        self.dropped = 0
+        self.disconnects = 0
+
+    # ==================== TRAMES ====================
+
+    def _drift(self):
+        """Marche aléatoire bornée des mesures ; la pompe pH- démarre au-dessus de 7.4"""
+        rng = self.rng
+        self.ph = min(8.0, max(6.6, self.ph + rng.uniform(-0.02, 0.02) - (0.01 if self.pump_minus else 0)))
+        self.redox = min(850, max(550, self.redox + rng.randint(-3, 3)))
+        self.temperature = min(32.0, max(18.0, self.temperature + rng.uniform(-0.05, 0.05)))
+        self.salt = min(5.0, max(2.5, self.salt + rng.uniform(-0.01, 0.01)))
+        if self.ph > 7.4:
+            self.pump_minus = True
+        elif self.ph < 7.2:
+            self.pump_minus = False
+
+    def frame(self, mnemo):
+        """Trame réponse pour le mnémonique demandé"""
+        if mnemo == 'M':
+            self._drift()
+            ph = round(self.ph * 100)
+            temperature = round(self.temperature * 10)
+            salt = round(self.salt * 10)
+            state = 0x01 | (0x40 if self.pump_minus else 0) | 0x10  # régulateur pH/Rx, relais filtration
+            return build_frame('M', [
+                ph >> 8, ph & 0xFF, self.redox >> 8, self.redox & 0xFF,
+                temperature >> 8, temperature & 0xFF, salt >> 8, salt & 0xFF,
+                0, 0, state, 0x1F,
+            ])
+        if mnemo == 'S':
+            return build_frame('S', [0x02, 0xD0, 0, 0, 0, 0, 0, 0, 0x03, 0x20, 0x02, 0xA8])
+        if mnemo == 'D':
+            return build_frame('D', [0, 0, 35, 10, 32, 12, 30, 25])
+        if mnemo == 'E':
+            return build_frame('E', [0x02, 0xBC, 0, 0, 0, 0, 0, 0, 0, 0, 0x04, 0xD2])
+        if mnemo == 'A':
+            return build_frame('A', [60, 0, 0, 0, 0, 0, 0, 20, 0x11, 0, 0, 0x00])
+        return build_frame(mnemo, [])
+
+    def parse_command(self, data):
+        """Mnémonique d'une commande `*R?<X><crc>*` valide, None sinon"""
+        data = bytes(data)
+        if (len(data) != 6 or data[0] != FRAME_DELIMITER or data[5] != FRAME_DELIMITER
+                or data[1:3] != b'R?' or calculate_crc(data[:4]) != data[4]):
+            return None
+        return chr(data[3])
+
+    def notifications(self, frame):
+        """Découpe une trame (avec défauts éventuels) en notifications BLE"""
+        rng = self.rng
+        payload = bytearray(frame)
+        if self.crc_error_rate and rng.random() < self.crc_error_rate:
+            payload[15] ^= 0xFF
+            self.crc_errors += 1
+        if self.noise and rng.random() < self.noise:
+            payload[:0] = bytes(rng.randrange(256) for _ in range(rng.randint(1, 8)))
+        chunks = []
+        i = 0
+        while i < len(payload):
+            size = rng.randint(1, self.max_chunk) if self.max_chunk < len(payload) else len(payload)
+            chunks.append(bytearray(payload[i:i + size]))
+            i += size
+        self.frames += 1
+        self.bytes += len(payload)
+        return chunks
+
+    def get_stats(self):
+        return {
+            'commands': self.commands,
+            'frames': self.frames,
+            'bytes': self.bytes,
+            'crc_errors': self.crc_errors,
+            'dropped': self.dropped,
+            'disconnects': self.disconnects,
+        }
+
+
+# ==================== INTERFACE BLEAK ====================
+
+class _Device:
+    def __init__(self, simulator):
+        self.name = simulator.name
+        self.address = simulator.address
+        self.details = None
+
+    def __repr__(self):
+        return f"{self.address}: {self.name}"
+
+
+class _Advertisement:
+    def __init__(self, simulator):
+        self.local_name = simulator.name
+        self.rssi = -60
+        self.service_uuids = [BT_UART_SERVICE]
+
+
+class _Characteristic:
+    def __init__(self, uuid, handle):
+        self.uuid = uuid
+        self.handle = handle
+        self.properties = ['write', 'notify']
+
+
+class _Services:
+    """Table GATT minimale : service UART et sa caractéristique"""
+
+    def __init__(self):
+        self.uart = _Characteristic(BT_UART_CHARACTERISTIC, UART_HANDLE)
+
+    def get_service(self, uuid):
+        return self if str(uuid).lower() == BT_UART_SERVICE else None
+
+    def get_characteristic(self, specifier):
+        if specifier == UART_HANDLE or str(specifier).lower() == BT_UART_CHARACTERISTIC:
+            return self.uart
+        return None
+
+    def __iter__(self):
+        return iter([self])
+
+    @property
+    def uuid(self):
+        return BT_UART_SERVICE
+
+
+class SimulatedBleakClient:
+    """Remplaçant de BleakClient relié à un RegulatorSimulator (retrouvé par adresse)"""
+
+    def __init__(self, address_or_ble_device, disconnected_callback=None, services=None, timeout=10.0, **kwargs):
+        address = getattr(address_or_ble_device, 'address', address_or_ble_device)
+        self.address = address.upper()
+        self.simulator = _SIMULATORS.get(self.address)
+        self._disconnected_callback = disconnected_callback
+        self._timeout = timeout
+        self._connected = False
+        self._callback = None
+        self._tasks = set()
+        self._send_lock = asyncio.Lock()
+        self.services = _Services()
+
+    @property
+    def is_connected(self):
+        return self._connected
+
+    async def connect(self, **kwargs):
+        if self.simulator is None:
+            await asyncio.sleep(min(self._timeout, 1.0))
+            raise Exception(f"Appareil {self.address} introuvable")
+        await asyncio.sleep(self.simulator.connect_delay)
+        self._connected = True
+        return True
+
+    async def disconnect(self):
+        was_connected = self._connected
+        self._shutdown()
+        if was_connected and self._disconnected_callback:
+            self._disconnected_callback(self)
+        return True
+
+    async def get_services(self):
+        return self.services
+
+    async def start_notify(self, char_specifier, callback, **kwargs):
+        if not self._connected:
+            raise Exception("Non connecté")
+        self._callback = callback
+        simulator = self.simulator
+        if simulator.replay:
+            self._spawn(self._replay())
+        elif simulator.push_rate:
+            self._spawn(self._push())
+
+    async def stop_notify(self, char_specifier):
+        self._callback = None
+
+    async def write_gatt_char(self, char_specifier, data, response=None):
+        if not self._connected:
+            raise Exception("Non connecté")
+        simulator = self.simulator
+        simulator.commands += 1
+        mnemo = simulator.parse_command(data)
+        if mnemo is None:
+            return
+        if simulator.drop_rate and simulator.rng.random() < simulator.drop_rate:
+            simulator.dropped += 1
+            return
+        self._spawn(self._reply(mnemo))
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _shutdown(self):
+        self._connected = False
+        self._callback = None
+        for task in list(self._tasks):
+            if task is not asyncio.current_task():
+                task.cancel()
+
+    async def _reply(self, mnemo):
+        simulator = self.simulator
+        await asyncio.sleep(max(0.0, simulator.latency + simulator.rng.uniform(-simulator.jitter, simulator.jitter)))
+        await self._deliver(simulator.frame(mnemo))
+
+    async def _push(self):
+        """Trames M spontanées à push_rate trames/s (envoyées par paquets pour les débits élevés)"""
+        simulator = self.simulator
+        period = 1.0 / simulator.push_rate
+        next_at = time.monotonic()
+        while self._connected:
+            now = time.monotonic()
+            due = max(1, int((now - next_at) / period) + 1)
+            for _ in range(due):
+                await self._deliver(simulator.frame('M'))
+                if not self._connected:
+                    return
+            next_at += due * period
+            await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+
+    async def _replay(self):
+        """Rejoue la capture en respectant les écarts d'origine divisés par `speed` (0 : sans attente)"""
+        simulator = self.simulator
+        start_ts = simulator.replay[0][0]
+        started = time.monotonic()
+        for ts, frame in simulator.replay:
+            if simulator.speed:
+                delay = (ts - start_ts) / simulator.speed - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await self._deliver(frame)
+            if not self._connected:
+                return
+
+    async def _deliver(self, frame):
+        """Envoie une trame au callback, en notifications fragmentées, dans l'ordre"""
+        simulator = self.simulator
+        async with self._send_lock:
+            if not self._connected or self._callback is None:
+                return
+            for chunk in simulator.notifications(frame):
+                result = self._callback(self.services.uart, chunk)
+                if asyncio.iscoroutine(result):
+                    await result
+            if simulator.disconnect_after and simulator.frames % simulator.disconnect_after == 0:
+                simulator.disconnects += 1
+                self._shutdown()
+                if self._disconnected_callback:
+                    self._disconnected_callback(self)
+
+
+class SimulatedBleakScanner:
+    """Remplaçant de BleakScanner : les régulateurs simulés « émettent » toutes les 100 ms"""
+
+    def __init__(self, detection_callback=None, **kwargs):
+        self._callback = detection_callback
+        self._task = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._advertise())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+
+    async def _advertise(self):
+        while True:
+            await asyncio.sleep(0.1)
+            for simulator in list(_SIMULATORS.values()):
+                if self._callback:
+                    self._callback(_Device(simulator), _Advertisement(simulator))
+
+    @classmethod
+    async def discover(cls, timeout=5.0, **kwargs):
+        await asyncio.sleep(min(timeout, 0.1))
+        return [_Device(simulator) for simulator in _SIMULATORS.values()]
+
+    @classmethod
+    async def find_device_by_filter(cls, filterfunc, timeout=10.0, **kwargs):
+        await asyncio.sleep(min(timeout, 0.1))
+        for simulator in _SIMULATORS.values():
+            device = _Device(simulator)
+            if filterfunc(device, _Advertisement(simulator)):
+                return device
+        return None
+
+
+def install(simulators, *modules):
+    """Enregistre les simulateurs et remplace BleakClient/BleakScanner dans les modules donnés"""
+    for simulator in simulators:
+        _SIMULATORS[simulator.address] = simulator
+    for module in modules:
+        if hasattr(module, 'BleakClient'):
+            module.BleakClient = SimulatedBleakClient
+        if hasattr(module, 'BleakScanner'):
+            module.BleakScanner = SimulatedBleakScanner
+
+
+# ==================== BROKER MQTT ====================
+
+async def _read_mqtt_packet(reader):
+    """En-tête fixe (type et drapeaux) et corps d'un paquet MQTT"""
+    header = (await reader.readexactly(1))[0]
+    length, shift = 0, 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        length |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    return header, await reader.readexactly(length)
+
+
+def _mqtt_string(body, pos):
+    length = int.from_bytes(body[pos:pos + 2], 'big')
+    return body[pos + 2:pos + 2 + length], pos + 2 + length
+
+
+class MqttBrokerStandIn:
+    """Broker MQTT 3.1.1 minimal en mémoire, à la place d'un mosquitto local
+
+    Gère CONNECT (sessions persistantes, testament), PUBLISH QoS 0/1 avec
+    messages retenus, PINGREQ et DISCONNECT ; pas d'abonnements : le banc lit
+    directement self.retained. drop_after : coupe la connexion (sans PUBACK)
+    toutes les N publications, pour éprouver la reconnexion.
+    """
+
+    def __init__(self, drop_after=None):
+        self.drop_after = drop_after
+        self.retained = {}    # topic -> payload
+        self.sessions = set()  # client_id des sessions persistantes
+        self.publishes = 0
+        self.connects = 0
+        self.resumed = 0
+        self.drops = 0
+        self.port = None
+        self._server = None
+        self._writers = set()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        await self._server.wait_closed()
+
+    def _connect(self, body):
+        """CONNECT -> (session reprise, testament (topic, payload, retain) ou None)"""
+        _, pos = _mqtt_string(body, 0)
+        flags = body[pos + 1]
+        client_id, pos = _mqtt_string(body, pos + 4)
+        will = None
+        if flags & 0x04:
+            topic, pos = _mqtt_string(body, pos)
+            payload, pos = _mqtt_string(body, pos)
+            will = (topic.decode(), payload, bool(flags & 0x20))
+        present = not flags & 0x02 and client_id in self.sessions
+        if flags & 0x02:
+            self.sessions.discard(client_id)
+        else:
+            self.sessions.add(client_id)
+        self.connects += 1
+        self.resumed += present
+        return present, will
+
+    def _retain(self, topic, payload):
+        if payload:
+            self.retained[topic] = payload
+        else:
+            self.retained.pop(topic, None)
+
+    async def _handle(self, reader, writer):
+        self._writers.add(writer)
+        will = None
+        try:
+            while True:
+                header, body = await _read_mqtt_packet(reader)
+                kind = header >> 4
+                if kind == 1:
+                    present, will = self._connect(body)
+                    writer.write(bytes((0x20, 2, int(present), 0)))
+                elif kind == 3:
+                    qos = (header >> 1) & 3
+                    topic, pos = _mqtt_string(body, 0)
+                    packet_id = body[pos:pos + 2] if qos else b''
+                    if header & 0x01:
+                        self._retain(topic.decode(), body[pos + len(packet_id):])
+                    self.publishes += 1
+                    if self.drop_after and self.publishes % self.drop_after == 0:
+                        self.drops += 1
+                        break
+                    if qos == 1:
+                        writer.write(b'\x40\x02' + packet_id)
+                elif kind == 12:
+                    writer.write(b'\xd0\x00')
+                elif kind == 14:
+                    will = None
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            # Coupure sans DISCONNECT : publication du testament
+            if will and will[2]:
+                self._retain(will[0], will[1])
+            self._writers.discard(writer)
+            writer.close()
+
+
+# ==================== BANC DE TEST ====================
+
+async def _start_api_sink():
+    """API factice : accepte mesures, lots et logs d'erreur, et les compte"""
+    from aiohttp import web
+
+    received = {'measurements': 0, 'requests': 0, 'bytes': 0, 'error_logs': 0, 'errors': 0, 'alerts': 0, 'rollups': 0}
+
+    async def measurements(request):
+        raw = await request.read()
+        received['requests'] += 1
+        received['bytes'] += request.content_length or len(raw)
+        if request.content_type == FRAMES_CONTENT_TYPE:
+            received['measurements'] += len(decode_measurements(raw))
+        else:
+            body = await request.json()
+            received['measurements'] += len(body.get('measurements', [body]))
+        return web.json_response({'success': True})
+
+    async def error_logs(request):
+        body = await request.json()
+        entries = body.get('errors', [body])
+        received['error_logs'] += len(entries)
+        received['errors'] += sum(entry.get('count', 1) for entry in entries)
+        return web.json_response({'success': True}, status=201)
+
+    async def alerts(request):
+        await request.read()
+        received['alerts'] += 1
+        return web.json_response({'success': True}, status=201)
+
+    async def rollups(request):
+        body = await request.json()
+        received['rollups'] += len(body['rollups'])
+        return web.json_response({'success': True}, status=201)
+
+    async def health(request):
+        return web.json_response({'status': 'ok'})
+
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app.router.add_post('/api/measurements', measurements)
+    app.router.add_post('/api/measurements/batch', measurements)
+    app.router.add_post('/api/error-logs', error_logs)
+    app.router.add_post('/api/error-logs/batch', error_logs)
+    app.router.add_post('/api/alerts', alerts)
+    app.router.add_post('/api/daily-averages', rollups)
+    app.router.add_get('/api/health', health)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{port}/api/measurements', received
+
+
+async def run_bench(args):
+    runner, api_url, received = await _start_api_sink()
+    workdir = tempfile.mkdtemp(prefix='pool-sim-')
+    sinks = args.sinks
+    broker = None
+    if args.mqtt:
+        broker = MqttBrokerStandIn(drop_after=args.mqtt_drop_after)
+        await broker.start()
+        os.environ.update({'MQTT_HOST': '127.0.0.1', 'MQTT_PORT': str(broker.port)})
+        if 'mqtt' not in sinks.split(','):
+            sinks += ',mqtt'
+    addresses = [f'5E:00:00:00:00:{i + 1:02X}' for i in range(args.regulators)]
+
+    # Configuration lue à l'import du moniteur
+    os.environ.update({
+        'API_URL': api_url,
+        'OUTBOX_PATH': os.path.join(workdir, 'outbox.db'),
+        'TIMESERIES_PATH': os.path.join(workdir, 'timeseries'),
+        'ROLLUP_STATE_PATH': os.path.join(workdir, 'rollups.json'),
+        'CAPTURE_PATH': os.path.join(workdir, 'capture'),
+        'BLE_STATE_PATH': os.path.join(workdir, 'ble_state.json'),
+        'LOG_FILE': os.path.join(workdir, 'monitor.log'),
+        'LOG_LEVEL': args.log_level,
+        'MEASUREMENT_INTERVAL': str(args.interval),
+        'FAST_MEASUREMENT_INTERVAL': str(args.interval),
+        'SLOW_MEASUREMENT_INTERVAL': str(args.interval),
+        'UPLOAD_BATCH_MAX_AGE': '1',
+        'WIRE_FORMAT': args.wire_format,
+        'SINKS': sinks,
+        'SINK_FILE_PATH': os.path.join(workdir, 'export'),
+    })
+    if args.regulators > 1:
+        os.environ['REGULATORS'] = ','.join(f'sim{i + 1}={address}' for i, address in enumerate(addresses))
+
+    import ble_scanner
+    import bluetooth_monitor_cloud
+
+    replay = load_capture(args.replay) if args.replay else None
+    simulators = [
+        RegulatorSimulator(
+            address=address, latency=args.latency, max_chunk=args.max_chunk, noise=args.noise,
+            crc_error_rate=args.crc_errors, drop_rate=args.drop_rate, disconnect_after=args.disconnect_after,
+            push_rate=args.push_rate, replay=replay, speed=args.speed, seed=i
+        )
+        for i, address in enumerate(addresses)
+    ]
+    install(simulators, bluetooth_monitor_cloud, ble_scanner)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(bluetooth_monitor_cloud.main(), args.duration)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.perf_counter() - started
+    await runner.cleanup()
+    if broker:
+        await broker.stop()
+
+    frames = sum(simulator.frames for simulator in simulators)
+    print(f"Durée: {elapsed:.1f}s, répertoire de travail: {workdir}")
+    for simulator in simulators:
+        print(f"  {simulator.address}: {simulator.get_stats()}")
+    print(f"Trames émises: {frames} ({frames / elapsed:.0f}/s)")
+    print(f"Mesures reçues par l'API factice: {received['measurements']} en {received['requests']} requêtes,"
+          f" {received['bytes']} octets ({received['error_logs']} logs d'erreur pour {received['errors']} erreurs,"
+          f" {received['alerts']} alertes, {received['rollups']} agrégats)")
+    if broker:
+        print(f"Broker MQTT factice: {broker.publishes} publications, {len(broker.retained)} topics retenus,"
+              f" {broker.connects} connexions ({broker.resumed} sessions reprises, {broker.drops} coupures)")
+        for topic in sorted(broker.retained):
+            if topic.endswith(('/ph', '/status', '/timestamp')):
+                print(f"  {topic} = {broker.retained[topic].decode()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--regulators', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=30.0, help="durée du test (s)")
+    parser.add_argument('--interval', type=int, default=5, help="intervalle de sondage du moniteur (s)")
+    parser.add_argument('--push-rate', type=float, default=0.0, help="trames M spontanées par seconde et par régulateur")
+    parser.add_argument('--replay', help="capture à rejouer (lignes '<epoch> <hex>', journal du moniteur ou répertoire CAPTURE_PATH)")
+    parser.add_argument('--speed', type=float, default=1.0, help="facteur de vitesse du rejeu (0 : sans attente)")
+    parser.add_argument('--latency', type=float, default=0.05, help="délai de réponse aux commandes (s)")
+    parser.add_argument('--max-chunk', type=int, default=20, help="taille max d'une notification (octets)")
+    parser.add_argument('--noise', type=float, default=0.0, help="probabilité de bruit avant une trame")
+    parser.add_argument('--crc-errors', type=float, default=0.0, help="probabilité de CRC faux")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="probabilité de commande sans réponse")
+    parser.add_argument('--disconnect-after', type=int, help="déconnexion toutes les N trames")
+    parser.add_argument('--wire-format', choices=('json', 'frames'), default='json', help="format des envois à l'API")
+    parser.add_argument('--sinks', default='api,file', help="destinations des mesures (SINKS)")
+    parser.add_argument('--mqtt', action='store_true', help="publie aussi vers un broker MQTT factice en mémoire")
+    parser.add_argument('--mqtt-drop-after', type=int, help="le broker factice coupe la connexion toutes les N publications")
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+    asyncio.run(run_bench(args))
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
@@ -0,0 +1,450 @@
+"""
+Destinations des mesures décodées (sinks)
+
+Une même mesure M est distribuée à plusieurs destinations : API cloud,
+broker MQTT local, Firestore, fichiers locaux. Chaque destination a sa file
+bornée (les plus anciennes mesures sont écartées quand elle est pleine), sa
+politique de lot (taille, délai) et sa tâche d'écriture avec backoff : une
+destination lente ou injoignable ne retarde ni le gestionnaire BLE, qui ne
+fait qu'ajouter à des files en mémoire, ni les autres destinations.
+
+L'API cloud garde sa propre file persistante (outbox SQLite, voir
+uploader.py) : ApiSink n'est qu'un adaptateur. Les destinations marquées
+changes_only ne reçoivent que les mesures retenues par le filtre de
+changement (voir change_filter.py) ; les autres reçoivent toutes les mesures.
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import socket
+import time
+from collections import deque
+
+from metrics import UPLOAD_BOUNDS, LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+NAMES = ('api', 'file', 'mqtt', 'firestore')
+
+# Limite Firestore du nombre d'écritures par WriteBatch
+FIRESTORE_MAX_BATCH = 500
+
+# Champs d'une mesure qui ne sont pas des valeurs du régulateur (non publiés sur MQTT)
+_MQTT_SKIP = ('regulator_id', 'device_alerts', 'idempotency_key')
+
+
+def measurement_id(data):
+    """Identifiant déterministe d'une mesure : un renvoi écrase au lieu de dupliquer"""
+    return f"{data.get('regulator_id') or 'default'}-{data['timestamp']}"
+
+
+class Sink:
+    """Destination avec file bornée, envoi par lots et backoff (sous-classes : write())"""
+
+    name = 'sink'
+    changes_only = False
+    # True : chaque ajout réveille la tâche d'écriture (lot = ce qui est en file, au plus batch_size)
+    eager = False
+
+    def __init__(self, max_queue=10000, batch_size=100, flush_interval=5.0, max_backoff=300.0, stop_timeout=10.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.stop_timeout = stop_timeout
+
+        self.queue = deque(maxlen=max_queue)
+        self._wake = None
+        self._task = None
+
+        self.submitted = 0
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_write = None
+        self.latency = LatencyHistogram(UPLOAD_BOUNDS)
+
+    def submit(self, data):
+        """Ajoute une mesure à la file (jamais bloquant) ; la plus ancienne est écartée si la file est pleine"""
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(data)
+        self.submitted += 1
+        if self._wake is not None and (self.eager or len(self.queue) >= self.batch_size):
+            self._wake.set()
+
+    def submit_state(self, regulator_id, mnemo, fields):
+        """État du régulateur (trames autres que M) : ignoré sauf par les destinations qui le publient"""
+
+    async def open(self):
+        """Ouverture de la destination (connexion, répertoire...), avant la tâche d'écriture"""
+
+    async def close(self):
+        """Fermeture de la destination, après le dernier lot"""
+
+    async def write(self, records):
+        """Écrit un lot ; une exception le remet en tête de file"""
+        raise NotImplementedError
+
+    async def start(self):
+        await self.open()
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Arrête la tâche d'écriture après une dernière tentative (au plus stop_timeout secondes) sur les mesures en file"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await asyncio.wait_for(self._drain(), self.stop_timeout)
+        except asyncio.TimeoutError:
+            pass
+        if self.queue:
+            logger.warning(f"Destination {self.name} indisponible, {len(self.queue)} mesures non écrites")
+        await self.close()
+
+    async def _drain(self):
+        while self.queue:
+            if not await self._flush_once():
+                return
+
+    def _requeue(self, records):
+        """Remet un lot en tête de file, dans l'ordre ; si la file s'est remplie entre-temps, les plus anciennes sont écartées"""
+        room = self.queue.maxlen - len(self.queue)
+        if room < len(records):
+            self.dropped += len(records) - room
+            records = records[len(records) - room:]
+        self.queue.extendleft(reversed(records))
+
+    async def _flush_once(self):
+        records = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+        if not records:
+            return True
+        started = time.monotonic()
+        try:
+            await self.write(records)
+        except asyncio.CancelledError:
+            self._requeue(records)
+            raise
+        except Exception as e:
+            self.failures += 1
+            self._requeue(records)
+            logger.warning(f"Écriture {self.name} échouée ({len(records)} mesures conservées): {e}")
+            return False
+        self.latency.observe(time.monotonic() - started)
+        self.written += len(records)
+        self.batches += 1
+        self.last_write = time.time()
+        return True
+
+    async def _run(self):
+        failures = 0
+        while True:
+            # Lot incomplet : on attend qu'il se remplisse, ou flush_interval secondes
+            # (eager : seulement si la file est vide)
+            if len(self.queue) < self.batch_size and not (self.eager and self.queue):
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wake.clear()
+            if not self.queue:
+                continue
+            if await self._flush_once():
+                failures = 0
+            else:
+                failures += 1
+                await asyncio.sleep(min(self.max_backoff, 2 ** (failures - 1)))
+
+    def get_stats(self):
+        return {
+            'queued': len(self.queue),
+            'written': self.written,
+            'batches': self.batches,
+            'failures': self.failures,
+            'dropped': self.dropped,
+        }
+
+    def collect(self, exposition):
+        """Métriques de la destination (voir metrics.py)"""
+        labels = {'sink': self.name}
+        exposition.gauge('pool_sink_queue_depth', "Mesures en attente par destination", len(self.queue), labels)
+        exposition.counter('pool_sink_written_total', "Mesures écrites par destination", self.written, labels)
+        exposition.counter('pool_sink_failures_total', "Écritures de lot échouées", self.failures, labels)
+        exposition.counter('pool_sink_dropped_total', "Mesures écartées (file pleine)", self.dropped, labels)
+        exposition.histogram('pool_sink_write_seconds', "Durée d'écriture d'un lot", self.latency, labels)
+
+
+class ApiSink(Sink):
+    """API cloud : la mesure part dans l'outbox persistante de l'uploader (file, lots et reprise propres)"""
+
+    name = 'api'
+    changes_only = True
+
+    def __init__(self, uploader):
+        super().__init__(max_queue=1)
+        self.uploader = uploader
+
+    def submit(self, data):
+        self.uploader.submit(data)
+        self.submitted += 1
+
+    async def start(self):
+        # Cycle de vie de l'uploader géré par le superviseur (il porte aussi les alertes et les erreurs)
+        pass
+
+    async def stop(self):
+        pass
+
+    def get_stats(self):
+        return {'queued': self.uploader.outbox.depth(), 'written': self.uploader.stats['sent']}
+
+    def collect(self, exposition):
+        # Métriques exportées par uploader.collect()
+        pass
+
+
+class FileSink(Sink):
+    """Fichiers JSON Lines journaliers (<directory>/AAAA-MM-JJ.jsonl), une mesure par ligne"""
+
+    name = 'file'
+
+    def __init__(self, directory, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+
+    async def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _append(self, records):
+        days = {}
+        for data in records:
+            days.setdefault(data['timestamp'][:10], []).append(json.dumps(data, separators=(',', ':')))
+        for day, lines in days.items():
+            with open(os.path.join(self.directory, f'{day}.jsonl'), 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+
+    async def write(self, records):
+        await asyncio.to_thread(self._append, records)
+
+
+class MqttSink(Sink):
+    """Broker MQTT local : une valeur par topic, retenue (retain) et publiée seulement si elle change
+
+    Mesures : <prefix>/<régulateur>/<champ> (ph, redox, timestamp...) ; état du
+    régulateur (trames S, D, E, A...) : <prefix>/<régulateur>/<mnémonique>/<champ> ;
+    disponibilité du moniteur : <prefix>/status (online, offline en testament).
+    Un consommateur qui s'abonne reçoit aussitôt la dernière valeur de chaque topic.
+
+    QoS 1 avec au plus `inflight` publications en attente d'acquittement.
+    Session persistante (client_id fixe, clean_session=False) reprise à la
+    reconnexion ; tout l'état connu est alors republié, au cas où le broker
+    aurait perdu ses messages retenus.
+    """
+
+    name = 'mqtt'
+    eager = True
+
+    def __init__(self, host='localhost', port=1883, prefix='pool', qos=1, inflight=20, ack_timeout=5,
+                 client_id=None, username=None, password=None, **kwargs):
+        kwargs.setdefault('max_backoff', 60.0)
+        super().__init__(**kwargs)
+        self.host = host
+        self.port = port
+        self.prefix = prefix
+        self.qos = qos
+        self.inflight = inflight
+        self.ack_timeout = ack_timeout
+        self.client_id = client_id or f'pool-monitor-{socket.gethostname()}'
+        self.username = username
+        self.password = password
+        self.status_topic = f'{prefix}/status'
+        self.client = None
+        self._session = None
+
+        self._state = {}      # topic -> dernière valeur connue
+        self._published = {}  # topic -> valeur acquittée par le broker depuis la connexion
+
+        self.published = 0
+        self.connects = 0
+
+    def submit(self, data):
+        # Topics construits par la tâche d'écriture : rien de plus qu'un ajout à la file ici
+        super().submit((data.get('regulator_id'), None, data))
+
+    def submit_state(self, regulator_id, mnemo, fields):
+        super().submit((regulator_id, mnemo, fields))
+
+    def _topic(self, regulator_id, mnemo, name):
+        if mnemo is None:
+            return f"{self.prefix}/{regulator_id or 'default'}/{name}"
+        return f"{self.prefix}/{regulator_id or 'default'}/{mnemo}/{name}"
+
+    async def _connect(self):
+        from asyncio_mqtt import Client, Will
+
+        client = Client(
+            self.host, self.port,
+            client_id=self.client_id,
+            clean_session=False,
+            username=self.username,
+            password=self.password,
+            will=Will(self.status_topic, 'offline', qos=1, retain=True),
+        )
+        self._align_window(client)
+        session = contextlib.AsyncExitStack()
+        self.client = await session.enter_async_context(client)
+        self._session = session
+        self.connects += 1
+        self._published = {}
+        await self.client.publish(self.status_topic, 'online', qos=1, retain=True, timeout=self.ack_timeout)
+        logger.info(f"Connecté au broker MQTT {self.host}:{self.port} ({len(self._state)} topics à publier)")
+
+    def _align_window(self, client):
+        """Aligne la fenêtre de paho (20 par défaut) et le seuil d'avertissement d'asyncio-mqtt
+        ("There are N pending publish calls", 10) sur la fenêtre QoS 1
+
+        Attributs internes des deux bibliothèques : absents après une mise à
+        jour, les valeurs par défaut restent en place (avertissements possibles
+        au-delà de 10 publications en attente) sans empêcher la connexion.
+        """
+        paho = getattr(client, '_client', None)
+        if hasattr(paho, 'max_inflight_messages_set'):
+            paho.max_inflight_messages_set(self.inflight)
+        else:
+            logger.warning("MQTT: fenêtre d'envoi de paho non réglable, valeur par défaut conservée")
+        if hasattr(client, '_pending_calls_threshold'):
+            client._pending_calls_threshold = self.inflight
+        else:
+            logger.warning("MQTT: seuil d'avertissement d'asyncio-mqtt non réglable, valeur par défaut conservée")
+
+    async def _disconnect(self):
+        session, self._session, self.client = self._session, None, None
+        if session is not None:
+            try:
+                await session.aclose()
+            except Exception:
+                pass
+
+    async def close(self):
+        if self.client is not None:
+            try:
+                await self.client.publish(self.status_topic, 'offline', qos=1, retain=True, timeout=2)
+            except Exception:
+                pass
+        await self._disconnect()
+
+    async def _publish(self, window, topic, payload):
+        async with window:
+            await self.client.publish(topic, payload, qos=self.qos, retain=True, timeout=self.ack_timeout)
+        self._published[topic] = payload
+        self.published += 1
+
+    async def write(self, records):
+        for regulator_id, mnemo, fields in records:
+            for name, value in fields.items():
+                if name in _MQTT_SKIP:
+                    continue
+                self._state[self._topic(regulator_id, mnemo, name)] = value if isinstance(value, str) else json.dumps(value)
+
+        if self.client is None:
+            await self._connect()
+        changed = [(topic, payload) for topic, payload in self._state.items() if self._published.get(topic) != payload]
+        if not changed:
+            return
+        window = asyncio.Semaphore(self.inflight)
+        results = await asyncio.gather(*(self._publish(window, topic, payload) for topic, payload in changed),
+                                       return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            # Reconnexion au prochain essai ; les valeurs non acquittées restent à publier
+            await self._disconnect()
+            raise errors[0]
+
+    def get_stats(self):
+        return {**super().get_stats(), 'published': self.published, 'topics': len(self._state),
+                'connects': self.connects, 'connected': self.client is not None}
+
+    def collect(self, exposition):
+        super().collect(exposition)
+        exposition.counter('pool_mqtt_published_total', "Valeurs publiées sur le broker MQTT", self.published)
+        exposition.counter('pool_mqtt_connects_total', "Connexions au broker MQTT", self.connects)
+        exposition.gauge('pool_mqtt_connected', "Connecté au broker MQTT", int(self.client is not None))
+
+
+class FirestoreSink(Sink):
+    """Collection Firestore : WriteBatch de set() sur un identifiant déterministe
+
+    db : client Firestore (firestore.client()), ou tout objet exposant batch()
+    et collection() ; fonctionne aussi avec l'émulateur (FIRESTORE_EMULATOR_HOST).
+    Les commits, bloquants, s'exécutent dans un thread.
+    """
+
+    name = 'firestore'
+    changes_only = True
+
+    def __init__(self, db, collection='pool_data', document_id=measurement_id, timeout=30.0, **kwargs):
+        kwargs['batch_size'] = min(kwargs.get('batch_size', FIRESTORE_MAX_BATCH), FIRESTORE_MAX_BATCH)
+        super().__init__(**kwargs)
+        self.db = db
+        self.collection = collection
+        self.document_id = document_id
+        self.timeout = timeout
+
+    def _commit(self, records):
+        batch = self.db.batch()
+        collection = self.db.collection(self.collection)
+        for data in records:
+            batch.set(collection.document(self.document_id(data)), data)
+        batch.commit(timeout=self.timeout)
+
+    async def write(self, records):
+        await asyncio.to_thread(self._commit, records)
+
+
+class SinkFanOut:
+    """Distribue chaque mesure à toutes les destinations"""
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def submit(self, data, changed=None):
+        """data : mesure décodée ; changed : mesure retenue par le filtre de changement (ou None)"""
+        for sink in self.sinks:
+            if sink.changes_only:
+                if changed is not None:
+                    sink.submit(changed)
+            else:
+                sink.submit(data)
+
+    def submit_state(self, regulator_id, mnemo, fields):
+        """Consignes, seuils, électrolyse (trames S, D, E, A...) du régulateur"""
+        for sink in self.sinks:
+            sink.submit_state(regulator_id, mnemo, fields)
+
+    async def start(self):
+        for sink in self.sinks:
+            try:
+                await sink.start()
+            except Exception as e:
+                # Une destination indisponible au démarrage n'empêche pas les autres
+                logger.error(f"Démarrage de la destination {sink.name} impossible: {e}")
+
+    async def stop(self):
+        await asyncio.gather(*(sink.stop() for sink in self.sinks), return_exceptions=True)
+
+    def get_stats(self):
+        return {sink.name: sink.get_stats() for sink in self.sinks}
+
+    def collect(self, exposition):
+        for sink in self.sinks:
+            sink.collect(exposition)
@@ -0,0 +1,269 @@
+"""
+Tests des destinations de mesures (sinks.py)
+
+FirestoreSink est testé avec un faux client Firestore (batch(), collection(),
+WriteBatch.set/commit) : lots de 500 écritures au plus, identifiants
+déterministes régulateur-horodatage et rejeu de la file après une panne.
+MqttSink est testé contre le broker en mémoire du simulateur
+(MqttBrokerStandIn) : messages retenus, publication des seuls topics
+modifiés, testament offline et reprise après une coupure du broker.
+
+Usage: python3 -m unittest discover -s tests
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from simulator import MqttBrokerStandIn  # noqa: E402
+from sinks import FIRESTORE_MAX_BATCH, FirestoreSink, MqttSink, measurement_id  # noqa: E402
+
+
+class FakeWriteBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, reference, data):
+        self.writes.append((reference, dict(data)))
+
+    def commit(self, timeout=None):
+        if self.db.offline:
+            raise ConnectionError("Firestore injoignable")
+        self.db.commits.append(len(self.writes))
+        for reference, data in self.writes:
+            self.db.documents[reference] = data
+
+
+class FakeCollection:
+    def __init__(self, name):
+        self.name = name
+
+    def document(self, document_id):
+        return (self.name, document_id)
+
+
+class FakeFirestore:
+    """Client Firestore en mémoire : documents[(collection, id)] = données"""
+
+    def __init__(self):
+        self.offline = False
+        self.commits = []  # taille de chaque WriteBatch validé
+        self.documents = {}
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def collection(self, name):
+        return FakeCollection(name)
+
+
+def measurement(second, regulator_id='piscine', ph=7.2):
+    return {
+        'timestamp': f'2026-06-01T12:00:{second:02d}',
+        'regulator_id': regulator_id,
+        'ph': ph,
+    }
+
+
+class FirestoreSinkTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.db = FakeFirestore()
+
+    async def test_batches_are_capped_at_firestore_limit(self):
+        sink = FirestoreSink(self.db, batch_size=2000, stop_timeout=5)
+        self.assertEqual(sink.batch_size, FIRESTORE_MAX_BATCH)
+        for i in range(1200):
+            sink.submit({'timestamp': f'2026-06-01T12:{i // 60:02d}:{i % 60:02d}', 'ph': 7.2})
+        await sink.stop()
+        self.assertEqual(self.db.commits, [500, 500, 200])
+        self.assertEqual(len(self.db.documents), 1200)
+        self.assertEqual(sink.get_stats()['written'], 1200)
+        self.assertEqual(sink.get_stats()['batches'], 3)
+
+    async def test_running_sink_flushes_full_batch_without_waiting(self):
+        sink = FirestoreSink(self.db, batch_size=10, flush_interval=60)
+        await sink.start()
+        try:
+            for i in range(10):
+                sink.submit(measurement(i))
+            for _ in range(100):
+                if self.db.commits:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(self.db.commits, [10])
+        finally:
+            await sink.stop()
+
+    def test_measurement_id_is_regulator_and_timestamp(self):
+        self.assertEqual(measurement_id(measurement(5)), 'piscine-2026-06-01T12:00:05')
+        self.assertEqual(measurement_id(measurement(5, regulator_id=None)), 'default-2026-06-01T12:00:05')
+        self.assertEqual(measurement_id({'timestamp': '2026-06-01T12:00:05'}), 'default-2026-06-01T12:00:05')
+
+    async def test_replayed_measurement_overwrites_document(self):
+        sink = FirestoreSink(self.db, collection='pool_data')
+        sink.submit(measurement(5, ph=7.1))
+        sink.submit(measurement(5, regulator_id='spa', ph=7.4))
+        self.assertTrue(await sink._flush_once())
+        sink.submit(measurement(5, ph=7.3))
+        self.assertTrue(await sink._flush_once())
+        self.assertEqual(sorted(self.db.documents), [
+            ('pool_data', 'piscine-2026-06-01T12:00:05'),
+            ('pool_data', 'spa-2026-06-01T12:00:05'),
+        ])
+        self.assertEqual(self.db.documents[('pool_data', 'piscine-2026-06-01T12:00:05')]['ph'], 7.3)
+
+    async def test_custom_document_id(self):
+        sink = FirestoreSink(self.db, document_id=lambda data: data['id'])
+        sink.submit({'id': '20260601120005', 'pH': 7.2})
+        self.assertTrue(await sink._flush_once())
+        self.assertIn(('pool_data', '20260601120005'), self.db.documents)
+
+    async def test_offline_queue_is_replayed_in_order(self):
+        sink = FirestoreSink(self.db, batch_size=2)
+        for i in range(3):
+            sink.submit(measurement(i))
+        self.db.offline = True
+        self.assertFalse(await sink._flush_once())
+        self.assertEqual([data['timestamp'][-2:] for data in sink.queue], ['00', '01', '02'])
+        self.assertEqual(sink.get_stats()['failures'], 1)
+        self.assertEqual(self.db.documents, {})
+
+        # Nouvelles mesures pendant la panne : après celles déjà en file
+        sink.submit(measurement(3))
+        self.db.offline = False
+        await sink._drain()
+        self.assertEqual(self.db.commits, [2, 2])
+        self.assertEqual(list(self.db.documents), [
+            ('pool_data', f'piscine-2026-06-01T12:00:0{i}') for i in range(4)
+        ])
+        self.assertEqual(sink.get_stats()['queued'], 0)
+
+    async def test_offline_queue_drops_oldest_when_full(self):
+        sink = FirestoreSink(self.db, batch_size=2, max_queue=3)
+        for i in range(3):
+            sink.submit(measurement(i))
+        self.db.offline = True
+        self.assertFalse(await sink._flush_once())
+        for i in range(3, 5):
+            sink.submit(measurement(i))
+        self.assertEqual([data['timestamp'][-2:] for data in sink.queue], ['02', '03', '04'])
+        self.assertEqual(sink.get_stats()['dropped'], 2)
+
+        self.db.offline = False
+        await sink._drain()
+        self.assertEqual(len(self.db.documents), 3)
+
+    async def test_stop_keeps_unwritten_measurements_queued(self):
+        sink = FirestoreSink(self.db, stop_timeout=1)
+        self.db.offline = True
+        await sink.start()
+        sink.submit(measurement(0))
+        await sink.stop()
+        self.assertEqual(len(sink.queue), 1)
+        self.assertEqual(self.db.documents, {})
+
+
+class MqttSinkTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.broker = MqttBrokerStandIn()
+        await self.broker.start()
+        self.sink = MqttSink('127.0.0.1', self.broker.port, client_id='pool-monitor-test', ack_timeout=1)
+
+    async def asyncTearDown(self):
+        await self.sink.close()
+        await self.broker.stop()
+
+    async def test_values_and_state_are_retained(self):
+        self.sink.submit({**measurement(0), 'device_alerts': []})
+        self.sink.submit_state('piscine', 'S', {'ph_setpoint': 7.2, 'ph_error_max': 7.8})
+        self.assertTrue(await self.sink._flush_once())
+        self.assertEqual(self.broker.retained, {
+            'pool/status': b'online',
+            'pool/piscine/timestamp': b'2026-06-01T12:00:00',
+            'pool/piscine/ph': b'7.2',
+            'pool/piscine/S/ph_setpoint': b'7.2',
+            'pool/piscine/S/ph_error_max': b'7.8',
+        })
+        self.assertEqual(self.sink.get_stats()['topics'], 4)
+
+    async def test_only_changed_topics_are_published(self):
+        self.sink.submit(measurement(0, ph=7.2))
+        self.assertTrue(await self.sink._flush_once())
+        publishes = self.broker.publishes
+
+        self.sink.submit(measurement(0, ph=7.3))
+        self.sink.submit(measurement(0, ph=7.3))
+        self.assertTrue(await self.sink._flush_once())
+        self.assertEqual(self.broker.publishes - publishes, 1)
+        self.assertEqual(self.broker.retained['pool/piscine/ph'], b'7.3')
+
+        self.sink.submit(measurement(0, ph=7.3))
+        self.assertTrue(await self.sink._flush_once())
+        self.assertEqual(self.broker.publishes - publishes, 1)
+        self.assertEqual(self.broker.connects, 1)
+
+    async def test_status_goes_offline_on_close(self):
+        self.sink.submit(measurement(0))
+        self.assertTrue(await self.sink._flush_once())
+        self.assertEqual(self.broker.retained['pool/status'], b'online')
+        await self.sink.close()
+        self.assertEqual(self.broker.retained['pool/status'], b'offline')
+        self.assertFalse(self.sink.get_stats()['connected'])
+
+    async def test_will_and_resume_after_broker_drop(self):
+        # Coupure sans PUBACK à la 3e publication (status, puis deux valeurs)
+        self.broker.drop_after = 3
+        self.sink.submit({**measurement(0), 'temperature': 26.5, 'salt': 3.2})
+        self.assertFalse(await self.sink._flush_once())
+        self.assertEqual(self.broker.drops, 1)
+        self.assertEqual(self.broker.retained['pool/status'], b'offline')  # testament
+        self.assertEqual(len(self.sink.queue), 1)
+        self.assertFalse(self.sink.get_stats()['connected'])
+
+        self.broker.drop_after = None
+        self.assertTrue(await self.sink._flush_once())
+        self.assertEqual(self.broker.connects, 2)
+        self.assertEqual(self.broker.resumed, 1)  # session persistante reprise
+        self.assertEqual(self.broker.retained, {
+            'pool/status': b'online',
+            'pool/piscine/timestamp': b'2026-06-01T12:00:00',
+            'pool/piscine/ph': b'7.2',
+            'pool/piscine/temperature': b'26.5',
+            'pool/piscine/salt': b'3.2',
+        })
+
+    async def test_inflight_window_matches_client(self):
+        # asyncio-mqtt avertit au-delà de 10 publications en attente d'acquittement
+        sink = MqttSink('127.0.0.1', self.broker.port, client_id='pool-monitor-window', inflight=30)
+        warnings = []
+        handler = logging.Handler(logging.WARNING)
+        handler.emit = lambda record: warnings.append(record.getMessage())
+        logging.getLogger('mqtt').addHandler(handler)
+        try:
+            sink.submit({'timestamp': '2026-06-01T12:00:00', **{f'value{i}': i for i in range(60)}})
+            self.assertTrue(await sink._flush_once())
+            self.assertEqual(sink.client._client._max_inflight_messages, 30)
+            self.assertEqual(sink.get_stats()['published'], 61)
+        finally:
+            logging.getLogger('mqtt').removeHandler(handler)
+            await sink.close()
+        self.assertEqual([message for message in warnings if 'pending publish' in message], [])
+
+    def test_inflight_window_without_client_internals(self):
+        # Autre version d'asyncio-mqtt ou de paho : pas d'erreur, valeurs par défaut conservées
+        client = type('Client', (), {'_client': object()})()
+        with self.assertLogs('sinks', level='WARNING') as logs:
+            self.sink._align_window(client)
+        self.assertEqual(len(logs.records), 2)
+        self.assertFalse(hasattr(client, '_pending_calls_threshold'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,445 @@
+"""
+Historique local des mesures (série temporelle)
+
+Chaque mesure M est écrite en enregistrement binaire de taille fixe dans un
+fichier journalier projeté en mémoire (mmap), puis agrégée au fil de l'eau
+en min/max/somme par tranches de 1 minute, 15 minutes et 1 heure. Les
+tranches fermées sont ajoutées à un fichier par niveau ; une requête sur des
+mois lit quelques milliers d'agrégats horaires et ne descend aux niveaux plus
+fins (puis aux mesures brutes) que pour les bords de l'intervalle.
+
+Les jours et les tranches sont alignés sur UTC (86400 est multiple de toutes
+les largeurs de tranche : une tranche ne chevauche jamais deux jours).
+"""
+
+import logging
+import math
+import mmap
+import os
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('ph', 'redox', 'temperature', 'salt')
+
+# Horodatage (epoch), 4 mesures, alarm, warning, alarm_redox, états des pompes/relais
+RAW_RECORD = struct.Struct('<d' + 'f' * len(METRICS) + 'BBBB')
+# Début de tranche, nombre de mesures, puis (min, max, somme) par mesure
+ROLLUP_RECORD = struct.Struct('<dI' + 'ffd' * len(METRICS))
+
+# (largeur en secondes, nom du fichier), du plus fin au plus grossier
+ROLLUP_LEVELS = ((60, '1m'), (900, '15m'), (3600, '1h'))
+
+# Bits de l'octet d'état (RAW_RECORD)
+STATE_FLAGS = ('pump_plus_active', 'pump_minus_active', 'pump_chlore_active', 'filter_relay_active')
+
+DAY = 86400
+
+# Magic, version, taille d'enregistrement, nombre d'enregistrements
+_HEADER = struct.Struct('<4sHHQ')
+_COUNT = struct.Struct('<Q')
+_COUNT_OFFSET = 8
+_MAGIC = b'PTS1'
+_VERSION = 1
+
+
+def _day_name(ts):
+    return time.strftime('%Y-%m-%d', time.gmtime(ts))
+
+
+class _RecordFile:
+    """Fichier d'enregistrements de taille fixe, triés par leur premier champ, projeté en mémoire"""
+
+    def __init__(self, path, record, grow_records=4096, readonly=False):
+        self.path = path
+        self.record = record
+        self.grow_records = grow_records
+        self.readonly = readonly
+        self.count = 0
+        self.capacity = 0
+        self._file = None
+        self._mm = None
+        # Format du seul premier champ, pour la recherche dichotomique
+        self._key = struct.Struct(record.format[:2])
+
+    def open(self):
+        exists = os.path.exists(self.path) and os.path.getsize(self.path) >= _HEADER.size
+        if self.readonly:
+            self._file = open(self.path, 'rb')
+        elif exists:
+            self._file = open(self.path, 'r+b')
+        else:
+            self._file = open(self.path, 'w+b')
+            self._file.write(_HEADER.pack(_MAGIC, _VERSION, self.record.size, 0))
+            self._file.truncate(_HEADER.size + self.grow_records * self.record.size)
+        self._map()
+
+        magic, version, size, count = _HEADER.unpack_from(self._mm)
+        if magic != _MAGIC or version != _VERSION or size != self.record.size:
+            self.close()
+            raise ValueError(f"{self.path}: format de fichier inattendu")
+        self.count = min(count, self.capacity)
+        return self
+
+    def _map(self):
+        access = mmap.ACCESS_READ if self.readonly else mmap.ACCESS_WRITE
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=access)
+        self.capacity = (len(self._mm) - _HEADER.size) // self.record.size
+
+    def close(self):
+        if self._mm is not None:
+            if not self.readonly:
+                self._mm.flush()
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def flush(self):
+        """Écrit les pages modifiées sur la carte SD (msync)"""
+        if self._mm is not None and not self.readonly:
+            self._mm.flush()
+
+    def append(self, values):
+        if self.count >= self.capacity:
+            self._grow()
+        self.record.pack_into(self._mm, _HEADER.size + self.count * self.record.size, *values)
+        self.count += 1
+        # Compteur mis à jour après l'enregistrement : jamais d'enregistrement partiel visible
+        _COUNT.pack_into(self._mm, _COUNT_OFFSET, self.count)
+
+    def _grow(self):
+        self._mm.close()
+        self._file.truncate(_HEADER.size + (self.capacity + self.grow_records) * self.record.size)
+        self._map()
+
+    def last(self):
+        """Dernier enregistrement (None si vide)"""
+        if not self.count:
+            return None
+        return self.record.unpack_from(self._mm, _HEADER.size + (self.count - 1) * self.record.size)
+
+    def bisect(self, key):
+        """Index du premier enregistrement dont le premier champ est >= key"""
+        lo, hi = 0, self.count
+        size = self.record.size
+        unpack_from = self._key.unpack_from
+        mm = self._mm
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if unpack_from(mm, _HEADER.size + mid * size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def iter_range(self, start, end):
+        """Enregistrements dont le premier champ est dans [start, end)"""
+        lo = self.bisect(start)
+        hi = self.bisect(end)
+        if lo >= hi:
+            return iter(())
+        size = self.record.size
+        return self.record.iter_unpack(self._mm[_HEADER.size + lo * size:_HEADER.size + hi * size])
+
+
+class Aggregate:
+    """Nombre, min, max et somme de chaque mesure"""
+
+    __slots__ = ('count', 'mins', 'maxs', 'sums')
+
+    def __init__(self):
+        self.count = 0
+        self.mins = [math.inf] * len(METRICS)
+        self.maxs = [-math.inf] * len(METRICS)
+        self.sums = [0.0] * len(METRICS)
+
+    def add(self, values):
+        self.count += 1
+        mins, maxs, sums = self.mins, self.maxs, self.sums
+        for i, value in enumerate(values):
+            if value < mins[i]:
+                mins[i] = value
+            if value > maxs[i]:
+                maxs[i] = value
+            sums[i] += value
+
+    def merge_rollup(self, record):
+        """Ajoute un enregistrement ROLLUP_RECORD"""
+        count = record[1]
+        if not count:
+            return
+        self.count += count
+        for i in range(len(METRICS)):
+            low, high, total = record[2 + 3 * i:5 + 3 * i]
+            if low < self.mins[i]:
+                self.mins[i] = low
+            if high > self.maxs[i]:
+                self.maxs[i] = high
+            self.sums[i] += total
+
+    def merge(self, other):
+        self.count += other.count
+        for i in range(len(METRICS)):
+            self.mins[i] = min(self.mins[i], other.mins[i])
+            self.maxs[i] = max(self.maxs[i], other.maxs[i])
+            self.sums[i] += other.sums[i]
+
+    def to_record(self, start):
+        values = [start, self.count]
+        for i in range(len(METRICS)):
+            values += (self.mins[i], self.maxs[i], self.sums[i])
+        return values
+
+    def to_dict(self):
+        """Même forme que storage.getStats côté API : {metric: {avg, min, max}}"""
+        result = {'count': self.count}
+        for i, name in enumerate(METRICS):
+            if self.count:
+                result[name] = {
+                    'avg': round(self.sums[i] / self.count, 2),
+                    'min': round(self.mins[i], 2),
+                    'max': round(self.maxs[i], 2),
+                }
+            else:
+                result[name] = None
+        return result
+
+
+class TimeSeriesStore:
+    """Mesures brutes journalières + agrégats 1 min / 15 min / 1 h, sur la carte SD"""
+
+    def __init__(self, directory, raw_retention_days=90, flush_interval=60.0):
+        self.directory = directory
+        self.raw_retention_days = raw_retention_days
+        self.flush_interval = flush_interval
+
+        self._raw = None
+        self._raw_day = None
+        self._levels = []
+        self._buckets = [None] * len(ROLLUP_LEVELS)
+        # Fin de la dernière tranche écrite, par niveau : tout ce qui précède est dans le fichier
+        self._closed_until = [0.0] * len(ROLLUP_LEVELS)
+        self._last_ts = 0.0
+        self._last_flush = time.monotonic()
+
+        self.records = 0
+        self.out_of_order = 0
+
+    # ==================== CYCLE DE VIE ====================
+
+    def open(self):
+        """Ouvre les fichiers d'agrégats et reconstruit les tranches ouvertes à partir des mesures brutes"""
+        os.makedirs(self._raw_dir(), exist_ok=True)
+        for width, name in ROLLUP_LEVELS:
+            level = _RecordFile(os.path.join(self.directory, f'rollup-{name}.bin'), ROLLUP_RECORD).open()
+            last = level.last()
+            self._levels.append(level)
+            self._closed_until[len(self._levels) - 1] = last[0] + width if last else 0.0
+
+        self._recover()
+        self._purge_raw()
+
+    def close(self):
+        """Ferme les fichiers (les tranches ouvertes seront reconstruites au prochain open())"""
+        for level in self._levels:
+            level.close()
+        self._levels = []
+        if self._raw is not None:
+            self._raw.close()
+            self._raw = None
+            self._raw_day = None
+
+    def flush(self):
+        if self._raw is not None:
+            self._raw.flush()
+        for level in self._levels:
+            level.flush()
+        self._last_flush = time.monotonic()
+
+    def _raw_dir(self):
+        return os.path.join(self.directory, 'raw')
+
+    def _raw_path(self, day):
+        return os.path.join(self._raw_dir(), f'{day}.bin')
+
+    def _raw_days(self):
+        return sorted(name[:-4] for name in os.listdir(self._raw_dir()) if name.endswith('.bin'))
+
+    def _recover(self):
+        """Rejoue les mesures brutes postérieures à la dernière tranche écrite (arrêt, coupure)"""
+        since = min(self._closed_until)
+        first_day = _day_name(since)
+        replayed = 0
+        for day in self._raw_days():
+            if day < first_day:
+                continue
+            raw = _RecordFile(self._raw_path(day), RAW_RECORD, readonly=True).open()
+            try:
+                for record in raw.iter_range(since, math.inf):
+                    self._roll(record[0], record[1:1 + len(METRICS)])
+                    self._last_ts = record[0]
+                    replayed += 1
+            finally:
+                raw.close()
+        if replayed:
+            logger.info(f"Historique local: {replayed} mesures rejouées dans les agrégats")
+
+    def _purge_raw(self):
+        """Supprime les fichiers bruts plus anciens que la rétention (les agrégats sont conservés)"""
+        if not self.raw_retention_days:
+            return
+        limit = _day_name(time.time() - self.raw_retention_days * DAY)
+        for day in self._raw_days():
+            if day < limit:
+                os.remove(self._raw_path(day))
+                logger.info(f"Historique local: fichier brut {day} supprimé (rétention)")
+
+    # ==================== ÉCRITURE ====================
+
+    def add(self, measurement, timestamp=None):
+        """Ajoute une mesure (dict de process_trame ou Measurement) ; timestamp en epoch (défaut : maintenant)"""
+        ts = time.time() if timestamp is None else timestamp
+        if ts < self._last_ts:
+            # Horloge revenue en arrière (Pi sans RTC avant synchronisation NTP) : les fichiers doivent rester triés
+            self.out_of_order += 1
+            return False
+
+        get = measurement.get if isinstance(measurement, dict) else measurement._asdict().get
+        values = tuple(float(get(name)) for name in METRICS)
+        state = 0
+        for bit, name in enumerate(STATE_FLAGS):
+            if get(name):
+                state |= 1 << bit
+
+        day = _day_name(ts)
+        if day != self._raw_day:
+            self._open_raw(day)
+        self._raw.append((ts, *values, get('alarm') or 0, get('warning') or 0, get('alarm_redox') or 0, state))
+        self._last_ts = ts
+        self.records += 1
+
+        self._roll(ts, values)
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+        return True
+
+    def _open_raw(self, day):
+        if self._raw is not None:
+            self._raw.close()
+        # ~2 jours de mesures toutes les 5 s par extension
+        self._raw = _RecordFile(self._raw_path(day), RAW_RECORD, grow_records=32768).open()
+        self._raw_day = day
+        last = self._raw.last()
+        if last:
+            self._last_ts = max(self._last_ts, last[0])
+        self._purge_raw()
+
+    def _roll(self, ts, values):
+        """Met à jour la tranche ouverte de chaque niveau, en écrivant celles qui se ferment"""
+        for i, (width, _) in enumerate(ROLLUP_LEVELS):
+            if ts < self._closed_until[i]:
+                continue
+            start = ts - ts % width
+            bucket = self._buckets[i]
+            if bucket is not None and bucket[0] != start:
+                self._levels[i].append(bucket[1].to_record(bucket[0]))
+                self._closed_until[i] = bucket[0] + width
+                bucket = None
+            if bucket is None:
+                bucket = self._buckets[i] = (start, Aggregate())
+            bucket[1].add(values)
+
+    # ==================== LECTURE ====================
+
+    def _raw_range(self, start, end):
+        """Enregistrements bruts dans [start, end), jour par jour"""
+        day_start = start - start % DAY
+        while day_start < end:
+            day = _day_name(day_start)
+            if day == self._raw_day:
+                yield from self._raw.iter_range(start, end)
+            elif os.path.exists(self._raw_path(day)):
+                raw = _RecordFile(self._raw_path(day), RAW_RECORD, readonly=True).open()
+                try:
+                    yield from raw.iter_range(start, end)
+                finally:
+                    raw.close()
+            day_start += DAY
+
+    def measurements(self, start, end):
+        """Mesures brutes dans [start, end) : liste de dicts (timestamp epoch)"""
+        result = []
+        for record in self._raw_range(start, end):
+            item = {'timestamp': record[0]}
+            item.update(zip(METRICS, (round(v, 2) for v in record[1:1 + len(METRICS)])))
+            alarm, warning, alarm_redox, state = record[1 + len(METRICS):]
+            item.update(alarm=alarm, warning=warning, alarm_redox=alarm_redox)
+            for bit, name in enumerate(STATE_FLAGS):
+                item[name] = bool(state & (1 << bit))
+            result.append(item)
+        return result
+
+    def _aggregate(self, start, end, level):
+        """Agrège [start, end) : tranches fermées du niveau donné, niveaux plus fins pour les bords"""
+        result = Aggregate()
+        if start >= end:
+            return result
+        if level < 0:
+            for record in self._raw_range(start, end):
+                result.add(record[1:1 + len(METRICS)])
+            return result
+
+        width = ROLLUP_LEVELS[level][0]
+        first = math.ceil(start / width) * width
+        last = min(end - end % width, self._closed_until[level])
+        if first >= last:
+            return self._aggregate(start, end, level - 1)
+
+        for record in self._levels[level].iter_range(first, last):
+            result.merge_rollup(record)
+        result.merge(self._aggregate(start, first, level - 1))
+        result.merge(self._aggregate(last, end, level - 1))
+        return result
+
+    def stats(self, start, end=None):
+        """min/max/moyenne de chaque mesure sur [start, end) (epoch ; end défaut : maintenant)"""
+        end = time.time() if end is None else end
+        return self._aggregate(start, end, len(ROLLUP_LEVELS) - 1).to_dict()
+
+    def buckets(self, width, start, end=None):
+        """Agrégats par tranche de `width` secondes (60, 900 ou 3600) sur [start, end)
+
+        Les tranches fermées sont lues dans le fichier du niveau, les tranches
+        non encore écrites sont calculées à partir des niveaux plus fins.
+        """
+        end = time.time() if end is None else end
+        levels = [w for w, _ in ROLLUP_LEVELS]
+        if width not in levels:
+            raise ValueError(f"Largeur de tranche non gérée: {width} (attendu: {levels})")
+        level = levels.index(width)
+
+        result = []
+        closed_until = min(end, self._closed_until[level])
+        for record in self._levels[level].iter_range(start - start % width, closed_until):
+            aggregate = Aggregate()
+            aggregate.merge_rollup(record)
+            result.append((record[0], aggregate.to_dict()))
+
+        bucket_start = max(start - start % width, self._closed_until[level])
+        while bucket_start < end:
+            aggregate = self._aggregate(bucket_start, bucket_start + width, level - 1)
+            if aggregate.count:
+                result.append((bucket_start, aggregate.to_dict()))
+            bucket_start += width
+        return result
+
+    def get_stats(self):
+        """Compteurs de l'historique local"""
+        return {
+            'records': self.records,
+            'out_of_order': self.out_of_order,
+            'rollups': {name: level.count for (_, name), level in zip(ROLLUP_LEVELS, self._levels)},
+        }
@@ -0,0 +1,442 @@
+"""
+Pipeline d'envoi asynchrone vers l'API cloud
+
+Les mesures décodées sont d'abord persistées dans l'outbox (voir outbox.py)
+sans jamais attendre le réseau ; une tâche de drain les rejoue dans l'ordre,
+par lots gzip vers /measurements/batch (flush par taille ou par âge), via une
+session HTTP aiohttp partagée (connexions keep-alive réutilisées). Les lots
+sont en JSON, ou au format binaire compact de pool_protocol.wire
+(wire_format='frames'), avec retour au JSON si l'API ne l'accepte pas.
+
+Les alertes, les agrégats horaires et journaliers (voir rollups.py) et les
+logs d'erreur partagent l'outbox et la session HTTP : les alertes partent dès
+que possible, les agrégats par lots vers /daily-averages, les erreurs sont
+agrégées par type sur une fenêtre (voir error_reporting.py) puis envoyées par
+lots vers /error-logs/batch, au plus au rythme du seau à jetons.
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import time
+from datetime import datetime
+
+import aiohttp
+
+from error_reporting import ErrorAggregator, TokenBucket
+from metrics import UPLOAD_BOUNDS, LatencyHistogram
+from outbox import KINDS
+from pool_protocol import encode_measurements
+from pool_protocol.wire import CONTENT_TYPE as FRAMES_CONTENT_TYPE
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'PoolMonitor/1.0'
+# Endpoint absent de l'API déployée (404/405) : nouvel essai après ce délai, les données restent dans l'outbox
+ENDPOINT_RETRY_DELAY = 3600  # secondes
+
+
+def _is_retryable(status):
+    """Erreurs serveur et limitations (408/429) : l'envoi sera retenté"""
+    return status >= 500 or status in (408, 429)
+
+
+class ApiUploader:
+    """Outbox partagée + tâches d'envoi des mesures et des événements (alertes, erreurs) vers l'API cloud"""
+
+    def __init__(self, api_url, error_log_url, outbox, timeout=15, max_retries=3, max_backoff=300,
+                 batch_size=100, batch_max_age=60, wire_format='json', error_window=60, error_rate=0.1,
+                 error_burst=3, error_batch_size=50):
+        self.api_url = api_url
+        self.batch_url = api_url.rstrip('/') + '/batch'
+        self.error_log_url = error_log_url
+        self.error_batch_url = error_log_url.rstrip('/') + '/batch'
+        self.health_url = api_url.replace('/measurements', '/health')
+        self.alert_url = api_url.replace('/measurements', '/alerts')
+        self.rollup_url = api_url.replace('/measurements', '/daily-averages')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.batch_size = batch_size
+        self.batch_max_age = batch_max_age
+        self.batch_supported = batch_size > 1
+        self.wire_format = wire_format
+        self.error_window = error_window
+        self.error_batch_size = error_batch_size
+        self.error_batch_supported = True
+        self._rollups_retry_at = 0.0  # time.monotonic() avant lequel /daily-averages n'est pas retenté
+        self._frames_retry_at = 0.0   # idem pour le format binaire
+
+        self.outbox = outbox
+        self.errors = ErrorAggregator()
+        # error_rate <= 0 : logs d'erreur agrégés puis écartés, rien n'est envoyé à l'API
+        self.error_bucket = TokenBucket(error_rate, error_burst) if error_rate > 0 else None
+        self.session = None
+        self._drain_task = None
+        self._events_task = None
+        self._errors_task = None
+        self._wake = asyncio.Event()
+        self._events_wake = asyncio.Event()
+
+        self.last_successful_send = None
+        self.failed_attempts = 0
+
+        # Compteurs de contre-pression
+        self.stats = {
+            'enqueued': 0,
+            'sent': 0,
+            'failed': 0,
+            'retries': 0,
+            'alerts_sent': 0,
+            'rollups_sent': 0,
+            'error_logs_sent': 0,
+            'max_queue_depth': 0,
+        }
+        # Durée des requêtes HTTP ayant obtenu une réponse
+        self.latency = LatencyHistogram(UPLOAD_BOUNDS)
+
+    async def start(self):
+        """Ouvre la session HTTP et démarre les tâches d'envoi"""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=4, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={'User-Agent': USER_AGENT},
+            )
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.create_task(self._drain_loop())
+        if self._events_task is None or self._events_task.done():
+            self._events_task = asyncio.create_task(self._events_loop())
+        if self._errors_task is None or self._errors_task.done():
+            self._errors_task = asyncio.create_task(self._errors_loop())
+
+    async def stop(self):
+        """Arrête les tâches d'envoi, persiste les erreurs agrégées et ferme la session"""
+        for task in (self._drain_task, self._events_task, self._errors_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._drain_task = None
+        self._events_task = None
+        self._errors_task = None
+        self._flush_errors()
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+    def submit(self, data):
+        """Persiste une mesure dans l'outbox et réveille la tâche de drain"""
+        self.outbox.append(data)
+        self.stats['enqueued'] += 1
+        depth = self.outbox.depth()
+        if depth > self.stats['max_queue_depth']:
+            self.stats['max_queue_depth'] = depth
+        self._wake.set()
+
+    def submit_error(self, error_type, error_message, context=None):
+        """Ajoute une erreur à l'agrégat de la fenêtre en cours (aucune entrée-sortie)"""
+        self.errors.add(error_type, error_message, context)
+
+    def submit_alert(self, alert):
+        """Persiste une alerte évaluée sur le Pi et réveille la tâche des événements"""
+        self.outbox.append(alert, kind='alert')
+        self._events_wake.set()
+
+    def submit_rollup(self, entry):
+        """Persiste un agrégat horaire ou journalier (terminé ou provisoire) et réveille la tâche des événements"""
+        self.outbox.append(entry, kind='rollup')
+        self._events_wake.set()
+
+    def _flush_errors(self):
+        """Agrégats de la fenêtre écoulée -> outbox"""
+        entries = self.errors.drain()
+        if self.error_bucket is None:
+            return
+        for entry in entries:
+            self.outbox.append(entry, kind='error')
+        if entries:
+            self._events_wake.set()
+
+    async def _errors_loop(self):
+        """Clôt la fenêtre d'agrégation des erreurs toutes les `error_window` secondes"""
+        while True:
+            await asyncio.sleep(self.error_window)
+            self._flush_errors()
+
+    async def _events_loop(self):
+        """Tâche d'envoi des alertes puis des logs d'erreur de l'outbox, avec backoff en cas d'échec"""
+        attempt = 0
+        while True:
+            try:
+                sent = await self._send_events(attempt)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erreur inattendue dans la tâche des événements: {e}")
+                sent = False
+
+            if sent is None:
+                attempt = 0
+                self._events_wake.clear()
+                await self._events_wake.wait()
+            elif sent:
+                attempt = 0
+            else:
+                # Pas de log d'erreur sur l'échec d'un log d'erreur (boucle infinie)
+                attempt += 1
+                await asyncio.sleep(min(self.max_backoff, 2 ** (attempt - 1)))
+
+    async def _send_events(self, attempt):
+        """Une alerte, un lot d'agrégats ou un lot d'erreurs : True si transmis (ou rejeté définitivement),
+        False en cas d'échec à retenter, None si rien n'est en attente"""
+        pending = self.outbox.peek(1, kind='alert')
+        if pending:
+            row_id, alert = pending[0]
+            status = await self._post(self.alert_url, attempt, json_body=alert)
+            if status is None or _is_retryable(status):
+                return False
+            self.outbox.ack([row_id], kind='alert')
+            if status in (200, 201):
+                self.stats['alerts_sent'] += 1
+            return True
+
+        pending = None
+        if time.monotonic() >= self._rollups_retry_at:
+            pending = self.outbox.peek(self.error_batch_size, kind='rollup')
+        if pending:
+            payloads = [payload for _, payload in pending]
+            status = await self._post(self.rollup_url, attempt, json_body={'rollups': payloads})
+            if status in (404, 405):
+                # API sans /daily-averages : agrégats conservés, les logs d'erreur passent en attendant
+                logger.warning(f"Endpoint /daily-averages indisponible, agrégats conservés "
+                               f"(nouvel essai dans {ENDPOINT_RETRY_DELAY}s)")
+                self._rollups_retry_at = time.monotonic() + ENDPOINT_RETRY_DELAY
+            elif status is None or _is_retryable(status):
+                return False
+            else:
+                # Succès, ou agrégat refusé par la validation (400) : il quitte l'outbox
+                self.outbox.ack([row_id for row_id, _ in pending], kind='rollup')
+                if status in (200, 201):
+                    self.stats['rollups_sent'] += len(payloads)
+                return True
+
+        if self.error_bucket is None:
+            return None
+        pending = self.outbox.peek(self.error_batch_size, kind='error')
+        if not pending:
+            return None
+        await self.error_bucket.acquire()
+        payloads = [payload for _, payload in pending]
+        status = await self._send_errors(payloads, attempt)
+        if status is None or _is_retryable(status):
+            return False
+        self.outbox.ack([row_id for row_id, _ in pending], kind='error')
+        if status in (200, 201):
+            self.stats['error_logs_sent'] += len(payloads)
+            logger.debug(f"Logs d'erreur transmis: {', '.join(p['error_type'] for p in payloads)}")
+        return True
+
+    async def _send_errors(self, payloads, attempt):
+        """Un POST pour le lot, ou un par agrégat si l'API n'a pas /error-logs/batch
+
+        400 compte comme une absence de /error-logs/batch : une ancienne API
+        peut router l'URL du lot vers /error-logs, qui rejette {"errors": [...]}
+        faute de champs timestamp / error_type / error_message. Le lot est alors
+        renvoyé agrégat par agrégat au lieu d'être acquitté et perdu.
+        """
+        if self.error_batch_supported:
+            status = await self._post(self.error_batch_url, attempt, json_body={'errors': payloads})
+            if status not in (400, 404, 405):
+                return status
+            logger.warning(f"Endpoint /error-logs/batch indisponible (HTTP {status}), retour à l'envoi unitaire")
+            self.error_batch_supported = False
+
+        status = None
+        for i, payload in enumerate(payloads):
+            if i:
+                await self.error_bucket.acquire()
+            status = await self._post(self.error_log_url, attempt, json_body=payload)
+            if status is None or _is_retryable(status):
+                return status
+        return status
+
+    async def _wait_for_data(self, timeout):
+        """Attend une nouvelle mesure (ou l'expiration du délai)"""
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            # Inactivité : on valide les écritures en attente
+            self.outbox.flush()
+
+    async def _drain_loop(self):
+        """Tâche de drain : rejoue l'outbox dans l'ordre, par lots, sans jamais sauter d'entrée"""
+        attempt = 0
+        while True:
+            pending = self.outbox.peek(self.batch_size)
+            if not pending:
+                attempt = 0
+                await self._wait_for_data(self.outbox.commit_interval)
+                continue
+
+            # Lot incomplet : on attend qu'il se remplisse ou que la plus ancienne mesure vieillisse
+            if len(pending) < self.batch_size and attempt == 0:
+                age = time.time() - self.outbox.oldest_created_at()
+                if age < self.batch_max_age:
+                    await self._wait_for_data(self.batch_max_age - age)
+                    continue
+
+            row_ids = [row_id for row_id, _ in pending]
+            payloads = [payload for _, payload in pending]
+            try:
+                status = await self._send_measurements(payloads, attempt)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erreur inattendue dans la tâche de drain: {e}")
+                status = None
+
+            if status is not None and not _is_retryable(status):
+                # Succès, ou rejet définitif (4xx) : les entrées quittent l'outbox
+                self.outbox.ack(row_ids)
+                attempt = 0
+                if status in (200, 201):
+                    self.stats['sent'] += len(payloads)
+                    self.last_successful_send = datetime.now()
+                    self.failed_attempts = 0
+                    # Mesure partielle possible (rejeu de capture, ancienne outbox) : jamais de KeyError ici
+                    last = payloads[-1]
+                    logger.info(f"✓ Données envoyées ({len(payloads)} mesure(s)): pH={last.get('ph')}, "
+                                f"T={last.get('temperature')}°C, Sel={last.get('salt')}g/L, Redox={last.get('redox')}mV")
+                else:
+                    self.stats['failed'] += len(payloads)
+                continue
+
+            attempt += 1
+            if attempt == self.max_retries:
+                self.failed_attempts += 1
+                error_msg = f"✗ Échec envoi API après {self.max_retries} tentatives (échecs consécutifs: {self.failed_attempts}, {self.outbox.depth()} mesures en attente dans l'outbox)"
+                logger.error(error_msg)
+                self.submit_error("api_send_failure", error_msg, {
+                    'failed_attempts': self.failed_attempts,
+                    'max_retries': self.max_retries,
+                    'outbox_depth': self.outbox.depth()
+                })
+            # Backoff exponentiel plafonné : l'outbox conserve les mesures pendant la panne
+            await asyncio.sleep(min(self.max_backoff, 2 ** (attempt - 1)))
+
+    async def _send_measurements(self, payloads, attempt):
+        """Envoie un lot de mesures (un seul POST gzip), ou mesure par mesure"""
+        if self.wire_format == 'frames' and time.monotonic() >= self._frames_retry_at:
+            try:
+                body = encode_measurements(payloads)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Encodage binaire impossible ({e}), lot envoyé en JSON")
+            else:
+                status = await self._post(self.batch_url, attempt, data=gzip.compress(body, compresslevel=6), headers={
+                    'Content-Type': FRAMES_CONTENT_TYPE,
+                    'Content-Encoding': 'gzip',
+                })
+                if status in (404, 405, 415):
+                    # API sans décodeur binaire : JSON en attendant un nouvel essai
+                    logger.warning(f"Format binaire non pris en charge par l'API, envoi en JSON "
+                                   f"(nouvel essai dans {ENDPOINT_RETRY_DELAY}s)")
+                    self._frames_retry_at = time.monotonic() + ENDPOINT_RETRY_DELAY
+                elif status == 400:
+                    # Lot refusé (trames invalides) : renvoyé en JSON, le format reste binaire
+                    logger.warning("Lot binaire refusé par l'API, renvoi en JSON")
+                else:
+                    return status
+
+        if len(payloads) > 1 and self.batch_supported:
+            body = gzip.compress(json.dumps({'measurements': payloads}).encode('utf-8'), compresslevel=6)
+            status = await self._post(self.batch_url, attempt, data=body, headers={
+                'Content-Type': 'application/json',
+                'Content-Encoding': 'gzip',
+            })
+            if status not in (404, 405):
+                return status
+            logger.warning("Endpoint batch indisponible, retour à l'envoi unitaire")
+            self.batch_supported = False
+
+        # Envoi unitaire : le lot n'est acquitté que si toutes les mesures passent
+        # (les mesures déjà reçues sont dédoublonnées par idempotency_key au rejeu)
+        status = None
+        for payload in payloads:
+            status = await self._post(self.api_url, attempt, json_body=payload,
+                                      headers={'Idempotency-Key': payload['idempotency_key']})
+            if status is None or _is_retryable(status):
+                return status
+        return status
+
+    async def _post(self, url, attempt, json_body=None, data=None, headers=None):
+        """Un envoi HTTP : retourne le code de statut, ou None en cas d'erreur réseau"""
+        if attempt > 0:
+            self.stats['retries'] += 1
+        started = time.monotonic()
+        try:
+            async with self.session.post(url, json=json_body, data=data, headers=headers) as response:
+                self.latency.observe(time.monotonic() - started)
+                if response.status not in (200, 201):
+                    body = await response.text()
+                    logger.warning(f"Réponse API non-OK: {response.status} - {body[:200]}")
+                return response.status
+
+        except asyncio.TimeoutError:
+            logger.error(f"Timeout API (tentative {attempt + 1})")
+        except aiohttp.ClientConnectionError:
+            logger.error(f"Erreur de connexion API (tentative {attempt + 1})")
+        except aiohttp.ClientError as e:
+            logger.error(f"Erreur requête API (tentative {attempt + 1}): {e}")
+        return None
+
+    async def check_health(self):
+        """Vérifie l'accessibilité de l'API cloud (réutilise la session)"""
+        try:
+            async with self.session.get(self.health_url, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                if response.status == 200:
+                    logger.debug("API cloud accessible")
+                else:
+                    logger.warning(f"API cloud répond avec le code: {response.status}")
+        except Exception as e:
+            logger.warning(f"Health check API échoué: {e}")
+
+    def get_stats(self):
+        """Instantané des compteurs de la file d'envoi"""
+        return {
+            **self.stats,
+            'outbox_depth': self.outbox.depth(),
+            'outbox_evicted': self.outbox.evicted,
+            'alerts_pending': self.outbox.depth('alert'),
+            'rollups_pending': self.outbox.depth('rollup'),
+            'error_logs_pending': self.outbox.depth('error'),
+            'errors_received': self.errors.received,
+            'errors_dropped': self.errors.dropped,
+            'error_rate_limited': self.error_bucket.waits if self.error_bucket else 0,
+            'latency': self.latency.to_dict(),
+        }
+
+    def collect(self, exposition):
+        """Métriques de la file d'envoi et de l'outbox (voir metrics.py)"""
+        stats = self.stats
+        exposition.counter('pool_upload_measurements_total', "Mesures envoyées à l'API", stats['sent'], {'result': 'sent'})
+        exposition.counter('pool_upload_measurements_total', "Mesures envoyées à l'API", stats['failed'], {'result': 'rejected'})
+        exposition.counter('pool_upload_retries_total', "Requêtes HTTP renvoyées", stats['retries'])
+        exposition.counter('pool_alerts_sent_total', "Alertes transmises à l'API", stats['alerts_sent'])
+        exposition.counter('pool_rollups_sent_total', "Agrégats horaires et journaliers transmis à l'API", stats['rollups_sent'])
+        exposition.counter('pool_error_events_total', "Erreurs signalées (avant agrégation)", self.errors.received)
+        exposition.counter('pool_error_logs_sent_total', "Agrégats d'erreurs transmis à l'API", stats['error_logs_sent'])
+        if self.error_bucket:
+            exposition.counter('pool_error_rate_limited_total', "Attentes du limiteur d'envoi des erreurs",
+                               self.error_bucket.waits)
+        exposition.histogram('pool_upload_seconds', "Durée des requêtes vers l'API", self.latency)
+        for kind in KINDS:
+            exposition.gauge('pool_outbox_depth', "Entrées en attente dans l'outbox", self.outbox.depth(kind), {'kind': kind})
+        exposition.counter('pool_outbox_evicted_total', "Entrées évincées de l'outbox (plafond atteint)", self.outbox.evicted)
+        if self.last_successful_send:
+            exposition.gauge('pool_last_successful_send_timestamp_seconds', "Dernier envoi réussi (epoch)",
+                             self.last_successful_send.timestamp())